@@ -1,15 +1,17 @@
 import pandas as pd  
-import matplotlib.pyplot as plt
-import seaborn as sns
 import os
 import datetime
 from openpyxl import load_workbook
 from openpyxl.drawing.image import Image as ExcelImage
 from openpyxl.utils.dataframe import dataframe_to_rows
 from openpyxl.chart import BarChart, Reference
-from matplotlib.backends.backend_pdf import PdfPages
 
-sns.set(style="whitegrid")
+import tracing
+from memory_profile import profiling
+
+# matplotlib được import khi vẽ/xuất lần đầu để CLI khởi động nhanh.
+# Style "whitegrid" của seaborn được áp dụng qua style tương đương của matplotlib.
+CHART_STYLE = "seaborn-v0_8-whitegrid"
 
 def setup_paths():
     base_dir = "Time_report.xlsm"
@@ -23,6 +25,7 @@ def setup_paths():
         'pdf_report': os.path.join(base_dir, "charts_report.pdf")
     }
 
+@tracing.traced('config')
 def read_configs(path_dict):
     year_mode_df = pd.read_excel(path_dict['template_file'], sheet_name='Config_Year_Mode', engine='openpyxl')
     project_filter_df = pd.read_excel(path_dict['template_file'], sheet_name='Config_Project_Filter', engine='openpyxl')
@@ -63,6 +66,7 @@ def read_configs(path_dict):
         'project_filter_df': project_filter_df
     }
 
+@tracing.traced('load')
 def load_raw_data(path_dict):
     df = pd.read_excel(path_dict['template_file'], sheet_name='Raw Data', engine='openpyxl')
     df.rename(columns={'Team member': 'Employee', 'Hou': 'Hours'}, inplace=True)
@@ -73,38 +77,39 @@ def load_raw_data(path_dict):
     print(f"📥 Loaded raw data: {len(df)} rows")
     return df
 
-def save_chart(fig, path):
-    fig.tight_layout()
-    fig.savefig(path)
-    plt.close(fig)
+# Renderer dùng chung: style được thiết lập một lần, Figure được tái sử dụng giữa các biểu đồ
+_chart_renderer = None
 
-def generate_general_charts(df, chart_dir):
-    os.makedirs(chart_dir, exist_ok=True)
+def get_chart_renderer():
+    global _chart_renderer
+    if _chart_renderer is None:
+        from chart_renderer import ChartRenderer
+        _chart_renderer = ChartRenderer(dpi=100, style=CHART_STYLE)
+    return _chart_renderer
 
-    fig, ax = plt.subplots(figsize=(10, 6))
-    df.groupby('Project name')['Hours'].sum().sort_values().plot(kind='barh', ax=ax, color='skyblue')
-    ax.set_title('Total Hours by Project')
-    save_chart(fig, os.path.join(chart_dir, '1_project_hours.png'))
+def save_chart(series, path, title, kind='barh', color='skyblue'):
+    chart_renderer = get_chart_renderer()
+    if kind == 'line':
+        return chart_renderer.line(series, path, title=title, color=color, figsize=(10, 6), title_size=12)
+    return chart_renderer.barh(series, path, title=title, color=color, figsize=(10, 6), title_size=12, label_fmt=None)
 
-    fig, ax = plt.subplots(figsize=(10, 6))
-    df.groupby('Workcentre')['Hours'].sum().sort_values().plot(kind='barh', ax=ax, color='orange')
-    ax.set_title('Total Hours by Workcentre')
-    save_chart(fig, os.path.join(chart_dir, '2_workcentre_hours.png'))
+def generate_general_charts(df, chart_dir):
+    os.makedirs(chart_dir, exist_ok=True)
 
-    fig, ax = plt.subplots(figsize=(10, 6))
-    df.groupby(df['Date'].dt.to_period('M'))['Hours'].sum().plot(marker='o', ax=ax, color='green')
-    ax.set_title('Monthly Trend')
-    save_chart(fig, os.path.join(chart_dir, '3_monthly_trend.png'))
+    save_chart(df.groupby('Project name')['Hours'].sum().sort_values(),
+               os.path.join(chart_dir, '1_project_hours.png'), 'Total Hours by Project', color='skyblue')
+    save_chart(df.groupby('Workcentre')['Hours'].sum().sort_values(),
+               os.path.join(chart_dir, '2_workcentre_hours.png'), 'Total Hours by Workcentre', color='orange')
+    save_chart(df.groupby(df['Date'].dt.to_period('M'))['Hours'].sum(),
+               os.path.join(chart_dir, '3_monthly_trend.png'), 'Monthly Trend', kind='line', color='green')
 
 def generate_project_chart(df_proj, project_name, chart_project_dir):
     os.makedirs(chart_project_dir, exist_ok=True)
-    fig, ax = plt.subplots(figsize=(10, 6))
-    df_proj.groupby('Workcentre')['Hours'].sum().sort_values().plot(kind='barh', ax=ax, color='teal')
-    ax.set_title(f'{project_name} - Hours by Workcentre')
     path = os.path.join(chart_project_dir, f"{project_name[:31]}.png")
-    save_chart(fig, path)
-    return path
+    return save_chart(df_proj.groupby('Workcentre')['Hours'].sum().sort_values(),
+                      path, f'{project_name} - Hours by Workcentre', color='teal')
 
+@tracing.traced('filter')
 def apply_filters(df, config):
     if config['year'] is not None:
         df_filtered = df[df['Year'] == config['year']]
@@ -153,7 +158,11 @@ def add_project_analysis_sheet(wb, df_project, project_name):
 
     ws.add_chart(chart, f"E{start_row}")
 
+@tracing.traced('pdf')
 def export_all_charts_to_pdf(path_dict):
+    import matplotlib.pyplot as plt
+    from matplotlib.backends.backend_pdf import PdfPages
+
     chart_paths = []
 
     for chart_file in sorted(os.listdir(path_dict['chart_dir'])):
@@ -177,6 +186,7 @@ def export_all_charts_to_pdf(path_dict):
 
     print(f"🧾 PDF charts report saved: {path_dict['pdf_report']}")
 
+@tracing.traced('excel')
 def export_report(df, config, path_dict):
     mode = config['mode']
     if mode == 'year':
@@ -245,6 +255,7 @@ def export_report(df, config, path_dict):
     wb.save(path_dict['output_file'])
     print(f"✅ Excel report saved: {path_dict['output_file']}")
 
+    print(get_chart_renderer().timing_summary())
     export_all_charts_to_pdf(path_dict)
 
 def main():
@@ -252,13 +263,15 @@ def main():
     if not os.path.exists(path_dict['template_file']):
         print(f"❌ Template file not found: {path_dict['template_file']}")
         return
-    df_raw = load_raw_data(path_dict)
-    config = read_configs(path_dict)
-    df_filtered = apply_filters(df_raw, config)
-    if df_filtered.empty:
-        print("⚠️ No data after filtering. Please check your config.")
-        return
-    export_report(df_filtered, config, path_dict)
+    # Đo bộ nhớ theo từng bước khi đặt TIME_REPORT_MEMORY_PROFILE=<file JSON>
+    with profiling(label='Time_report'), tracing.span('report', 'time_report'):
+        df_raw = load_raw_data(path_dict)
+        config = read_configs(path_dict)
+        df_filtered = apply_filters(df_raw, config)
+        if df_filtered.empty:
+            print("⚠️ No data after filtering. Please check your config.")
+            return
+        export_report(df_filtered, config, path_dict)
 
 if __name__ == "__main__":
     main()
@@ -2,13 +2,23 @@ import pandas as pd
 import datetime
 import os
 from openpyxl import load_workbook
-from openpyxl.chart import BarChart, Reference, LineChart
+from openpyxl.chart import BarChart, Reference, LineChart, Series
 from openpyxl.utils.dataframe import dataframe_to_rows
-from fpdf import FPDF
-from matplotlib import pyplot as plt
 import tempfile
 import re
 import shutil
+import threading
+from collections import OrderedDict
+
+import tracing
+
+# Copy-on-Write (luôn bật từ pandas 3.0): khung nhìn/kết quả lọc không bao giờ sửa được DataFrame gốc,
+# nhờ đó một bộ dữ liệu có thể được dùng chung giữa nhiều phiên (xem read_only_view)
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
+# fpdf và matplotlib (qua chart_renderer) chỉ được import bên trong các hàm xuất PDF,
+# để việc import module này (app/CLI, xem trước dữ liệu) không phải tải chúng.
 
 # Hàm hỗ trợ làm sạch tên file/sheet
 def sanitize_filename(name):
@@ -28,9 +38,15 @@ def setup_paths():
         'pdf_report': f"Time_report_Standard_{today}.pdf",
         'comparison_output_file': f"Time_report_Comparison_{today}.xlsx",
         'comparison_pdf_report': f"Time_report_Comparison_{today}.pdf",
+        'utilisation_report': f"Time_report_Utilisation_{today}.xlsx",
+        'heatmap_report': f"Time_report_Heatmap_{today}.xlsx",
+        'heatmap_pdf_report': f"Time_report_Heatmap_{today}.pdf",
+        'timeline_report': f"Time_report_Timeline_{today}.xlsx",
+        'timeline_pdf_report': f"Time_report_Timeline_{today}.pdf",
         'logo_path': "triac_logo.png" # Thêm đường dẫn logo
     }
 
+@tracing.traced('config')
 def read_configs(template_file):
     """Đọc cấu hình từ file template Excel."""
     try:
@@ -54,59 +70,648 @@ def read_configs(template_file):
             'mode': mode,
             'year': year,
             'months': months,
-            'project_filter_df': project_filter_df
+            'project_filter_df': project_filter_df,
+            'capacity_df': read_capacity_config(template_file),
+            'budget_df': read_budget_config(template_file),
+            'rates_df': read_rate_config(template_file)
         }
     except FileNotFoundError:
         print(f"Lỗi: Không tìm thấy file template tại {template_file}")
-        return {'mode': 'year', 'year': datetime.datetime.now().year, 'months': [], 'project_filter_df': pd.DataFrame(columns=['Project Name', 'Include'])}
+        return {'mode': 'year', 'year': datetime.datetime.now().year, 'months': [], 'project_filter_df': pd.DataFrame(columns=['Project Name', 'Include']), 'capacity_df': pd.DataFrame(columns=CAPACITY_COLUMNS), 'budget_df': pd.DataFrame(columns=BUDGET_COLUMNS), 'rates_df': pd.DataFrame(columns=RATE_COLUMNS)}
     except Exception as e:
         print(f"Lỗi khi đọc cấu hình: {e}")
-        return {'mode': 'year', 'year': datetime.datetime.now().year, 'months': [], 'project_filter_df': pd.DataFrame(columns=['Project Name', 'Include'])}
+        return {'mode': 'year', 'year': datetime.datetime.now().year, 'months': [], 'project_filter_df': pd.DataFrame(columns=['Project Name', 'Include']), 'capacity_df': pd.DataFrame(columns=CAPACITY_COLUMNS), 'budget_df': pd.DataFrame(columns=BUDGET_COLUMNS), 'rates_df': pd.DataFrame(columns=RATE_COLUMNS)}
 
+# Sheet Config_Capacity: mỗi hàng là (Employee, Weekly Capacity); hàng Employee = 'Default' đặt công suất mặc định
+CAPACITY_COLUMNS = ['Employee', 'Weekly Capacity']
+DEFAULT_WEEKLY_CAPACITY = 40.0
+# Ngưỡng tỉ lệ sử dụng (%): dưới 'under' là thiếu việc, trên 'over' là quá tải
+UTILISATION_THRESHOLDS = {'under': 80.0, 'over': 100.0}
+
+@tracing.traced('config')
+def read_capacity_config(template_file):
+    """Đọc sheet Config_Capacity (không bắt buộc); trả về DataFrame trống nếu template không có sheet này."""
+    try:
+        capacity_df = pd.read_excel(template_file, sheet_name='Config_Capacity', engine='openpyxl')
+    except ValueError:
+        return pd.DataFrame(columns=CAPACITY_COLUMNS)
+    except Exception as e:
+        print(f"Lỗi khi đọc cấu hình công suất: {e}")
+        return pd.DataFrame(columns=CAPACITY_COLUMNS)
+
+    capacity_df.columns = capacity_df.columns.str.strip()
+    missing = [c for c in CAPACITY_COLUMNS if c not in capacity_df.columns]
+    if missing:
+        print(f"Cảnh báo: Sheet Config_Capacity thiếu cột {', '.join(missing)}; dùng công suất mặc định {DEFAULT_WEEKLY_CAPACITY}h/tuần.")
+        return pd.DataFrame(columns=CAPACITY_COLUMNS)
+    capacity_df = capacity_df[CAPACITY_COLUMNS].dropna(subset=['Employee'])
+    capacity_df['Employee'] = capacity_df['Employee'].astype(str).str.strip()
+    capacity_df['Weekly Capacity'] = pd.to_numeric(capacity_df['Weekly Capacity'], errors='coerce')
+    return capacity_df.dropna(subset=['Weekly Capacity']).reset_index(drop=True)
+
+# Sheet Config_Project_Budget: mỗi hàng là (Project Name, Budget Hours), cột 'Deadline' không bắt buộc
+BUDGET_COLUMNS = ['Project Name', 'Budget Hours']
+# Dự báo: hệ số làm trơn hàm mũ cho tốc độ đốt giờ theo tuần
+BURN_FORECAST = {'alpha': 0.3}
+
+@tracing.traced('config')
+def read_budget_config(template_file):
+    """Đọc sheet Config_Project_Budget (không bắt buộc); trả về DataFrame trống nếu template không có sheet này."""
+    try:
+        budget_df = pd.read_excel(template_file, sheet_name='Config_Project_Budget', engine='openpyxl')
+    except ValueError:
+        return pd.DataFrame(columns=BUDGET_COLUMNS)
+    except Exception as e:
+        print(f"Lỗi khi đọc cấu hình ngân sách dự án: {e}")
+        return pd.DataFrame(columns=BUDGET_COLUMNS)
+
+    budget_df.columns = budget_df.columns.str.strip()
+    missing = [c for c in BUDGET_COLUMNS if c not in budget_df.columns]
+    if missing:
+        print(f"Cảnh báo: Sheet Config_Project_Budget thiếu cột {', '.join(missing)}; bỏ qua theo dõi ngân sách.")
+        return pd.DataFrame(columns=BUDGET_COLUMNS)
+    columns = BUDGET_COLUMNS + (['Deadline'] if 'Deadline' in budget_df.columns else [])
+    budget_df = budget_df[columns].dropna(subset=['Project Name'])
+    budget_df['Project Name'] = budget_df['Project Name'].astype(str).str.strip()
+    budget_df['Budget Hours'] = pd.to_numeric(budget_df['Budget Hours'], errors='coerce')
+    if 'Deadline' in budget_df.columns:
+        budget_df['Deadline'] = pd.to_datetime(budget_df['Deadline'], errors='coerce')
+    budget_df = budget_df[budget_df['Budget Hours'] > 0]
+    return budget_df.drop_duplicates('Project Name', keep='last').reset_index(drop=True)
+
+# Sheet Config_Rates: đơn giá theo giờ có hiệu lực từ 'Effective From'. Hàng có Employee là giá của nhân viên,
+# hàng chỉ có Workcentre là giá của workcentre, để trống cả hai là giá mặc định (ưu tiên theo thứ tự đó).
+RATE_COLUMNS = ['Employee', 'Workcentre', 'Effective From', 'Hourly Rate']
+
+@tracing.traced('config')
+def read_rate_config(template_file):
+    """Đọc sheet Config_Rates (không bắt buộc); trả về DataFrame trống nếu template không có sheet này."""
+    try:
+        rates_df = pd.read_excel(template_file, sheet_name='Config_Rates', engine='openpyxl')
+    except ValueError:
+        return pd.DataFrame(columns=RATE_COLUMNS)
+    except Exception as e:
+        print(f"Lỗi khi đọc bảng đơn giá: {e}")
+        return pd.DataFrame(columns=RATE_COLUMNS)
+
+    rates_df.columns = rates_df.columns.str.strip()
+    missing = [c for c in ('Effective From', 'Hourly Rate') if c not in rates_df.columns]
+    if missing:
+        print(f"Cảnh báo: Sheet Config_Rates thiếu cột {', '.join(missing)}; bỏ qua quy đổi chi phí.")
+        return pd.DataFrame(columns=RATE_COLUMNS)
+    for col in ('Employee', 'Workcentre'):
+        if col not in rates_df.columns:
+            rates_df[col] = None
+        rates_df[col] = rates_df[col].where(rates_df[col].isna(), rates_df[col].astype(str).str.strip())
+    rates_df = rates_df[RATE_COLUMNS].copy()
+    rates_df['Effective From'] = pd.to_datetime(rates_df['Effective From'], errors='coerce')
+    rates_df['Hourly Rate'] = pd.to_numeric(rates_df['Hourly Rate'], errors='coerce')
+    rates_df = rates_df.dropna(subset=['Effective From', 'Hourly Rate'])
+    return rates_df.sort_values('Effective From', kind='stable').reset_index(drop=True)
+
+@tracing.traced('load')
+def apply_rates(df, rates_df):
+    """Thêm cột 'Rate' và 'Cost' (= Hours x Rate) theo bảng đơn giá có ngày hiệu lực.
+
+    Ghép as-of theo ngày cho từng phạm vi (nhân viên, workcentre, mặc định): bảng đơn giá được sắp theo
+    khóa gộp (mã đối tượng, ngày hiệu lực) và mỗi dòng giờ tìm đơn giá gần nhất không sau ngày của nó bằng
+    np.searchsorted, nên không cần sắp xếp dữ liệu giờ và đơn giá đổi giữa tháng được áp dụng đúng từ ngày
+    hiệu lực. Dòng không có đơn giá có Cost trống. Trả về `df` nguyên vẹn nếu không có bảng đơn giá.
+    """
+    import numpy as np
+
+    if df.empty or rates_df is None or rates_df.empty:
+        return df
+    day = df['Date'].to_numpy().astype('datetime64[D]').astype(np.int64)
+    effective = rates_df['Effective From'].to_numpy().astype('datetime64[D]').astype(np.int64)
+    # Khóa gộp = mã đối tượng * span + ngày; span đủ lớn để các đối tượng không chồng lên nhau
+    offset = min(day.min(), effective.min())
+    span = int(max(day.max(), effective.max()) - offset) + 1
+    scopes = {
+        'Employee': rates_df['Employee'].notna().to_numpy(),
+        'Workcentre': (rates_df['Employee'].isna() & rates_df['Workcentre'].notna()).to_numpy(),
+        None: (rates_df['Employee'].isna() & rates_df['Workcentre'].isna()).to_numpy(),
+    }
+    rate = np.full(len(df), np.nan)
+    for scope, in_scope in scopes.items():
+        if not in_scope.any() or (scope and scope not in df.columns):
+            continue
+        if scope:
+            codes, uniques = pd.factorize(df[scope].astype(str))
+            table_codes = pd.Index(uniques).get_indexer(rates_df.loc[in_scope, scope])
+        else:
+            codes, table_codes = np.zeros(len(df), dtype=np.int64), np.zeros(in_scope.sum(), dtype=np.int64)
+        known = table_codes >= 0  # Bỏ đơn giá của nhân viên/workcentre không có trong dữ liệu
+        table_codes = table_codes[known].astype(np.int64)
+        table_keys = table_codes * span + (effective[in_scope][known] - offset)
+        table_rates = rates_df['Hourly Rate'].to_numpy(dtype=float)[in_scope][known]
+        sort = np.argsort(table_keys, kind='stable')
+        table_keys, table_codes, table_rates = table_keys[sort], table_codes[sort], table_rates[sort]
+
+        pos = np.searchsorted(table_keys, codes.astype(np.int64) * span + (day - offset), side='right') - 1
+        found = (pos >= 0) & (codes >= 0)
+        found[found] = table_codes[pos[found]] == codes[found]
+        fill = found & np.isnan(rate)
+        rate[fill] = table_rates[pos[fill]]
+
+    df_rated = df.copy()
+    df_rated['Rate'] = rate
+    df_rated['Cost'] = df_rated['Hours'] * rate
+    unrated = np.isnan(rate) & (df_rated['Hours'].to_numpy() != 0)
+    if unrated.any():
+        print(f"Cảnh báo: {unrated.sum()} dòng ({df_rated.loc[unrated, 'Hours'].sum():.1f}h) không có đơn giá; chi phí để trống.")
+    return df_rated
+
+# Tên cột thay thế trong file nguồn -> tên cột chuẩn
+RAW_COLUMN_ALIASES = {'Hou': 'Hours', 'Team member': 'Employee', 'Project Name': 'Project name'}
+RAW_REQUIRED_COLUMNS = ['Date', 'Employee', 'Project name', 'Workcentre', 'Task', 'Hours']
+
+def normalize_raw_data(df):
+    """Chuẩn hóa dữ liệu thô vừa đọc (tên cột, ngày, năm/tháng/tuần, giờ) như load_raw_data."""
+    df.columns = df.columns.astype(str).str.strip()
+    df.rename(columns=RAW_COLUMN_ALIASES, inplace=True)
+
+    df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
+    df = df.dropna(subset=['Date']) # Loại bỏ hàng không có ngày hợp lệ
+
+    df['Year'] = df['Date'].dt.year
+    df['MonthName'] = df['Date'].dt.month_name()
+    df['Week'] = df['Date'].dt.isocalendar().week.astype(int)
+
+    # Đảm bảo cột 'Hours' là số
+    df['Hours'] = pd.to_numeric(df['Hours'], errors='coerce').fillna(0)
+
+    return df
+
+@tracing.traced('load')
 def load_raw_data(template_file):
     """Tải dữ liệu thô từ file template Excel."""
     try:
         df = pd.read_excel(template_file, sheet_name='Raw Data', engine='openpyxl')
-        df.columns = df.columns.str.strip()
-        df.rename(columns={'Hou': 'Hours', 'Team member': 'Employee', 'Project Name': 'Project name'}, inplace=True)
-        
-        df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-        df = df.dropna(subset=['Date']) # Loại bỏ hàng không có ngày hợp lệ
-        
-        df['Year'] = df['Date'].dt.year
-        df['MonthName'] = df['Date'].dt.month_name()
-        df['Week'] = df['Date'].dt.isocalendar().week.astype(int)
-        
-        # Đảm bảo cột 'Hours' là số
-        df['Hours'] = pd.to_numeric(df['Hours'], errors='coerce').fillna(0)
-        
-        return df
+        return normalize_raw_data(df)
     except Exception as e:
         print(f"Lỗi khi tải dữ liệu thô: {e}")
         return pd.DataFrame()
 
-def apply_filters(df, config):
-    """Áp dụng các bộ lọc dữ liệu dựa trên cấu hình."""
-    df_filtered = df.copy()
+# Giới hạn cho file người dùng tải lên (kích thước, số dòng, thời gian xử lý tính bằng giây)
+UPLOAD_LIMITS = {
+    'max_bytes': 50 * 1024 * 1024,
+    'max_rows': 1_000_000,
+    'timeout': 120,
+}
+
+def read_uploaded_data(data, filename, max_rows=None, progress_callback=None):
+    """Đọc và chuẩn hóa file chấm công người dùng tải lên (CSV, hoặc Excel: sheet 'Raw Data' hay sheet đầu tiên).
+
+    Khác load_raw_data, lỗi được báo bằng ValueError (để hiển thị cho người tải lên) thay vì trả DataFrame rỗng.
+    `progress_callback(stage)` được gọi khi bắt đầu mỗi bước: 'reading', 'checking', 'normalising'.
+    """
+    import io
+
+    report = progress_callback or (lambda stage: None)
+    report('reading')
+    extension = os.path.splitext(filename)[1].lower()
+    nrows = max_rows + 1 if max_rows else None  # Đọc dư một dòng để biết file có vượt giới hạn không
+    try:
+        if extension == '.csv':
+            df = pd.read_csv(io.BytesIO(data), nrows=nrows)
+        elif extension in ('.xlsx', '.xlsm'):
+            with pd.ExcelFile(io.BytesIO(data), engine='openpyxl') as workbook:
+                sheet = 'Raw Data' if 'Raw Data' in workbook.sheet_names else workbook.sheet_names[0]
+                df = workbook.parse(sheet, nrows=nrows)
+        else:
+            raise ValueError(f"Định dạng file không được hỗ trợ: {extension or filename}")
+    except ValueError:
+        raise
+    except Exception as e:
+        raise ValueError(f"Không đọc được file {filename}: {e}") from e
+
+    report('checking')
+    if max_rows and len(df) > max_rows:
+        raise ValueError(f"File có hơn {max_rows:,} dòng (giới hạn tải lên).")
+    columns = {RAW_COLUMN_ALIASES.get(c, c) for c in df.columns.astype(str).str.strip()}
+    missing = [c for c in RAW_REQUIRED_COLUMNS if c not in columns]
+    if missing:
+        raise ValueError(f"File thiếu cột: {', '.join(missing)}")
+    report('normalising')
+    df = normalize_raw_data(df)
+    if df.empty:
+        raise ValueError("File không có dòng nào với ngày hợp lệ.")
+    return df
 
-    if 'years' in config and config['years']: # Dành cho so sánh nhiều năm
-        df_filtered = df_filtered[df_filtered['Year'].isin(config['years'])]
-    elif 'year' in config and config['year']: # Dành cho báo cáo tiêu chuẩn một năm
-        df_filtered = df_filtered[df_filtered['Year'] == config['year']]
+@tracing.traced('filter')
+def apply_filters(df, config):
+    """Áp dụng các bộ lọc dữ liệu dựa trên cấu hình (một mặt nạ boolean, không sao chép toàn bộ dữ liệu trước khi lọc)."""
+    if config['project_filter_df'].empty:
+        return pd.DataFrame(columns=df.columns)
+    if config.get('years'):  # Dành cho so sánh nhiều năm
+        years = config['years']
+    else:  # Dành cho báo cáo tiêu chuẩn một năm
+        years = [config['year']] if config.get('year') else None
+    return filter_time_entries(df, years, config['months'], config['project_filter_df']['Project Name'].tolist())
+
+def read_only_view(df):
+    """Khung nhìn của DataFrame dùng chung: chia sẻ bộ nhớ với bản gốc (không sao chép dữ liệu).
+
+    Với Copy-on-Write, gán cột hay sửa ô trên khung nhìn chỉ tạo bản sao riêng cho khung nhìn đó và mảng numpy
+    lấy ra qua to_numpy()/values là chỉ đọc, nên bản gốc không thể bị sửa từ phía người dùng khung nhìn.
+    """
+    return df.copy(deep=False)
+
+@tracing.traced('aggregate')
+def build_chart_aggregates(df, top_n=30, filters=None, period=None):
+    """Tổng hợp các chuỗi nhỏ (dự án, workcentre, task, tháng) để vẽ biểu đồ tương tác phía trình duyệt.
+
+    Các tổng được lấy qua query() nên lần vẽ lại với cùng lựa chọn trên cùng `df` không phải tính lại;
+    truyền `filters`/`period` (thay vì lọc trước) để tận dụng bộ nhớ đệm đó.
+    """
+    if df.empty:
+        return {}
+
+    def top_with_other(series):
+        # Giữ top_n mục lớn nhất, gộp phần còn lại vào 'Other' để dữ liệu gửi đi luôn nhỏ
+        series = series.sort_values(ascending=False)
+        if len(series) > top_n:
+            series = pd.concat([series.iloc[:top_n], pd.Series({'Other': series.iloc[top_n:].sum()})])
+        return series
+
+    aggregates = {}
+    for key, col in [('project', 'Project name'), ('workcentre', 'Workcentre'), ('task', 'Task')]:
+        if col in df.columns:
+            totals = query(df, [key], filters=filters, period=period).set_index(col)['Hours']
+            aggregates[key] = top_with_other(totals).rename_axis(col).reset_index(name='Hours')
+
+    aggregates['month'] = query(df, ['year_month'], filters=filters, period=period).rename(columns={'Year-Month': 'Month'})
+    aggregates['project_month'] = query(df, ['year_month', 'project'], filters=filters, period=period).rename(columns={'Year-Month': 'Month'})
+    if aggregates['month'].empty:
+        return {}
+    return aggregates
+
+@tracing.traced('aggregate')
+def build_utilisation_report(df, capacity_df=None, default_capacity=None, thresholds=None):
+    """Tỉ lệ sử dụng của từng nhân viên theo tuần ISO so với công suất, kèm tóm tắt và phân bổ theo dự án.
+
+    Giờ được đưa về ma trận (nhân viên x tuần liên tục); tuần không có giờ nằm giữa tuần đầu và tuần cuối
+    nhân viên có dữ liệu được tính là 0h (thiếu việc). Mọi phép tính là phép toán mảng, không lặp theo nhân viên.
+    Trả về dict gồm 'weekly', 'summary' và 'project_split'.
+    """
+    import numpy as np
+
+    thresholds = {**UTILISATION_THRESHOLDS, **(thresholds or {})}
+    if df.empty or 'Employee' not in df.columns:
+        return {}
+
+    capacities = {}
+    if capacity_df is not None and not capacity_df.empty:
+        capacities = dict(zip(capacity_df['Employee'], capacity_df['Weekly Capacity']))
+    if default_capacity is None:
+        default_capacity = capacities.pop('Default', DEFAULT_WEEKLY_CAPACITY)
+
+    week_start = (df['Date'] - pd.to_timedelta(df['Date'].dt.weekday, unit='D')).dt.normalize().rename('Week Start')
+    wide = df.groupby([df['Employee'].astype(str), week_start])['Hours'].sum().unstack('Week Start', fill_value=0)
+    weeks = pd.date_range(wide.columns.min(), wide.columns.max(), freq='W-MON')
+    wide = wide.reindex(columns=weeks, fill_value=0)
+
+    hours = wide.to_numpy(dtype=float)
+    worked = hours != 0
+    # Chỉ tính các tuần trong khoảng hoạt động của từng nhân viên (từ tuần đầu đến tuần cuối có giờ)
+    active = (np.cumsum(worked, axis=1) > 0) & (np.cumsum(worked[:, ::-1], axis=1)[:, ::-1] > 0)
+    capacity = wide.index.map(lambda e: capacities.get(e, default_capacity)).to_numpy(dtype=float)
+    capacity_matrix = np.broadcast_to(capacity[:, None], hours.shape)
+    utilisation = np.divide(hours * 100, capacity_matrix, out=np.full_like(hours, np.nan), where=capacity_matrix > 0)
+
+    rows, cols = np.nonzero(active)
+    iso = weeks[cols].isocalendar()
+    weekly = pd.DataFrame({
+        'Employee': wide.index.to_numpy()[rows],
+        'ISO Week': (iso['year'].astype(str) + '-W' + iso['week'].astype(str).str.zfill(2)).to_numpy(),
+        'Week Start': weeks[cols],
+        'Hours': hours[rows, cols],
+        'Capacity': capacity[rows],
+        'Utilisation %': utilisation[rows, cols],
+    })
+    weekly['Status'] = np.select(
+        [weekly['Utilisation %'] > thresholds['over'], weekly['Utilisation %'] < thresholds['under']],
+        ['Over', 'Under'], default='OK'
+    )
+
+    summary = weekly.assign(over=weekly['Status'] == 'Over', under=weekly['Status'] == 'Under').groupby('Employee').agg(
+        Weeks=('ISO Week', 'size'),
+        Hours=('Hours', 'sum'),
+        Capacity=('Capacity', 'sum'),
+        **{'Peak Utilisation %': ('Utilisation %', 'max'),
+           'Over Weeks': ('over', 'sum'),
+           'Under Weeks': ('under', 'sum')}
+    )
+    summary.insert(3, 'Avg Utilisation %', summary['Hours'] * 100 / summary['Capacity'].where(summary['Capacity'] > 0))
+    summary['Status'] = np.select(
+        [summary['Avg Utilisation %'] > thresholds['over'], summary['Avg Utilisation %'] < thresholds['under']],
+        ['Over', 'Under'], default='OK'
+    )
+
+    project_split = df.groupby([df['Employee'].astype(str).rename('Employee'), 'Project name'])['Hours'].sum().reset_index()
+    project_split['Share %'] = project_split['Hours'] * 100 / project_split.groupby('Employee')['Hours'].transform('sum')
+    project_split = project_split.sort_values(['Employee', 'Hours'], ascending=[True, False], ignore_index=True)
+    top_projects = project_split.drop_duplicates('Employee').set_index('Employee')['Project name']
+    summary['Projects'] = project_split.groupby('Employee').size()
+    summary['Top Project'] = top_projects
+
+    return {'weekly': weekly, 'summary': summary.reset_index(), 'project_split': project_split}
+
+@tracing.traced('excel')
+def export_utilisation_report(report, output_file_path):
+    """Xuất báo cáo tỉ lệ sử dụng nhân viên ra Excel; tuần/nhân viên quá tải tô đỏ, thiếu việc tô vàng."""
+    from openpyxl.formatting.rule import FormulaRule
+    from openpyxl.styles import PatternFill
+    from openpyxl.utils import get_column_letter
+
+    if not report:
+        print("Cảnh báo: Không có dữ liệu tỉ lệ sử dụng để xuất.")
+        return False
 
-    if config['months']:
-        df_filtered = df_filtered[df_filtered['MonthName'].isin(config['months'])]
+    fills = {'Over': PatternFill(start_color='F8CBAD', end_color='F8CBAD', fill_type='solid'),
+             'Under': PatternFill(start_color='FFE699', end_color='FFE699', fill_type='solid')}
+    sheets = [('Utilisation Summary', report['summary']), ('Weekly Utilisation', report['weekly']),
+              ('Project Split', report['project_split'])]
+    try:
+        with pd.ExcelWriter(output_file_path, engine='openpyxl', datetime_format='yyyy-mm-dd') as writer:
+            for sheet_name, data in sheets:
+                data.round(dict.fromkeys(data.select_dtypes('number').columns, 1)).to_excel(writer, sheet_name=sheet_name, index=False)
+                ws = writer.book[sheet_name]
+                ws.freeze_panes = 'B2'
+                for idx, col in enumerate(data.columns, start=1):
+                    ws.column_dimensions[get_column_letter(idx)].width = max(12, len(str(col)) + 2)
+                if 'Status' in data.columns and len(data):
+                    # Định dạng có điều kiện theo cột Status: một quy tắc cho cả sheet thay vì tô từng ô
+                    status_col = get_column_letter(data.columns.get_loc('Status') + 1)
+                    cell_range = f"A2:{get_column_letter(len(data.columns))}{len(data) + 1}"
+                    for status, fill in fills.items():
+                        ws.conditional_formatting.add(cell_range, FormulaRule(formula=[f'${status_col}2="{status}"'], fill=fill))
+        return True
+    except Exception as e:
+        print(f"Lỗi khi xuất báo cáo tỉ lệ sử dụng: {e}")
+        return False
 
-    if not config['project_filter_df'].empty:
-        selected_project_names = config['project_filter_df']['Project Name'].tolist()
-        df_filtered = df_filtered[df_filtered['Project name'].isin(selected_project_names)]
-    else:
-        return pd.DataFrame(columns=df.columns) 
+@tracing.traced('aggregate')
+def build_budget_burn(df, budget_df, alpha=None):
+    """Giờ đã dùng so với ngân sách và ngày dự báo hoàn thành cho mọi dự án có ngân sách cùng lúc.
+
+    Giờ được gộp một lần thành chuỗi tuần (ma trận tuần x dự án, tuần trống = 0h, trước tuần đầu = NaN);
+    lũy kế là cumsum theo trục tuần và tốc độ đốt giờ là làm trơn hàm mũ (ewm) của chuỗi tuần, cả hai
+    chạy trên toàn bộ ma trận. Dự báo = tuần cuối + giờ còn lại / tốc độ. `df` nên chứa toàn bộ lịch sử
+    của các dự án (không lọc theo năm/tháng) để lũy kế đúng.
+    Trả về dict gồm 'summary' (một hàng mỗi dự án) và 'weekly' (chuỗi tuần dạng dài), hoặc {} nếu không có dữ liệu.
+    """
+    import numpy as np
+
+    if df.empty or budget_df is None or budget_df.empty:
+        return {}
+    alpha = BURN_FORECAST['alpha'] if alpha is None else alpha
+    budget = budget_df.set_index('Project Name')
+    df = df[df['Project name'].isin(budget.index)]
+    if df.empty:
+        return {}
+
+    week_start = (df['Date'] - pd.to_timedelta(df['Date'].dt.weekday, unit='D')).dt.normalize().rename('Week Start')
+    weekly = df.groupby([week_start, df['Project name']])['Hours'].sum().unstack('Project name')
+    # Tuần liên tục đến tuần cuối có dữ liệu (chung cho mọi dự án); tuần trống sau tuần đầu của dự án là 0h
+    weekly = weekly.reindex(pd.date_range(weekly.index.min(), weekly.index.max(), freq='7D', name='Week Start'))
+    weekly = weekly.fillna(0).where(weekly.notna().cummax())
+    cumulative = weekly.cumsum()
+    rate = weekly.ewm(alpha=alpha, adjust=False).mean().iloc[-1]
+
+    budget_hours = budget['Budget Hours'].reindex(weekly.columns)
+    burned = cumulative.iloc[-1]
+    remaining = budget_hours - burned
+    last_week = weekly.index[-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weeks_left = (remaining / rate).where((rate > 1e-9) & (remaining > 0))
+    crossed = cumulative.ge(budget_hours, axis=1)
+    crossed_week = crossed.idxmax().where(crossed.any())
+    forecast = (last_week + pd.to_timedelta(weeks_left * 7, unit='D')).dt.normalize()
+    forecast = forecast.where(remaining > 0, crossed_week)
+
+    status = pd.Series('On track', index=weekly.columns)
+    status[(rate <= 1e-9) & (remaining > 0)] = 'Stalled'
+    if 'Deadline' in budget.columns:
+        deadline = budget['Deadline'].reindex(weekly.columns)
+        status[(forecast > deadline) & (remaining > 0)] = 'Late'
+    status[remaining <= 0] = 'Over budget'
+
+    summary = pd.DataFrame({
+        'Project name': weekly.columns,
+        'Budget Hours': budget_hours.to_numpy(),
+        'Burned Hours': burned.to_numpy(),
+        'Burn %': (burned / budget_hours * 100).to_numpy(),
+        'Remaining Hours': remaining.to_numpy(),
+        'Weekly Rate': rate.to_numpy(),
+        'Weeks Remaining': weeks_left.to_numpy(),
+        'Forecast Completion': forecast.to_numpy(),
+    })
+    if 'Deadline' in budget.columns:
+        summary['Deadline'] = deadline.to_numpy()
+    summary['Status'] = status.to_numpy()
+    summary = summary.sort_values('Burn %', ascending=False).reset_index(drop=True)
+
+    long = pd.DataFrame({'Hours': weekly.stack(), 'Cumulative Hours': cumulative.stack()}).reset_index()
+    long['Burn %'] = long['Cumulative Hours'] / long['Project name'].map(budget_hours) * 100
+    long = long[['Project name', 'Week Start', 'Hours', 'Cumulative Hours', 'Burn %']]
+    return {'summary': summary, 'weekly': long.sort_values(['Project name', 'Week Start']).reset_index(drop=True)}
+
+# Ngưỡng phát hiện bất thường trên giờ đã ghi
+ANOMALY_THRESHOLDS = {
+    'impossible_daily_hours': 24.0,  # Tổng giờ một ngày của một nhân viên từ mức này trở lên là không thể
+    'max_daily_hours': 16.0,         # Trên mức này là đáng ngờ
+    'zscore': 3.0,                   # z-score theo nhân viên/dự án
+    'mad': 3.5,                      # Điểm robust (|x - median| / (1.4826 * MAD))
+    'min_periods': 5,                # Số ngày/tuần tối thiểu của một nhân viên/dự án để tính thống kê
+}
+ANOMALY_COLUMNS = ['Rule', 'Severity', 'Employee', 'Project name', 'Date', 'Period', 'Hours', 'Score', 'Detail']
+
+def _mix64(values):
+    """Băm số nguyên 64-bit (splitmix64) theo vector, dùng để dựng chữ ký tuần."""
+    import numpy as np
+    x = values.astype(np.uint64)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+@tracing.traced('aggregate')
+def detect_anomalies(df, project_filter_df=None, thresholds=None):
+    """Phát hiện các dòng giờ bất thường, toàn bộ bằng phép toán vector/groupby (không lặp theo dòng).
+
+    Các quy tắc:
+    - daily_impossible / daily_over_limit: tổng giờ một ngày của nhân viên vượt ngưỡng;
+    - duplicate_entry: các dòng trùng hoàn toàn (ngày, nhân viên, dự án, workcentre, task, giờ);
+    - duplicate_week: tuần của nhân viên lặp y hệt một tuần khác (sao chép timesheet);
+    - closed_project: giờ ghi sau 'Closed Date' của dự án (cột tùy chọn trong Config_Project_Filter);
+    - outlier_<employee|project>_<day|week>: tổng theo ngày/tuần cao bất thường so với chính nhân viên/dự án đó
+      (z-score hoặc điểm MAD vượt ngưỡng; chỉ xét phía cao).
+    Các cột chuỗi được mã hóa thành số nguyên một lần, mọi phép nhóm chạy trên khóa số nguyên.
+    Trả về DataFrame với các cột ANOMALY_COLUMNS.
+    """
+    import numpy as np
+
+    thresholds = {**ANOMALY_THRESHOLDS, **(thresholds or {})}
+    if df.empty:
+        return pd.DataFrame(columns=ANOMALY_COLUMNS)
 
-    return df_filtered
+    # Mã hóa: chuỗi -> mã số nguyên, ngày -> số ngày kể từ 1970-01-01 (thứ Năm), tuần -> số ngày của thứ Hai
+    def encode(col):
+        if col not in df.columns:
+            return np.zeros(len(df), dtype=np.int64), np.array([''], dtype=object)
+        # Ô trống (NaN) là một nhóm riêng, không dùng mã -1 (bincount/lexsort không nhận mã âm)
+        codes, uniques = pd.factorize(df[col], use_na_sentinel=False)
+        names = np.asarray(uniques, dtype=object)
+        if col == 'Employee':
+            names = np.where(pd.isna(names), None, names.astype(str))
+        return codes.astype(np.int64), names
+
+    emp, emp_names = encode('Employee')
+    proj, proj_names = encode('Project name')
+    wc, _ = encode('Workcentre')
+    task, _ = encode('Task')
+    day = df['Date'].to_numpy().astype('datetime64[D]').astype(np.int64)
+    weekday = (day + 3) % 7
+    week = day - weekday
+    hours = df['Hours'].to_numpy(dtype=float)
+    cents = np.round(hours * 100).astype(np.int64)
+    to_date = lambda days: pd.to_datetime(days, unit='D')
+
+    findings = []
+
+    def add(rule, severity, period, employees, projects, dates, hrs, score, detail):
+        findings.append(pd.DataFrame({
+            'Rule': rule, 'Severity': severity,
+            'Employee': emp_names[employees] if employees is not None else None,
+            'Project name': proj_names[projects] if projects is not None else None,
+            'Date': to_date(dates), 'Period': period, 'Hours': hrs, 'Score': score, 'Detail': detail,
+        }))
+
+    def group_sum(entity, period, *weights):
+        # Tổng theo (thực thể, kỳ) trên khóa số nguyên gộp; bincount khi không gian khóa đủ nhỏ.
+        # Trả về (mã thực thể, kỳ, số dòng, tổng giờ, tổng từng mảng `weights`), sắp theo mã thực thể.
+        base = period.min()
+        span = int(period.max() - base) + 1
+        key = entity * span + (period - base)
+        size = (int(entity.max()) + 1) * span
+        columns = (hours,) + weights
+        if size <= 4 * len(key) + 1_000_000:
+            counts = np.bincount(key, minlength=size)
+            present = np.flatnonzero(counts)
+            sums = [np.bincount(key, weights=w, minlength=size)[present] for w in columns]
+            counts = counts[present]
+        else:
+            grouped = pd.DataFrame({i: w for i, w in enumerate(columns)}).groupby(key)
+            present, counts = grouped.size().index.to_numpy(), grouped.size().to_numpy()
+            sums = [grouped[i].sum().to_numpy() for i in range(len(columns))]
+        return (present // span, present % span + base, counts) + tuple(sums)
+
+    def group_median(ids, values, group_counts):
+        # Trung vị theo nhóm; `ids` đã được sắp tăng dần nên mỗi nhóm là một đoạn liên tiếp
+        ordered = values[np.lexsort((values, ids))]
+        starts = np.concatenate(([0], np.cumsum(group_counts)[:-1]))
+        return (ordered[starts + (group_counts - 1) // 2] + ordered[starts + group_counts // 2]) / 2
+
+    # --- Tổng giờ theo ngày của nhân viên ---
+    daily_emp, daily_day, _, daily_hours = group_sum(emp, day)
+    impossible = daily_hours >= thresholds['impossible_daily_hours']
+    over = (daily_hours > thresholds['max_daily_hours']) & ~impossible
+    for rule, severity, mask, limit in [('daily_impossible', 'high', impossible, thresholds['impossible_daily_hours']),
+                                        ('daily_over_limit', 'medium', over, thresholds['max_daily_hours'])]:
+        if mask.any():
+            add(rule, severity, 'day', daily_emp[mask], None, daily_day[mask], daily_hours[mask],
+                daily_hours[mask] / limit, f"Daily total vs limit {limit:g}h")
+
+    # --- Dòng trùng lặp ---
+    # Băm 64-bit nội dung dòng (thứ trong tuần, dự án, workcentre, task, giờ) dùng cho cả hai kiểm tra trùng lặp
+    row_hash = _mix64(weekday)
+    for values in (proj, wc, task, cents):
+        row_hash = _mix64(row_hash ^ values.astype(np.uint64))
+    # Dòng trùng: thêm ngày và nhân viên vào khóa băm (xác suất va chạm không đáng kể)
+    entry_hash = _mix64(row_hash ^ _mix64(day * (int(emp.max()) + 1) + emp))
+    duplicated = pd.Series(entry_hash).duplicated(keep=False).to_numpy()
+    if duplicated.any():
+        add('duplicate_entry', 'high', 'entry', emp[duplicated], proj[duplicated], day[duplicated], hours[duplicated],
+            np.nan, "Identical entry logged more than once")
+
+    # --- Tuần bị sao chép: chữ ký (tổng hash các dòng theo thứ trong tuần) trùng với tuần khác của cùng nhân viên ---
+    # Tổng hash được cộng trên hai nửa 32-bit để bincount (float64) vẫn cộng chính xác
+    week_emp, week_days, week_entries, week_hours, sig_hi, sig_lo = group_sum(
+        emp, week, (row_hash >> np.uint64(32)).astype(float), (row_hash & np.uint64(0xFFFFFFFF)).astype(float))
+    weeks = pd.DataFrame({'e': week_emp, 'hi': sig_hi, 'lo': sig_lo, 'n': week_entries})
+    copied = (weeks.duplicated(keep=False) & (weeks['n'] > 1)).to_numpy()
+    if copied.any():
+        add('duplicate_week', 'high', 'week', week_emp[copied], None, week_days[copied],
+            week_hours[copied], np.nan, "Week identical to another week of the same employee")
+
+    # --- Giờ ghi vào dự án đã đóng ---
+    if project_filter_df is not None and 'Closed Date' in project_filter_df.columns and 'Project name' in df.columns:
+        closed = project_filter_df.dropna(subset=['Closed Date'])
+        closed_days = pd.Series(pd.to_datetime(closed['Closed Date'], errors='coerce').to_numpy().astype('datetime64[D]'),
+                                index=closed['Project Name'])
+        # Dự án lặp lại trong cấu hình: lấy ngày đóng sớm nhất (map cần chỉ mục không trùng)
+        closed_days = closed_days.groupby(level=0).min()
+        project_closed = pd.Series(proj_names).map(closed_days).to_numpy().astype('datetime64[D]').astype(np.int64)
+        closed_day = project_closed[proj]
+        after_close = (day > closed_day) & ~np.isnat(project_closed.astype('datetime64[D]'))[proj]
+        if after_close.any():
+            add('closed_project', 'high', 'entry', emp[after_close], proj[after_close], day[after_close], hours[after_close],
+                np.nan, "Logged after project closed on " + pd.Series(to_date(closed_day[after_close])).dt.strftime('%Y-%m-%d').to_numpy())
+
+    # --- Ngoại lệ thống kê theo nhân viên/dự án, ngày/tuần ---
+    for entity_name, entity in [('employee', emp), ('project', proj)]:
+        for period_name, period in [('day', day), ('week', week)]:
+            ids, periods, _, totals = group_sum(entity, period)
+            # Thống kê theo thực thể (trung bình, độ lệch chuẩn mẫu, trung vị, MAD) rồi trải lại theo từng kỳ
+            group_counts = np.bincount(ids)
+            present = group_counts > 0
+            n = group_counts[present]
+            s1 = np.bincount(ids, weights=totals)[present]
+            s2 = np.bincount(ids, weights=totals * totals)[present]
+            slot = np.cumsum(present) - 1
+            member = slot[ids]
+            group_mean = s1 / n
+            with np.errstate(divide='ignore', invalid='ignore'):
+                group_std = np.sqrt(np.maximum(s2 - s1 * group_mean, 0) / (n - 1))
+            group_med = group_median(member, totals, n)
+            group_mad = group_median(member, np.abs(totals - group_med[member]), n)
+            mean, std, count = group_mean[member], group_std[member], n[member]
+            median, mad = group_med[member], group_mad[member]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                z = np.where(std > 0, (totals - mean) / std, np.nan)
+                robust = np.where(mad > 0, (totals - median) / (1.4826 * mad), np.nan)
+            flagged = (count >= thresholds['min_periods']) & ((z > thresholds['zscore']) | (robust > thresholds['mad']))
+            if flagged.any():
+                detail = ("z=" + pd.Series(z[flagged]).round(1).astype(str) + ", MAD score=" + pd.Series(robust[flagged]).round(1).astype(str)
+                          + ", typical " + pd.Series(median[flagged]).round(1).astype(str) + "h").to_numpy()
+                add(f"outlier_{entity_name}_{period_name}", 'low', period_name,
+                    ids[flagged] if entity_name == 'employee' else None, ids[flagged] if entity_name == 'project' else None,
+                    periods[flagged], totals[flagged], np.fmax(z[flagged], robust[flagged]), detail)
+
+    if not findings:
+        return pd.DataFrame(columns=ANOMALY_COLUMNS)
+    anomalies = pd.concat(findings, ignore_index=True)
+    severity_rank = anomalies['Severity'].map({'high': 0, 'medium': 1, 'low': 2}).to_numpy()
+    order = np.lexsort((-anomalies['Score'].fillna(0).to_numpy(), anomalies['Date'].to_numpy(), severity_rank))
+    return anomalies.iloc[order].reset_index(drop=True)
+
+def budget_burn_for_report(df, config, budget_burn=None):
+    """Kết quả build_budget_burn dùng cho báo cáo: dùng bản tính sẵn nếu có, nếu không tính từ `df` theo config['budget_df']."""
+    if budget_burn is not None:
+        return budget_burn
+    budget_df = config.get('budget_df')
+    return build_budget_burn(df, budget_df) if budget_df is not None and not budget_df.empty else {}
+
+@tracing.traced('excel')
+def export_report(df, config, output_file_path, budget_burn=None):
+    """Xuất báo cáo tiêu chuẩn ra file Excel.
+
+    `budget_burn` (kết quả build_budget_burn, nên tính trên toàn bộ lịch sử dự án) được ghi vào sheet Summary
+    và sheet 'Budget Burn'; nếu bỏ trống thì tính từ `df` khi config có 'budget_df'.
+    """
+    from openpyxl.styles import Font
 
-def export_report(df, config, output_file_path):
-    """Xuất báo cáo tiêu chuẩn ra file Excel."""
     mode = config.get('mode', 'year')
     
     groupby_cols = []
@@ -135,8 +740,9 @@ def export_report(df, config, output_file_path):
 
         wb = load_workbook(output_file_path)
 
-        # === Ghi summary dạng MonthName - Hours ===
-        summary_chart = df.groupby('MonthName')['Hours'].sum().reset_index()
+        # === Ghi summary dạng MonthName - Hours (kèm Cost nếu dữ liệu đã được quy đổi chi phí) ===
+        value_cols = ['Hours'] + (['Cost'] if 'Cost' in df.columns else [])
+        summary_chart = df.groupby('MonthName')[value_cols].sum().reset_index()
         summary_chart = summary_chart.sort_values('MonthName', key=lambda x: pd.to_datetime(x, format='%B'))
 
         if 'Summary' in wb.sheetnames:
@@ -144,9 +750,9 @@ def export_report(df, config, output_file_path):
             wb.remove(ws)
         ws = wb.create_sheet("Summary", 0)
 
-        ws.append(['MonthName', 'Hours'])
+        ws.append(['MonthName'] + value_cols)
         for row in summary_chart.itertuples(index=False):
-            ws.append([row.MonthName, row.Hours])
+            ws.append(list(row))
 
         # Thêm biểu đồ vào sheet Summary
         data_ref = Reference(ws, min_col=2, min_row=1, max_row=1 + len(summary_chart))
@@ -160,6 +766,39 @@ def export_report(df, config, output_file_path):
         chart.set_categories(cats_ref)
         ws.add_chart(chart, "E2")
 
+        # === Ngân sách và giờ đã dùng (dưới bảng tháng, tránh vùng biểu đồ) ===
+        budget_burn = budget_burn_for_report(df, config, budget_burn)
+        if budget_burn:
+            burn_summary = budget_burn['summary']
+            start_row = max(ws.max_row + 3, 20)
+            ws.cell(row=start_row, column=1, value="Budget vs Actual").font = Font(bold=True)
+            for r_idx, r in enumerate(dataframe_to_rows(burn_summary.round(dict.fromkeys(burn_summary.select_dtypes('number').columns, 1)), index=False, header=True), start=start_row + 1):
+                for c_idx, cell_val in enumerate(r, start=1):
+                    cell = ws.cell(row=r_idx, column=c_idx, value=cell_val)
+                    if r_idx > start_row + 1 and burn_summary.columns[c_idx - 1] in ('Forecast Completion', 'Deadline'):
+                        cell.number_format = 'yyyy-mm-dd'
+
+            # Sheet Budget Burn: giờ lũy kế theo tuần (tuần x dự án) và biểu đồ đường
+            ws_burn = wb.create_sheet("Budget Burn")
+            cumulative = budget_burn['weekly'].pivot(index='Week Start', columns='Project name', values='Cumulative Hours')
+            cumulative = cumulative[burn_summary['Project name']]
+            ws_burn.append(['Week Start'] + [str(p) for p in cumulative.columns])
+            for week, values in zip(cumulative.index, cumulative.round(1).to_numpy().tolist()):
+                ws_burn.append([week.date()] + [None if pd.isna(v) else v for v in values])
+            for row in ws_burn.iter_rows(min_row=2, max_col=1):
+                row[0].number_format = 'yyyy-mm-dd'
+
+            burn_chart = LineChart()
+            burn_chart.title = "Cumulative Hours by Project"
+            burn_chart.x_axis.title = "Week"
+            burn_chart.y_axis.title = "Hours"
+            burn_chart.width, burn_chart.height = 24, 12
+            series_count = min(len(cumulative.columns), 10)
+            burn_chart.add_data(Reference(ws_burn, min_col=2, max_col=1 + series_count, min_row=1, max_row=1 + len(cumulative)), titles_from_data=True)
+            burn_chart.set_categories(Reference(ws_burn, min_col=1, min_row=2, max_row=1 + len(cumulative)))
+            ws_burn.add_chart(burn_chart, ws_burn.cell(row=2, column=len(cumulative.columns) + 3).coordinate)
+            ws_burn.freeze_panes = 'B2'
+
         for project in df['Project name'].unique():
             df_proj = df[df['Project name'] == project]
             sheet_title = sanitize_filename(project)
@@ -169,10 +808,10 @@ def export_report(df, config, output_file_path):
             else:
                 ws_proj = wb.create_sheet(title=sheet_title)
 
-            summary_task = df_proj.groupby('Task')['Hours'].sum().reset_index().sort_values('Hours', ascending=False)
+            summary_task = df_proj.groupby('Task')[value_cols].sum().reset_index().sort_values('Hours', ascending=False)
             
             if not summary_task.empty:
-                ws_proj.append(['Task', 'Hours'])
+                ws_proj.append(['Task'] + value_cols)
                 for row_data in dataframe_to_rows(summary_task, index=False, header=False):
                     ws_proj.append(row_data)
 
@@ -195,7 +834,26 @@ def export_report(df, config, output_file_path):
             for r_idx, r in enumerate(dataframe_to_rows(df_proj, index=False, header=True)):
                 for c_idx, cell_val in enumerate(r):
                     ws_proj.cell(row=start_row_raw_data + r_idx, column=c_idx + 1, value=cell_val)
-        
+
+        # === Sheet Anomalies: các dòng/tổng giờ bất thường trên dữ liệu đã lọc ===
+        # Lỗi ở bước này chỉ được ghi vào sheet, không làm mất cả báo cáo
+        ws_anomalies = wb.create_sheet("Anomalies")
+        ws_anomalies.append(ANOMALY_COLUMNS)
+        try:
+            anomalies = detect_anomalies(df, config.get('project_filter_df'), config.get('anomaly_thresholds'))
+            if anomalies.empty:
+                ws_anomalies.append(["No anomalies found"])
+            else:
+                anomalies['Date'] = anomalies['Date'].dt.date
+                for row_data in dataframe_to_rows(anomalies.round({'Hours': 2, 'Score': 2}), index=False, header=False):
+                    ws_anomalies.append(row_data)
+                ws_anomalies.auto_filter.ref = ws_anomalies.dimensions
+        except Exception as e:
+            print(f"Lỗi khi phát hiện bất thường: {e}")
+            ws_anomalies.delete_rows(2, ws_anomalies.max_row)
+            ws_anomalies.append([f"Anomaly detection failed: {e}"])
+        ws_anomalies.freeze_panes = 'A2'
+
         ws_config = wb.create_sheet("Config_Info")
         ws_config['A1'], ws_config['B1'] = "Mode", config.get('mode', 'N/A').capitalize()
         ws_config['A2'], ws_config['B2'] = "Year(s)", ', '.join(map(str, config.get('years', []))) if config.get('years') else str(config.get('year', 'N/A'))
@@ -218,91 +876,245 @@ def export_report(df, config, output_file_path):
         print(f"Lỗi khi xuất báo cáo tiêu chuẩn: {e}")
         return False
 
-def export_pdf_report(df, config, pdf_report_path, logo_path):
-    """Xuất báo cáo PDF tiêu chuẩn với các biểu đồ."""
-    today_str = datetime.datetime.today().strftime("%Y-%m-%d")
-    tmp_dir = tempfile.mkdtemp()
-    charts_for_pdf = []
-
-    def create_pdf_from_charts(charts_data, output_path, title, config_info, logo_path_inner):
-        pdf = FPDF()
-        pdf.set_auto_page_break(auto=True, margin=15)
-        pdf.set_font('helvetica', 'B', 16)
-
+def pdf_text(value):
+    """Chuyển chuỗi về latin-1 cho font lõi của FPDF: bỏ dấu tiếng Việt (đ -> d), ký tự khác thay bằng '?'."""
+    import unicodedata
+    text = str(value).replace('đ', 'd').replace('Đ', 'D')
+    text = ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c))
+    return text.encode('latin-1', 'replace').decode('latin-1')
+
+# Tùy chọn bố cục/nén ảnh cho báo cáo PDF
+DEFAULT_PDF_OPTIONS = {
+    'charts_per_page': 1,            # 1, 2 hoặc 4 biểu đồ mỗi trang
+    'image_dpi': 150,                # DPI mục tiêu của ảnh biểu đồ khi in trong PDF
+    'include_totals_table': False,   # Thêm trang bảng tổng giờ theo dự án (báo cáo tiêu chuẩn)
+}
+
+# Vị trí các ô biểu đồ (x, y, rộng, cao - mm) trên trang A4 dọc cho từng bố cục
+PDF_LAYOUTS = {
+    1: [(10, 45, 190, 235)],
+    2: [(10, 45, 190, 110), (10, 170, 190, 110)],
+    4: [(10, 45, 92, 110), (108, 45, 92, 110), (10, 170, 92, 110), (108, 170, 92, 110)],
+}
+
+def get_pdf_options(pdf_options=None):
+    """Gộp tùy chọn PDF của người dùng với giá trị mặc định và kiểm tra bố cục hợp lệ."""
+    options = {**DEFAULT_PDF_OPTIONS, **(pdf_options or {})}
+    if options['charts_per_page'] not in PDF_LAYOUTS:
+        print(f"Cảnh báo: Bố cục {options['charts_per_page']} biểu đồ/trang không hỗ trợ, dùng 1 biểu đồ/trang.")
+        options['charts_per_page'] = 1
+    return options
+
+def pdf_chart_dpi(options, fig_width_in):
+    """DPI cần dùng khi vẽ để ảnh đạt đúng DPI mục tiêu khi đặt vào ô biểu đồ của bố cục."""
+    slot_width_in = PDF_LAYOUTS[options['charts_per_page']][0][2] / 25.4
+    return max(50, round(options['image_dpi'] * slot_width_in / fig_width_in))
+
+def compress_chart_image(img_path, output_path=None, max_width_px=None, colors=256):
+    """Nén ảnh PNG cho PDF: bỏ kênh alpha (nền trắng), giảm độ phân giải và chuyển sang bảng màu."""
+    from PIL import Image
+
+    with Image.open(img_path) as img:
+        img.load()
+    if img.mode in ('RGBA', 'LA', 'P'):
+        img = img.convert('RGBA')
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel('A'))
+        img = background
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
+    if max_width_px and img.width > max_width_px:
+        img = img.resize((max_width_px, round(img.height * max_width_px / img.width)), Image.LANCZOS)
+    # PNG bảng màu (không alpha) nhỏ hơn nhiều và fpdf nhúng trực tiếp mà không cần giải nén
+    img.quantize(colors=colors).save(output_path or img_path, optimize=True)
+    return output_path or img_path
+
+def prepare_pdf_logo(logo_path, tmp_dir, options, width_mm=30):
+    """Nén logo một lần; mọi trang dùng cùng một file nên logo chỉ được nhúng một lần trong PDF."""
+    if not logo_path or not os.path.exists(logo_path):
+        return None
+    max_width_px = round(width_mm / 25.4 * options['image_dpi'])
+    return compress_chart_image(logo_path, os.path.join(tmp_dir, "logo_pdf.png"), max_width_px=max_width_px)
+
+def add_chart_pages(pdf, charts_data, logo_path, options, slot_start=0):
+    """Thêm các trang biểu đồ theo bố cục 1/2/4 biểu đồ mỗi trang.
+
+    Trả về vị trí ô tiếp theo trên trang hiện tại để lần gọi sau (dự án kế tiếp) tiếp tục điền vào trang đó.
+    """
+    from PIL import Image
+
+    slots = PDF_LAYOUTS[options['charts_per_page']]
+    charts = [c for c in charts_data if c[0] and os.path.exists(c[0])]
+    slot_index = slot_start
+    for img_path, chart_title, page_project_name in charts:
+        slot_index %= len(slots)
+        if slot_index == 0:
+            pdf.add_page()
+            if logo_path:
+                pdf.image(logo_path, x=10, y=8, w=25)
+        x, y, w, h = slots[slot_index]
+
+        if len(slots) == 1:
+            pdf.set_font("helvetica", 'B', 11)
+            pdf.set_y(35)
+            if page_project_name:
+                pdf.cell(0, 10, pdf_text(f"Project: {page_project_name}"), ln=True, align='C')
+            pdf.cell(0, 10, pdf_text(chart_title), ln=True, align='C')
+        else:
+            pdf.set_font("helvetica", 'B', 9)
+            pdf.set_xy(x, y - 8)
+            pdf.cell(w, 8, pdf_text(chart_title), ln=0, align='C')
+
+        # Giữ tỉ lệ ảnh và căn giữa trong ô nếu ảnh cao hơn ô
+        with Image.open(img_path) as img:
+            img_w, img_h = img.size
+        draw_w = min(w, h * img_w / img_h)
+        pdf.image(img_path, x=x + (w - draw_w) / 2, y=y, w=draw_w)
+        slot_index += 1
+    return slot_index
+
+def add_cover_page(pdf, title, config_info, logo_path):
+    """Trang bìa: logo, tiêu đề, ngày tạo và thông tin cấu hình (tháng/dự án được chia cột)."""
+    pdf.set_font('helvetica', 'B', 16)
+    pdf.add_page()
+    if logo_path:
+        pdf.image(logo_path, x=10, y=10, w=30)
+    pdf.ln(40)
+    pdf.cell(0, 10, pdf_text(title), ln=True, align='C')
+    pdf.set_font("helvetica", '', 12)
+    pdf.ln(5)
+    pdf.cell(0, 10, f"Generated on: {datetime.datetime.today().strftime('%Y-%m-%d')}", ln=True, align='C')
+    pdf.ln(10)
+    pdf.set_font("helvetica", '', 11)
+
+    for key, value in config_info.items():
+        if (key == "Months" and value != "All") or (key == "Projects Included" and value != "No projects selected or found"):
+            pdf.ln(5)
+            pdf.set_font("helvetica", 'B', 11)
+            pdf.cell(0, 10, "Months:" if key == "Months" else "Projects:", ln=True, align='L')
+            pdf.set_font("helvetica", '', 11)
+            items = value.split(', ')
+            col_width = 60  # Width per column
+            cols = 3        # Number of columns
+            row_height = 7
+            x_start = pdf.get_x()
+            y_start = pdf.get_y()
+
+            for i, item in enumerate(items):
+                col = i % cols
+                row = i // cols
+                x = x_start + col * col_width
+                y = y_start + row * row_height
+                pdf.set_xy(x, y)
+                pdf.cell(col_width, row_height, pdf_text(f"{i + 1}. {item}"), ln=0)
+
+            pdf.ln((len(items) // cols + 1) * row_height + 2)  # Move cursor below the block
+        else:
+            pdf.cell(0, 7, pdf_text(f"{key}: {value}"), ln=True, align='C')
+
+def add_project_totals_page(pdf, df, logo_path):
+    """Thêm trang bảng gọn tổng giờ theo dự án (sắp xếp giảm dần, kèm tỉ lệ % và chi phí nếu có cột Cost)."""
+    with_cost = 'Cost' in df.columns
+    grouped = df.groupby('Project name')[['Hours', 'Cost'] if with_cost else ['Hours']].sum().sort_values('Hours', ascending=False)
+    totals = grouped['Hours']
+    grand_total = totals.sum()
+    name_width = 95 if with_cost else 120
+
+    pdf.add_page()
+    if logo_path:
+        pdf.image(logo_path, x=10, y=8, w=25)
+    pdf.set_y(35)
+    pdf.set_font("helvetica", 'B', 12)
+    pdf.cell(0, 10, "Project Totals", ln=True, align='C')
+
+    pdf.set_font("helvetica", 'B', 9)
+    pdf.set_fill_color(220, 230, 241)
+    pdf.cell(name_width, 7, "Project", border=1, fill=True)
+    pdf.cell(35, 7, "Hours", border=1, align='R', fill=True)
+    pdf.cell(25 if with_cost else 35, 7, "% of total", border=1, align='R', fill=True, ln=0 if with_cost else 1)
+    if with_cost:
+        pdf.cell(35, 7, "Cost", border=1, align='R', fill=True, ln=1)
+
+    pdf.set_font("helvetica", '', 9)
+    for project, hours in totals.items():
+        share = hours / grand_total * 100 if grand_total else 0
+        pdf.cell(name_width, 6, pdf_text(project)[:70], border=1)
+        pdf.cell(35, 6, f"{hours:,.1f}", border=1, align='R')
+        pdf.cell(25 if with_cost else 35, 6, f"{share:.1f}%", border=1, align='R', ln=0 if with_cost else 1)
+        if with_cost:
+            pdf.cell(35, 6, f"{grouped.at[project, 'Cost']:,.0f}", border=1, align='R', ln=1)
+
+    pdf.set_font("helvetica", 'B', 9)
+    pdf.cell(name_width, 7, "Total", border=1)
+    pdf.cell(35, 7, f"{grand_total:,.1f}", border=1, align='R')
+    pdf.cell(25 if with_cost else 35, 7, "100.0%", border=1, align='R', ln=0 if with_cost else 1)
+    if with_cost:
+        pdf.cell(35, 7, f"{grouped['Cost'].sum():,.0f}", border=1, align='R', ln=1)
+
+def add_budget_burn_page(pdf, budget_burn, logo_path, renderer, tmp_dir, max_projects=10):
+    """Thêm trang ngân sách: bảng giờ đã dùng/dự báo hoàn thành và biểu đồ % ngân sách đã dùng theo tuần."""
+    summary = budget_burn['summary']
+    pdf.add_page()
+    if logo_path:
+        pdf.image(logo_path, x=10, y=8, w=25)
+    pdf.set_y(35)
+    pdf.set_font("helvetica", 'B', 12)
+    pdf.cell(0, 10, "Budget vs Actual", ln=True, align='C')
+
+    widths = [58, 22, 22, 16, 20, 26, 26]
+    headers = ["Project", "Budget", "Burned", "Burn %", "Rate/wk", "Forecast", "Status"]
+    pdf.set_font("helvetica", 'B', 9)
+    pdf.set_fill_color(220, 230, 241)
+    for width, header in zip(widths, headers):
+        pdf.cell(width, 7, header, border=1, align='L' if header in ("Project", "Status") else 'R', fill=True)
+    pdf.ln()
+
+    pdf.set_font("helvetica", '', 9)
+    for row in summary.itertuples(index=False):
+        forecast = row[summary.columns.get_loc('Forecast Completion')]
+        values = [pdf_text(row[0])[:34], f"{row[1]:,.0f}", f"{row[2]:,.1f}", f"{row[3]:.0f}%", f"{row[5]:,.1f}",
+                  forecast.strftime('%Y-%m-%d') if pd.notna(forecast) else "-", row[-1]]
+        for width, header, value in zip(widths, headers, values):
+            pdf.cell(width, 6, value, border=1, align='L' if header in ("Project", "Status") else 'R')
+        pdf.ln()
+
+    # Biểu đồ % ngân sách đã dùng của các dự án dùng nhiều nhất
+    projects = summary['Project name'].head(max_projects)
+    burn_pct = budget_burn['weekly'].pivot(index='Week Start', columns='Project name', values='Burn %')[projects]
+    burn_pct.index = burn_pct.index.strftime('%Y-%m-%d')
+    img_path = compress_chart_image(renderer.line(
+        burn_pct, os.path.join(tmp_dir, "budget_burn.png"), title="Budget burn (% of budget, cumulative)",
+        xlabel="Week", ylabel="% of budget", rotation=90, legend_title="Project", max_ticks=26, marker=None,
+        figsize=(10, 5)))
+    if pdf.get_y() > 170:
         pdf.add_page()
-        if os.path.exists(logo_path_inner):
-            pdf.image(logo_path_inner, x=10, y=10, w=30)
-        pdf.ln(40)
-        pdf.cell(0, 10, title, ln=True, align='C')
-        pdf.set_font("helvetica", '', 12)
-        pdf.ln(5)
-        pdf.cell(0, 10, f"Generated on: {today_str}", ln=True, align='C')
-        pdf.ln(10)
-        pdf.set_font("helvetica", '', 11)
-
-        for key, value in config_info.items():
-            if key == "Months" and value != "All":
-                pdf.ln(5)
-                pdf.set_font("helvetica", 'B', 11)
-                pdf.cell(0, 10, "Months:", ln=True, align='L')
-                pdf.set_font("helvetica", '', 11)
-                months = value.split(', ')
-                col_width = 60
-                cols = 3
-                row_height = 7
-                x_start = pdf.get_x()
-                y_start = pdf.get_y()
-
-                for i, m in enumerate(months):
-                    col = i % cols
-                    row = i // cols
-                    x = x_start + col * col_width
-                    y = y_start + row * row_height
-                    pdf.set_xy(x, y)
-                    pdf.cell(col_width, row_height, f"{i + 1}. {m}", ln=0)
-                pdf.ln((len(months) // cols + 1) * row_height + 2)
-                
-            elif key == "Projects Included" and value != "No projects selected or found":
-                pdf.ln(5)
-                pdf.set_font("helvetica", 'B', 11)
-                pdf.cell(0, 10, "Projects:", ln=True, align='L')
-                pdf.set_font("helvetica", '', 11)
-                projects = value.split(', ')
-                col_width = 60  # Width per column
-                cols = 3        # Number of columns
-                row_height = 7
-                x_start = pdf.get_x()
-                y_start = pdf.get_y()
-
-                for i, p in enumerate(projects):
-                    col = i % cols
-                    row = i // cols
-                    x = x_start + col * col_width
-                    y = y_start + row * row_height
-                    pdf.set_xy(x, y)
-                    pdf.cell(col_width, row_height, f"{i + 1}. {p}", ln=0)
-
-                pdf.ln((len(projects) // cols + 1) * row_height + 2)  # Move cursor below the block
-            else:
-                pdf.cell(0, 7, f"{key}: {value}", ln=True, align='C')
-
-        for img_path, chart_title, page_project_name in charts_data:
-            if img_path and os.path.exists(img_path):
-                pdf.add_page()
-                if os.path.exists(logo_path_inner):
-                    pdf.image(logo_path_inner, x=10, y=8, w=25)
-                pdf.set_font("helvetica", 'B', 11)
-                pdf.set_y(35)
-                if page_project_name:
-                    pdf.cell(0, 10, f"Project: {page_project_name}", ln=True, align='C')
-                pdf.cell(0, 10, chart_title, ln=True, align='C')
-                pdf.image(img_path, x=10, y=45, w=190)
+        pdf.set_y(35)
+    pdf.ln(4)
+    pdf.image(img_path, x=10, w=190)
+    os.remove(img_path)
+
+@tracing.traced('pdf')
+def export_pdf_report(df, config, pdf_report_path, logo_path, pdf_options=None, progress_callback=None, budget_burn=None):
+    """Xuất báo cáo PDF tiêu chuẩn với các biểu đồ (bố cục và nén ảnh theo `pdf_options`).
+
+    PDF được ghi theo luồng: mỗi dự án được vẽ biểu đồ, thêm trang rồi xóa ảnh trước khi sang dự án kế tiếp,
+    nên bộ nhớ và dung lượng đĩa tạm không tăng theo số dự án.
+    `progress_callback(pages_done, projects_done, total_projects)` được gọi sau mỗi trang hoàn tất.
+    Khi có ngân sách dự án (`budget_burn` hoặc config['budget_df']), một trang Budget vs Actual được thêm sau trang tổng.
+    """
+    from chart_renderer import ChartRenderer
+    from streaming_pdf import StreamingFPDF
 
-        pdf.output(output_path, "F")
-        print(f"DEBUG: PDF report generated at {output_path}")
+    tmp_dir = tempfile.mkdtemp()
+    options = get_pdf_options(pdf_options)
 
     try:
-        projects = df['Project name'].unique()
+        project_groups = df.groupby('Project name', sort=False)
+        progress = {'projects_done': 0, 'total_projects': project_groups.ngroups}
+
+        def on_page_end(page_number):
+            if progress_callback:
+                progress_callback(page_number, progress['projects_done'], progress['total_projects'])
 
         config_info = {
             "Mode": config.get('mode', 'N/A').capitalize(),
@@ -311,67 +1123,59 @@ def export_pdf_report(df, config, pdf_report_path, logo_path):
             "Projects Included": ', '.join(config['project_filter_df']['Project Name']) if 'project_filter_df' in config and not config['project_filter_df'].empty else "No projects selected or found"
         }
 
-        plt.rcParams['font.family'] = 'sans-serif'
-        plt.rcParams['font.sans-serif'] = ['Arial', 'Helvetica', 'Liberation Sans']
-        plt.rcParams['axes.unicode_minus'] = False
+        renderer = ChartRenderer(dpi=pdf_chart_dpi(options, fig_width_in=10))
+        logo_for_pdf = prepare_pdf_logo(logo_path, tmp_dir, options)
 
-        for project in projects:
+        pdf = StreamingFPDF(spool_dir=tmp_dir, on_page_end=on_page_end)
+        pdf.set_auto_page_break(auto=True, margin=15)
+        add_cover_page(pdf, "TRIAC TIME REPORT - STANDARD", config_info, logo_for_pdf)
+        if options['include_totals_table']:
+            add_project_totals_page(pdf, df, logo_for_pdf)
+        budget_burn = budget_burn_for_report(df, config, budget_burn)
+        if budget_burn:
+            add_budget_burn_page(pdf, budget_burn, logo_for_pdf, renderer, tmp_dir)
+
+        slot_index = 0
+        charts_count = 0
+        for project, df_proj in project_groups:
             safe_project = sanitize_filename(project)
-            df_proj = df[df['Project name'] == project]
+            project_charts = []
 
             if 'Workcentre' in df_proj.columns and not df_proj['Workcentre'].empty:
                 workcentre_summary = df_proj.groupby('Workcentre')['Hours'].sum().sort_values(ascending=False)
                 if not workcentre_summary.empty and workcentre_summary.sum() > 0:
-                    fig, ax = plt.subplots(figsize=(10, 5))
-                    workcentre_summary.plot(kind='barh', color='skyblue', ax=ax)
-                    ax.set_title(f"{project} - Hours by Workcentre", fontsize=9)
-                    ax.tick_params(axis='y', labelsize=8)
-                    ax.set_xlabel("Hours")
-                    ax.set_ylabel("Workcentre")
-                    # ➕ Thêm nhãn số giờ
-                for container in ax.containers:
-                    ax.bar_label(container, fmt='%.1f', label_type='edge', fontsize=8, padding=3)
-                    wc_img_path = os.path.join(tmp_dir, f"{safe_project}_wc.png")
-                    plt.tight_layout()
-                    fig.savefig(wc_img_path, dpi=150)
-                    plt.close(fig)
-                    charts_for_pdf.append((wc_img_path, f"{project} - Hours by Workcentre", project))
+                    wc_img_path = compress_chart_image(renderer.barh(
+                        workcentre_summary, os.path.join(tmp_dir, f"{safe_project}_wc.png"),
+                        title=f"{project} - Hours by Workcentre", xlabel="Hours", ylabel="Workcentre",
+                        color='skyblue', figsize=(10, 5)
+                    ))
+                    project_charts.append((wc_img_path, f"{project} - Hours by Workcentre", project))
 
             if 'Task' in df_proj.columns and not df_proj['Task'].empty:
                 task_summary = df_proj.groupby('Task')['Hours'].sum().sort_values(ascending=False)
                 if not task_summary.empty and task_summary.sum() > 0:
-                    fig, ax = plt.subplots(figsize=(10, 6))
-                    task_summary.plot(kind='barh', color='lightgreen', ax=ax)
-                    ax.set_title(f"{project} - Hours by Task", fontsize=9)
-                    ax.tick_params(axis='y', labelsize=8)
-                    ax.set_xlabel("Hours")
-                    ax.set_ylabel("Task")
-                    # ➕ Thêm nhãn số giờ
-                for container in ax.containers:
-                    ax.bar_label(container, fmt='%.1f', label_type='edge', fontsize=8, padding=3)
-                    task_img_path = os.path.join(tmp_dir, f"{safe_project}_task.png")
-                    plt.tight_layout()
-                    fig.savefig(task_img_path, dpi=150)
-                    plt.close(fig)
-                    charts_for_pdf.append((task_img_path, f"{project} - Hours by Task", project))
-
-        if not charts_for_pdf:
+                    task_img_path = compress_chart_image(renderer.barh(
+                        task_summary, os.path.join(tmp_dir, f"{safe_project}_task.png"),
+                        title=f"{project} - Hours by Task", xlabel="Hours", ylabel="Task",
+                        color='lightgreen', figsize=(10, 6)
+                    ))
+                    project_charts.append((task_img_path, f"{project} - Hours by Task", project))
+
+            # Ghi trang của dự án này rồi xóa ảnh ngay (dữ liệu ảnh đã nằm trong PDF/spool)
+            slot_index = add_chart_pages(pdf, project_charts, logo_for_pdf, options, slot_index)
+            for img_path, _, _ in project_charts:
+                os.remove(img_path)
+            charts_count += len(project_charts)
+            progress['projects_done'] += 1
+
+        tracing.log_event(renderer.timing_summary())
+
+        if not charts_count:
             print("Cảnh báo: Không có biểu đồ nào được tạo để đưa vào PDF. PDF có thể trống.")
-            pdf = FPDF()
-            pdf.add_page()
-            pdf.set_font('helvetica', 'B', 16)
-            pdf.cell(0, 10, "TRIAC TIME REPORT - STANDARD", ln=True, align='C')
-            pdf.set_font("helvetica", '', 12)
-            pdf.cell(0, 10, f"Generated on: {today_str}", ln=True, align='C')
-            pdf.ln(10)
-            pdf.set_font("helvetica", '', 11)
-            for key, value in config_info.items():
-                pdf.cell(0, 7, f"{key}: {value}", ln=True, align='C')
             pdf.cell(0, 10, "No charts generated for this report.", ln=True, align='C')
-            pdf.output(pdf_report_path, "F")
-            return True
 
-        create_pdf_from_charts(charts_for_pdf, pdf_report_path, "TRIAC TIME REPORT - STANDARD", config_info, logo_path)
+        pdf.output(pdf_report_path, "F")
+        tracing.log_event("PDF report generated", path=pdf_report_path, pages=pdf.page)
         return True
     except Exception as e:
         print(f"Lỗi khi tạo báo cáo PDF: {e}")
@@ -380,108 +1184,861 @@ def export_pdf_report(df, config, pdf_report_path, logo_path):
         if os.path.exists(tmp_dir):
             shutil.rmtree(tmp_dir)
 
+@tracing.traced('aggregate')
+def build_task_week_heatmaps(df):
+    """Tổng giờ Task x tuần ISO cho từng dự án ở dạng thưa (tọa độ COO), không dựng ma trận dày.
+
+    Trả về dict dự án -> {'tasks', 'weeks', 'rows', 'cols', 'hours'}: `tasks` xếp theo tổng giờ giảm dần,
+    `weeks` là các tuần liên tục (thứ Hai) từ tuần đầu đến tuần cuối của dự án, và ba mảng numpy
+    rows/cols/hours chỉ chứa các ô khác 0. Bộ nhớ tỉ lệ với số ô có dữ liệu, không với số task x số tuần.
+    """
+    if df.empty:
+        return {}
+    week_start = (df['Date'] - pd.to_timedelta(df['Date'].dt.weekday, unit='D')).dt.normalize().rename('Week Start')
+    coo = df.groupby(['Project name', 'Task', week_start], sort=False, observed=True)['Hours'].sum()
+    coo = coo[coo != 0].reset_index()
+
+    heatmaps = {}
+    for project, cells in coo.groupby('Project name', sort=False):
+        task_totals = cells.groupby('Task')['Hours'].sum().sort_values(ascending=False)
+        first_week = cells['Week Start'].min()
+        heatmaps[project] = {
+            'tasks': task_totals.index,
+            'task_totals': task_totals.to_numpy(),
+            'weeks': pd.date_range(first_week, cells['Week Start'].max(), freq='W-MON'),
+            'rows': task_totals.index.get_indexer(cells['Task']),
+            'cols': ((cells['Week Start'] - first_week).dt.days // 7).to_numpy(),
+            'hours': cells['Hours'].to_numpy(dtype=float),
+        }
+    return heatmaps
+
+def iso_week_labels(weeks):
+    """Nhãn 'YYYY-Www' cho các ngày đầu tuần."""
+    iso = weeks.isocalendar()
+    return (iso['year'].astype(str) + '-W' + iso['week'].astype(str).str.zfill(2)).tolist()
+
+def heatmap_image_matrix(heatmap, max_tasks=40):
+    """Ma trận dày nhỏ để vẽ ảnh: giữ `max_tasks` task lớn nhất, phần còn lại gộp vào hàng 'Other'."""
+    import numpy as np
+
+    n_tasks = len(heatmap['tasks'])
+    keep = min(n_tasks, max_tasks)
+    rows = np.minimum(heatmap['rows'], keep) if n_tasks > max_tasks else heatmap['rows']
+    labels = list(heatmap['tasks'][:keep]) + (['Other'] if n_tasks > max_tasks else [])
+    matrix = np.zeros((len(labels), len(heatmap['weeks'])), dtype=np.float32)
+    np.add.at(matrix, (rows, heatmap['cols']), heatmap['hours'])
+    return matrix, labels
+
+@tracing.traced('excel')
+def export_heatmap_report(df, output_file_path, heatmaps=None):
+    """Xuất ma trận Task x tuần ISO của từng dự án ra Excel, tô màu theo số giờ (chỉ ghi các ô có dữ liệu)."""
+    from openpyxl import Workbook
+    from openpyxl.formatting.rule import ColorScaleRule
+    from openpyxl.styles import Font
+    from openpyxl.utils import get_column_letter
+
+    heatmaps = build_task_week_heatmaps(df) if heatmaps is None else heatmaps
+    if not heatmaps:
+        print("Cảnh báo: Không có dữ liệu để tạo heatmap.")
+        return False
+
+    try:
+        wb = Workbook()
+        wb.remove(wb.active)
+        used_titles = set()
+        for project, heatmap in heatmaps.items():
+            base_title = f"HM {sanitize_filename(str(project))}"[:31]
+            title, n = base_title, 1
+            while title in used_titles:
+                n += 1
+                title = f"{base_title[:28]}_{n}"
+            used_titles.add(title)
+            ws = wb.create_sheet(title)
+
+            week_labels = iso_week_labels(heatmap['weeks'])
+            ws.append(['Task', 'Total'] + week_labels)
+            for cell in ws[1]:
+                cell.font = Font(bold=True)
+            for task, total in zip(heatmap['tasks'], heatmap['task_totals']):
+                ws.append([task, round(float(total), 1)])
+            # Chỉ ghi các ô khác 0 từ tọa độ thưa; ô trống không tốn bộ nhớ trong openpyxl
+            for r, c, hours in zip(heatmap['rows'].tolist(), heatmap['cols'].tolist(), heatmap['hours'].tolist()):
+                ws.cell(row=r + 2, column=c + 3, value=round(hours, 1))
+
+            last_row = len(heatmap['tasks']) + 1
+            last_col = get_column_letter(len(week_labels) + 2)
+            ws.conditional_formatting.add(
+                f"C2:{last_col}{last_row}",
+                ColorScaleRule(start_type='min', start_color='FFF2CC', mid_type='percentile', mid_value=50,
+                               mid_color='F4B183', end_type='max', end_color='C00000')
+            )
+            ws.freeze_panes = 'C2'
+            ws.column_dimensions['A'].width = 30
+        wb.save(output_file_path)
+        return True
+    except Exception as e:
+        print(f"Lỗi khi xuất heatmap ra Excel: {e}")
+        return False
+
+@tracing.traced('pdf')
+def export_heatmap_pdf_report(df, pdf_report_path, logo_path, pdf_options=None, heatmaps=None, max_tasks=40):
+    """Xuất heatmap Task x tuần ISO của từng dự án ra PDF (mỗi dự án một ảnh, ghi theo luồng như báo cáo tiêu chuẩn)."""
+    from chart_renderer import ChartRenderer
+    from streaming_pdf import StreamingFPDF
+
+    heatmaps = build_task_week_heatmaps(df) if heatmaps is None else heatmaps
+    if not heatmaps:
+        print("Cảnh báo: Không có dữ liệu để tạo heatmap.")
+        return False
+
+    tmp_dir = tempfile.mkdtemp()
+    options = get_pdf_options(pdf_options)
+    try:
+        renderer = ChartRenderer(dpi=pdf_chart_dpi(options, fig_width_in=12))
+        logo_for_pdf = prepare_pdf_logo(logo_path, tmp_dir, options)
+        pdf = StreamingFPDF(spool_dir=tmp_dir)
+        pdf.set_auto_page_break(auto=True, margin=15)
+        add_cover_page(pdf, "TRIAC TIME REPORT - TASK x WEEK HEATMAP", {
+            "Projects": len(heatmaps),
+            "Weeks": f"{min(h['weeks'][0] for h in heatmaps.values()):%Y-%m-%d} - {max(h['weeks'][-1] for h in heatmaps.values()):%Y-%m-%d}",
+        }, logo_for_pdf)
+
+        slot_index = 0
+        for project, heatmap in heatmaps.items():
+            matrix, task_labels = heatmap_image_matrix(heatmap, max_tasks)
+            title = f"{project} - Hours by Task and ISO Week"
+            img_path = compress_chart_image(renderer.heatmap(
+                matrix, os.path.join(tmp_dir, f"{sanitize_filename(str(project))}_heatmap.png"),
+                task_labels, iso_week_labels(heatmap['weeks']), title=title, xlabel="ISO Week", ylabel="Task",
+                figsize=(12, max(4, min(10, 1.5 + 0.22 * len(task_labels))))
+            ))
+            slot_index = add_chart_pages(pdf, [(img_path, title, project)], logo_for_pdf, options, slot_index)
+            os.remove(img_path)
+
+        tracing.log_event(renderer.timing_summary())
+        pdf.output(pdf_report_path, "F")
+        return True
+    except Exception as e:
+        print(f"Lỗi khi tạo heatmap PDF: {e}")
+        return False
+    finally:
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir)
+
+TIMELINE_COLUMNS = ['Project name', 'First Date', 'Last Date', 'Duration Days', 'Active Weeks', 'Span Weeks',
+                    'Activity %', 'Total Hours', 'Peak Week', 'Peak Week Hours']
+
+@tracing.traced('aggregate')
+def build_project_timeline(df):
+    """Thời gian hoạt động của mọi dự án: ngày đầu/cuối có giờ, số tuần có giờ và tuần cao điểm.
+
+    Chỉ một lần groupby (dự án, tuần) trên dữ liệu thô; các chỉ số theo dự án được suy ra từ bảng tuần đã gộp
+    (nhỏ hơn nhiều), tuần cao điểm lấy bằng sắp xếp + drop_duplicates thay vì lặp theo dự án.
+    Trả về DataFrame với các cột TIMELINE_COLUMNS, sắp theo ngày bắt đầu.
+    """
+    if df.empty:
+        return pd.DataFrame(columns=TIMELINE_COLUMNS)
+    week_start = (df['Date'] - pd.to_timedelta(df['Date'].dt.weekday, unit='D')).dt.normalize().rename('Week Start')
+    # Bảng tuần được sắp theo (dự án, tuần) nên tuần đầu/cuối là phần tử đầu/cuối của mỗi nhóm
+    weekly = df.groupby(['Project name', week_start], observed=True).agg(
+        Hours=('Hours', 'sum'), First=('Date', 'min'), Last=('Date', 'max')).reset_index()
+
+    groups = weekly.groupby('Project name', sort=False)
+    timeline = groups.agg(
+        first=('First', 'first'), last=('Last', 'last'), first_week=('Week Start', 'first'), last_week=('Week Start', 'last'),
+        active=('Week Start', 'size'), hours=('Hours', 'sum'))
+    # Tuần cao điểm: tuần nhiều giờ nhất, nếu bằng nhau lấy tuần sớm hơn (idxmax trả về vị trí đầu tiên)
+    peak = weekly.loc[groups['Hours'].idxmax()].set_index('Project name')
+    span = (timeline['last_week'] - timeline['first_week']).dt.days // 7 + 1
+
+    result = pd.DataFrame({
+        'Project name': timeline.index,
+        'First Date': timeline['first'].dt.normalize().to_numpy(),
+        'Last Date': timeline['last'].dt.normalize().to_numpy(),
+        'Duration Days': ((timeline['last'].dt.normalize() - timeline['first'].dt.normalize()).dt.days + 1).to_numpy(),
+        'Active Weeks': timeline['active'].to_numpy(),
+        'Span Weeks': span.to_numpy(),
+        'Activity %': (timeline['active'] / span * 100).to_numpy(),
+        'Total Hours': timeline['hours'].to_numpy(),
+        'Peak Week': peak['Week Start'].reindex(timeline.index).to_numpy(),
+        'Peak Week Hours': peak['Hours'].reindex(timeline.index).to_numpy(),
+    })
+    return result.sort_values(['First Date', 'Project name']).reset_index(drop=True)
+
+@tracing.traced('excel')
+def export_timeline_report(df, output_file_path, timeline=None):
+    """Xuất bảng thời gian hoạt động dự án ra Excel kèm biểu đồ thanh ngang dạng Gantt gốc của Excel.
+
+    Biểu đồ là bar chart xếp chồng: chuỗi đầu (ngày bắt đầu) để trong suốt, chuỗi sau là số ngày hoạt động.
+    """
+    from openpyxl import Workbook
+    from openpyxl.styles import Font
+
+    timeline = build_project_timeline(df) if timeline is None else timeline
+    if timeline.empty:
+        print("Cảnh báo: Không có dữ liệu để tạo timeline dự án.")
+        return False
+
+    try:
+        wb = Workbook()
+        ws = wb.active
+        ws.title = "Timeline"
+        ws.append(TIMELINE_COLUMNS)
+        for cell in ws[1]:
+            cell.font = Font(bold=True)
+        rounded = timeline.round({'Activity %': 1, 'Total Hours': 1, 'Peak Week Hours': 1})
+        for row in dataframe_to_rows(rounded, index=False, header=False):
+            ws.append(row)
+        n = len(timeline)
+        for col in ('B', 'C', 'I'):
+            for (cell,) in ws[f"{col}2:{col}{n + 1}"]:
+                cell.number_format = 'yyyy-mm-dd'
+        ws.column_dimensions['A'].width = 30
+        ws.freeze_panes = 'B2'
+
+        chart = BarChart()
+        chart.type = 'bar'
+        chart.grouping = 'stacked'
+        chart.overlap = 100
+        chart.gapWidth = 40
+        chart.title = "Project Activity Timeline"
+        chart.add_data(Reference(ws, min_col=2, min_row=1, max_row=n + 1), titles_from_data=True)
+        chart.add_data(Reference(ws, min_col=4, min_row=1, max_row=n + 1), titles_from_data=True)
+        chart.set_categories(Reference(ws, min_col=1, min_row=2, max_row=n + 1))
+        chart.series[0].graphicalProperties.noFill = True
+        chart.series[0].graphicalProperties.line.noFill = True
+        chart.legend = None
+        # Trục giá trị là số seri ngày của Excel, bắt đầu từ ngày đầu tiên; dự án đầu tiên nằm trên cùng
+        excel_epoch = pd.Timestamp('1899-12-30')
+        chart.y_axis.scaling.min = (timeline['First Date'].min() - excel_epoch).days
+        chart.y_axis.scaling.max = (timeline['Last Date'].max() - excel_epoch).days + 1
+        chart.y_axis.number_format = 'yyyy-mm'
+        chart.y_axis.majorGridlines = None
+        chart.x_axis.scaling.orientation = 'maxMin'
+        chart.width = 28
+        chart.height = max(7.5, 0.5 * n + 3)
+        ws.add_chart(chart, "L2")
+
+        wb.save(output_file_path)
+        return True
+    except Exception as e:
+        print(f"Lỗi khi xuất timeline dự án ra Excel: {e}")
+        return False
+
+@tracing.traced('pdf')
+def export_timeline_pdf_report(df, pdf_report_path, logo_path, pdf_options=None, timeline=None, rows_per_chart=40):
+    """Xuất biểu đồ Gantt thời gian hoạt động dự án ra PDF, mỗi biểu đồ tối đa `rows_per_chart` dự án."""
+    from chart_renderer import ChartRenderer
+    from streaming_pdf import StreamingFPDF
+
+    timeline = build_project_timeline(df) if timeline is None else timeline
+    if timeline.empty:
+        print("Cảnh báo: Không có dữ liệu để tạo timeline dự án.")
+        return False
+
+    tmp_dir = tempfile.mkdtemp()
+    options = get_pdf_options(pdf_options)
+    try:
+        renderer = ChartRenderer(dpi=pdf_chart_dpi(options, fig_width_in=12))
+        logo_for_pdf = prepare_pdf_logo(logo_path, tmp_dir, options)
+        pdf = StreamingFPDF(spool_dir=tmp_dir)
+        pdf.set_auto_page_break(auto=True, margin=15)
+        add_cover_page(pdf, "TRIAC TIME REPORT - PROJECT TIMELINE", {
+            "Projects": len(timeline),
+            "Period": f"{timeline['First Date'].min():%Y-%m-%d} - {timeline['Last Date'].max():%Y-%m-%d}",
+        }, logo_for_pdf)
+
+        slot_index = 0
+        chunks = range(0, len(timeline), rows_per_chart)
+        for part, start in enumerate(chunks, start=1):
+            chunk = timeline.iloc[start:start + rows_per_chart]
+            title = "Project Activity Timeline" + (f" ({part}/{len(chunks)})" if len(chunks) > 1 else "")
+            img_path = compress_chart_image(renderer.gantt(
+                chunk['Project name'].tolist(), chunk['First Date'].to_numpy(), chunk['Last Date'].to_numpy(),
+                os.path.join(tmp_dir, f"timeline_{part}.png"),
+                markers=(chunk['Peak Week'] + pd.Timedelta(days=3)).to_numpy(), title=title, xlabel="Date",
+                figsize=(12, max(4, min(10, 1.5 + 0.22 * len(chunk))))
+            ))
+            slot_index = add_chart_pages(pdf, [(img_path, title, "All projects")], logo_for_pdf, options, slot_index)
+            os.remove(img_path)
+
+        tracing.log_event(renderer.timing_summary())
+        pdf.output(pdf_report_path, "F")
+        return True
+    except Exception as e:
+        print(f"Lỗi khi tạo timeline PDF: {e}")
+        return False
+    finally:
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir)
+
+MONTH_ORDER = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October', 'November', 'December']
+
+# Chiều so sánh -> cột dữ liệu. Các chiều thời gian dùng được cả làm hàng lẫn làm cột kỳ so sánh.
+COMPARISON_DIMENSIONS = {
+    'project': 'Project name',
+    'workcentre': 'Workcentre',
+    'task': 'Task',
+    'employee': 'Employee',
+    'year': 'Year',
+    'month': 'MonthName',
+    'year_month': 'Year-Month',
+    'week': 'ISO Week',
+    'quarter': 'Quarter',
+}
+
+# Tên chế độ so sánh (theo ngôn ngữ giao diện) -> khóa preset nội bộ
+COMPARISON_MODE_ALIASES = {
+    "So Sánh Dự Án Trong Một Tháng": 'projects_in_month',
+    "Compare Projects in a Month": 'projects_in_month',
+    "So Sánh Dự Án Trong Một Năm": 'projects_in_year',
+    "Compare Projects in a Year": 'projects_in_year',
+    "So Sánh Một Dự Án Qua Các Tháng/Năm": 'project_over_time',
+    "Compare One Project Over Time (Months/Years)": 'project_over_time',
+}
+
+def resolve_comparison_mode(comparison_mode):
+    """Trả về khóa preset nội bộ cho tên chế độ so sánh (tiếng Việt/Anh hoặc chính khóa), None nếu không hợp lệ."""
+    if comparison_mode in COMPARISON_MODE_ALIASES.values():
+        return comparison_mode
+    return COMPARISON_MODE_ALIASES.get(comparison_mode)
+
+@tracing.traced('filter')
+def filter_time_entries(df, years=None, months=None, projects=None):
+    """Lọc dữ liệu theo năm/tháng/dự án bằng một mặt nạ boolean duy nhất (không sao chép trung gian)."""
+    mask = pd.Series(True, index=df.index)
+    if years:
+        mask &= df['Year'].isin(years)
+    if months:
+        mask &= df['MonthName'].isin(months)
+    if projects:
+        mask &= df['Project name'].isin(projects)
+    return df[mask]
+
+def _comparison_key(df, dimension):
+    """Cột (Series) dùng để nhóm cho một chiều so sánh; các chiều thời gian phái sinh được tính từ 'Date'."""
+    if dimension not in COMPARISON_DIMENSIONS:
+        raise ValueError(f"Chiều so sánh không hợp lệ: {dimension}")
+    col = COMPARISON_DIMENSIONS[dimension]
+    if dimension == 'month':
+        # Categorical để tháng luôn theo thứ tự lịch
+        return pd.Categorical(df['MonthName'], categories=MONTH_ORDER, ordered=True)
+    if dimension == 'year_month':
+        return df['Date'].dt.to_period('M').astype(str).rename(col)
+    if dimension == 'week':
+        iso = df['Date'].dt.isocalendar()
+        return (iso['year'].astype(str) + '-W' + iso['week'].astype(str).str.zfill(2)).rename(col)
+    if dimension == 'quarter':
+        return df['Date'].dt.to_period('Q').astype(str).rename(col)
+    return df[col]
+
+# Cột được tìm kiếm chuỗi (không phân biệt hoa thường) và cột có bộ lọc trong màn hình xem trước dữ liệu
+PREVIEW_SEARCH_COLUMNS = ['Project name', 'Task', 'Employee']
+PREVIEW_FILTER_COLUMNS = ['Year', 'MonthName', 'Project name', 'Workcentre', 'Employee']
+
+# Chỉ số cho query(): tên -> (cột nguồn, hàm tổng hợp, tên cột kết quả)
+QUERY_MEASURES = {
+    'hours': ('Hours', 'sum', 'Hours'),
+    'entries': ('Hours', 'size', 'Entries'),
+    'avg_hours': ('Hours', 'mean', 'Avg Hours'),
+    'employees': ('Employee', 'nunique', 'Employees'),
+    'projects': ('Project name', 'nunique', 'Projects'),
+    'cost': ('Cost', 'sum', 'Cost'),  # Chỉ có khi dữ liệu đã qua apply_rates
+}
+
+def parse_query_period(period):
+    """Chuyển kỳ của query về (bắt đầu, kết thúc) kiểu Timestamp.
+
+    Nhận '2024', '2024-Q1' / '2024 Q1', '2024-03', '2024-W05' (tuần ISO), '2024-03-15' hoặc cặp (từ ngày, đến ngày).
+    """
+    if period is None:
+        return None
+    if isinstance(period, (tuple, list)):
+        start, end = pd.Timestamp(period[0]), pd.Timestamp(period[1])
+        return start.normalize(), end.normalize() + pd.Timedelta(days=1) - pd.Timedelta(1)
+    text = str(period).strip().upper().replace(' ', '')
+    iso_week = re.fullmatch(r'(\d{4})-?W(\d{1,2})', text)
+    if iso_week:
+        start = pd.Timestamp(datetime.date.fromisocalendar(int(iso_week.group(1)), int(iso_week.group(2)), 1))
+        return start, start + pd.Timedelta(days=7) - pd.Timedelta(1)
+    try:
+        parsed = pd.Period(text.replace('-Q', 'Q'))
+    except ValueError:
+        raise ValueError(f"Kỳ truy vấn không hợp lệ: {period}")
+    return parsed.start_time, parsed.end_time
+
+class TimeQuery:
+    """Truy vấn tổng hợp trên dữ liệu của load_raw_data, kết quả được nhớ trong LRU theo truy vấn đã chuẩn hóa.
+
+    Dữ liệu được coi là chỉ đọc: nếu DataFrame bị sửa tại chỗ, gọi clear() để bỏ kết quả cũ.
+    """
+
+    def __init__(self, df, maxsize=256, view_maxsize=16):
+        self.df = df
+        self.maxsize = maxsize
+        self.view_maxsize = view_maxsize
+        self._results = OrderedDict()
+        self._views = OrderedDict()  # Dữ liệu đã lọc (lớn hơn nhiều so với bảng tổng hợp) có LRU riêng, nhỏ hơn
+        self._keys = {}  # Cột nhóm/lọc phái sinh (tuần ISO, năm-tháng...) chỉ tính một lần
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, dimension):
+        with self._lock:
+            key = self._keys.get(dimension)
+        if key is None:
+            key = _comparison_key(self.df, dimension)
+            if not isinstance(key, pd.Series):
+                key = pd.Series(key, index=self.df.index, name=COMPARISON_DIMENSIONS[dimension])
+            with self._lock:
+                self._keys[dimension] = key
+        return key
+
+    @staticmethod
+    def normalize(dimensions=(), measures=('hours',), filters=None, period=None):
+        """Khóa chuẩn hóa của truy vấn: thứ tự giá trị lọc và cách viết kỳ không làm khác khóa."""
+        dimensions = (dimensions,) if isinstance(dimensions, str) else tuple(dimensions)
+        measures = (measures,) if isinstance(measures, str) else tuple(measures)
+        for dimension in dimensions:
+            if dimension not in COMPARISON_DIMENSIONS:
+                raise ValueError(f"Chiều truy vấn không hợp lệ: {dimension}")
+        for measure in measures:
+            if measure not in QUERY_MEASURES:
+                raise ValueError(f"Chỉ số truy vấn không hợp lệ: {measure}")
+        normalized_filters = []
+        for dimension, values in sorted((filters or {}).items()):
+            if dimension not in COMPARISON_DIMENSIONS:
+                raise ValueError(f"Chiều lọc không hợp lệ: {dimension}")
+            if values is None or (isinstance(values, (list, tuple, set)) and not values):
+                continue  # Bộ lọc rỗng = không lọc
+            values = [values] if pd.api.types.is_scalar(values) else values
+            normalized_filters.append((dimension, tuple(sorted(set(values), key=str))))
+        bounds = parse_query_period(period)
+        return dimensions, measures, tuple(normalized_filters), bounds
+
+    def query(self, dimensions=(), measures=('hours',), filters=None, period=None):
+        """Tổng hợp `measures` theo `dimensions` sau khi lọc theo `filters` {chiều: giá trị} và `period`.
+
+        Ví dụ: query(['workcentre'], filters={'project': ['X', 'Y']}, period='2024-Q1').
+        Trả về bản sao DataFrame (các chiều là cột); truy vấn lặp lại được lấy từ bộ nhớ đệm.
+        """
+        key = self.normalize(dimensions, measures, filters, period)
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                self.hits += 1
+                return self._results[key].copy()
+            self.misses += 1
+
+        result = self._compute(*key)
+        with self._lock:
+            self._results[key] = result
+            self._results.move_to_end(key)
+            while len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+        return result.copy()
+
+    @tracing.traced('aggregate', 'query')
+    def _compute(self, dimensions, measures, filters, bounds):
+        df = self.df
+        mask = pd.Series(True, index=df.index)
+        for dimension, values in filters:
+            mask &= self._key(dimension).isin(values)
+        if bounds is not None:
+            mask &= df['Date'].between(bounds[0], bounds[1])
+
+        aggregations = {QUERY_MEASURES[m][2]: (QUERY_MEASURES[m][0], QUERY_MEASURES[m][1]) for m in measures}
+        selected = df.loc[mask, list({source for source, _ in aggregations.values()})]
+        if not dimensions:
+            return pd.DataFrame({name: [selected[source].agg(func)] for name, (source, func) in aggregations.items()})
+        group_keys = [self._key(d)[mask] for d in dimensions]
+        result = selected.groupby(group_keys, observed=True).agg(**aggregations).reset_index()
+        return result
+
+    @staticmethod
+    def selection_key(*selections):
+        """Chuẩn hóa các lựa chọn (danh sách năm/tháng/dự án...): thứ tự và phần tử trùng không làm khác khóa."""
+        return tuple(tuple(sorted(set(v), key=str)) if isinstance(v, (list, tuple, set)) else v for v in selections)
+
+    def _memo(self, store, maxsize, key, builder):
+        with self._lock:
+            if key in store:
+                store.move_to_end(key)
+                self.hits += 1
+                return store[key]
+            self.misses += 1
+        value = builder()
+        with self._lock:
+            store[key] = value
+            store.move_to_end(key)
+            while len(store) > maxsize:
+                store.popitem(last=False)
+        return value
+
+    def view(self, years=None, months=None, projects=None):
+        """Dữ liệu đã lọc theo năm/tháng/dự án (như filter_time_entries), nhớ trong LRU theo lựa chọn đã chuẩn hóa.
+
+        Trả về khung nhìn chỉ đọc (read_only_view) nên nhiều phiên dùng chung một kết quả mà không sửa được nó.
+        """
+        key = self.selection_key(years or (), months or (), projects or ())
+        return read_only_view(self._memo(self._views, self.view_maxsize, key,
+                                         lambda: filter_time_entries(self.df, years, months, projects)))
+
+    def memo(self, key, builder):
+        """Nhớ kết quả tổng hợp bất kỳ `builder()` theo `key` (dùng selection_key để chuẩn hóa) trong LRU truy vấn.
+
+        DataFrame trong kết quả (kể cả trong tuple/dict) được trả về dưới dạng khung nhìn chỉ đọc.
+        """
+        value = self._memo(self._results, self.maxsize, ('memo',) + tuple(key), builder)
+        as_view = lambda v: read_only_view(v) if isinstance(v, pd.DataFrame) else v
+        if isinstance(value, tuple):
+            return tuple(as_view(v) for v in value)
+        if isinstance(value, dict):
+            return {k: as_view(v) for k, v in value.items()}
+        return as_view(value)
+
+    def _codes(self, column):
+        """Chỉ mục của một cột cho preview: (mã số nguyên của từng dòng, giá trị duy nhất), tính một lần."""
+        with self._lock:
+            index = self._keys.get(('codes', column))
+        if index is None:
+            codes, uniques = pd.factorize(self.df[column])
+            index = (codes, uniques)
+            with self._lock:
+                self._keys[('codes', column)] = index
+        return index
+
+    def _preview_order(self):
+        """Thứ tự dòng của preview (ngày mới nhất trước), tính một lần."""
+        with self._lock:
+            order = self._keys.get('preview_order')
+        if order is None:
+            import numpy as np
+            order = np.argsort(-self.df['Date'].to_numpy().astype('datetime64[ns]').view('int64'), kind='stable')
+            with self._lock:
+                self._keys['preview_order'] = order
+        return order
+
+    def build_preview_index(self):
+        """Tính trước thứ tự dòng và chỉ mục các cột lọc/tìm kiếm, để trang preview đầu tiên không phải chờ."""
+        self._preview_order()
+        for column in dict.fromkeys(PREVIEW_FILTER_COLUMNS + PREVIEW_SEARCH_COLUMNS):
+            if column in self.df.columns:
+                self._codes(column)
+
+    def preview_options(self, column):
+        """Các giá trị (đã sắp xếp) để lọc cột `column` trong preview."""
+        return sorted(self._codes(column)[1].tolist(), key=str)
+
+    def _preview_rows(self, filters, search):
+        import numpy as np
+
+        mask = np.ones(len(self.df), dtype=bool)
+        for column, values in filters:
+            codes, uniques = self._codes(column)
+            # Bảng tra theo mã: chỉ so sánh trên các giá trị duy nhất rồi ánh xạ về từng dòng (mã -1 = trống -> False)
+            lookup = np.append(uniques.isin(values), False)
+            mask &= lookup[codes]
+        if search:
+            matched = np.zeros(len(self.df), dtype=bool)
+            for column in PREVIEW_SEARCH_COLUMNS:
+                if column not in self.df.columns:
+                    continue
+                codes, uniques = self._codes(column)
+                lookup = np.append(pd.Index(uniques.astype(str)).str.lower().str.contains(search, regex=False), False)
+                matched |= lookup[codes]
+            mask &= matched
+        order = self._preview_order()
+        return order[mask[order]]
+
+    def preview(self, filters=None, search=None, page=1, page_size=100):
+        """Một trang dữ liệu thô cho màn hình xem trước, lọc theo cột và tìm chuỗi trong PREVIEW_SEARCH_COLUMNS.
+
+        `filters` là dict cột -> danh sách giá trị. Vị trí các dòng khớp (mảng tới len(df) phần tử) được nhớ theo
+        lựa chọn đã chuẩn hóa trong LRU nhỏ của dữ liệu đã lọc (`view_maxsize`), nên chuyển trang chỉ cắt mảng
+        vị trí và lấy đúng `page_size` dòng.
+        Trả về dict: 'rows' (DataFrame của trang), 'total' (số dòng khớp), 'page', 'pages'.
+        """
+        filters = tuple((column, tuple(sorted(set(values), key=str))) for column, values in sorted((filters or {}).items()) if values)
+        search = (search or '').strip().lower()
+        positions = self._memo(self._views, self.view_maxsize, ('preview', filters, search),
+                               lambda: self._preview_rows(filters, search))
+        total = len(positions)
+        pages = max(1, -(-total // page_size))
+        page = min(max(1, int(page)), pages)
+        rows = self.df.iloc[positions[(page - 1) * page_size:page * page_size]]
+        return {'rows': rows, 'total': total, 'page': page, 'pages': pages}
+
+    def cache_info(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._results), 'maxsize': self.maxsize,
+                    'views': len(self._views), 'view_maxsize': self.view_maxsize}
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+            self._views.clear()
+            self._keys.clear()
+
+    def memory_entries(self):
+        """Các mục đang nhớ dạng (khóa, giá trị), cũ nhất trước: chỉ mục/cột phái sinh, dữ liệu đã lọc, kết quả truy vấn."""
+        with self._lock:
+            return ([(('index', k), v) for k, v in self._keys.items()] +
+                    [(('view', k), v) for k, v in self._views.items()] +
+                    [(('result', k), v) for k, v in self._results.items()])
+
+    def evict(self, entry_key):
+        """Bỏ một mục (khóa từ memory_entries); mục bị bỏ sẽ được tính lại khi cần."""
+        kind, key = entry_key
+        store = {'index': self._keys, 'view': self._views, 'result': self._results}[kind]
+        with self._lock:
+            store.pop(key, None)
+
+# Bộ máy truy vấn theo từng DataFrame (giữ tối đa vài bộ dữ liệu gần nhất)
+_QUERY_ENGINES = OrderedDict()
+_QUERY_ENGINES_MAX = 4
+_query_engines_lock = threading.Lock()
+
+def get_time_query(df):
+    """TimeQuery dùng chung cho DataFrame `df` (cùng đối tượng -> cùng bộ nhớ đệm)."""
+    with _query_engines_lock:
+        engine = _QUERY_ENGINES.get(id(df))
+        if engine is None or engine.df is not df:
+            engine = TimeQuery(df)
+            _QUERY_ENGINES[id(df)] = engine
+        _QUERY_ENGINES.move_to_end(id(df))
+        while len(_QUERY_ENGINES) > _QUERY_ENGINES_MAX:
+            _QUERY_ENGINES.popitem(last=False)
+        return engine
+
+def time_query_engines():
+    """Các TimeQuery đang giữ (để thống kê/giải phóng bộ nhớ)."""
+    with _query_engines_lock:
+        return list(_QUERY_ENGINES.values())
+
+def query(df, dimensions=(), measures=('hours',), filters=None, period=None):
+    """Truy vấn tổng hợp có ghi nhớ trên `df` (xem TimeQuery.query)."""
+    return get_time_query(df).query(dimensions, measures, filters, period)
+
+def build_preview_index(df):
+    """Tính trước chỉ mục xem trước cho `df` (xem TimeQuery.build_preview_index)."""
+    get_time_query(df).build_preview_index()
+
+def preview(df, filters=None, search=None, page=1, page_size=100):
+    """Một trang dữ liệu `df` đã lọc/tìm kiếm cho màn hình xem trước (xem TimeQuery.preview)."""
+    return get_time_query(df).preview(filters, search, page, page_size)
+
+def preview_options(df, column):
+    """Các giá trị để lọc cột `column` trong màn hình xem trước (xem TimeQuery.preview_options)."""
+    return get_time_query(df).preview_options(column)
+
+def filtered_view(df, years=None, months=None, projects=None):
+    """Dữ liệu `df` đã lọc, có ghi nhớ theo lựa chọn (xem TimeQuery.view)."""
+    return get_time_query(df).view(years, months, projects)
+
+def memoized(df, key, builder):
+    """Kết quả tổng hợp trên `df` có ghi nhớ theo `key` (xem TimeQuery.memo)."""
+    return get_time_query(df).memo(key, builder)
+
+@tracing.traced('aggregate')
+def build_comparison_matrix(df, rows, columns=None, value='Hours', totals=True):
+    """Ma trận so sánh: hàng theo các chiều `rows`, cột theo chiều kỳ `columns` (hoặc một cột tổng).
+
+    Tính bằng một lần groupby/unstack; thêm cột 'Total Hours', cột 'Total Cost' khi dữ liệu có cột Cost
+    (xem apply_rates) và (nếu `totals`) hàng 'Total'.
+    """
+    rows = list(rows)
+    row_cols = [COMPARISON_DIMENSIONS[d] for d in rows]
+    keys = [_comparison_key(df, d) for d in rows]
+
+    if columns:
+        period_col = COMPARISON_DIMENSIONS[columns]
+        keys.append(_comparison_key(df, columns))
+        matrix = df.groupby(keys, observed=True)[value].sum()
+        matrix.index.names = row_cols + [period_col]
+        matrix = matrix.unstack(period_col, fill_value=0)
+        matrix.columns = [str(c) for c in matrix.columns]
+        period_cols = list(matrix.columns)
+        matrix['Total Hours'] = matrix[period_cols].sum(axis=1)
+    else:
+        matrix = df.groupby(keys, observed=True)[value].sum().to_frame('Total Hours')
+        matrix.index.names = row_cols
+        period_cols = []
+    if value == 'Hours' and 'Cost' in df.columns:
+        cost = df.groupby(keys[:len(row_cols)], observed=True)['Cost'].sum()
+        cost.index.names = row_cols
+        matrix['Total Cost'] = cost.reindex(matrix.index)
+
+    matrix = matrix.reset_index()
+    for col in row_cols:
+        # Bỏ kiểu Categorical để có thể thêm hàng 'Total'
+        if isinstance(matrix[col].dtype, pd.CategoricalDtype):
+            matrix[col] = matrix[col].astype(str)
+
+    if totals and not matrix.empty:
+        total_row = matrix[period_cols + [c for c in ('Total Hours', 'Total Cost') if c in matrix.columns]].sum()
+        total_row[row_cols[0]] = 'Total'
+        matrix.loc[len(matrix)] = total_row
+    return matrix
+
+# Kỳ -> (tần suất pandas, số kỳ lùi về cùng kỳ năm trước); tuần so với cùng tuần ISO của năm ISO trước
+# (năm ISO có 52 hoặc 53 tuần nên không lùi một số kỳ cố định)
+TREND_PERIODS = {
+    'year_month': ('M', 12),
+    'week': ('W', None),
+    'year': ('Y', 1),
+}
+
+@tracing.traced('aggregate')
+def build_period_trends(df, rows=('project',), period='year_month', windows=(3, 12), value='Hours'):
+    """Chênh lệch so với kỳ trước / cùng kỳ năm trước và trung bình trượt cho mọi đối tượng cùng lúc.
+
+    Dữ liệu được đưa về ma trận (đối tượng x kỳ liên tục, kỳ thiếu = 0) và mọi phép tính là phép toán mảng numpy
+    theo trục kỳ, không lặp theo từng dự án. Với kỳ tuần, cùng kỳ năm trước là cùng số tuần ISO của năm ISO
+    trước (tuần 53 không có tuần tương ứng thì để trống). Trả về bảng dạng dài: một hàng cho mỗi (đối tượng, kỳ).
+    """
+    import numpy as np
+
+    if period not in TREND_PERIODS:
+        raise ValueError(f"Kỳ phân tích xu hướng không hợp lệ: {period}")
+    freq, season = TREND_PERIODS[period]
+    row_cols = [COMPARISON_DIMENSIONS[d] for d in rows]
+    if df.empty:
+        return pd.DataFrame(columns=row_cols + ['Period', 'Period Start', value])
+
+    period_key = df['Date'].dt.to_period(freq).rename('Period')
+    wide = df.groupby(row_cols + [period_key])[value].sum().unstack('Period', fill_value=0)
+    full_range = pd.period_range(wide.columns.min(), wide.columns.max(), freq=freq)
+    wide = wide.reindex(columns=full_range, fill_value=0)
+
+    values = wide.to_numpy(dtype=float)
+    n_rows, n_periods = values.shape
+    starts = full_range.start_time
+    iso = starts.isocalendar() if period == 'week' else None
+
+    def shifted(lag):
+        out = np.full_like(values, np.nan)
+        if lag < n_periods:
+            out[:, lag:] = values[:, :n_periods - lag]
+        return out
+
+    def pct_change(delta, base):
+        return np.divide(delta * 100, base, out=np.full_like(delta, np.nan), where=(base != 0) & ~np.isnan(base))
+
+    prev = shifted(1)
+    if period == 'week':
+        # Vị trí của (năm ISO - 1, cùng tuần) trong dãy tuần; không có thì NaN
+        iso_year, iso_week = iso['year'].to_numpy(dtype=np.int64), iso['week'].to_numpy(dtype=np.int64)
+        positions = pd.Series(np.arange(n_periods), index=pd.MultiIndex.from_arrays([iso_year, iso_week]))
+        source = positions.reindex(pd.MultiIndex.from_arrays([iso_year - 1, iso_week])).to_numpy()
+        found = ~np.isnan(source)
+        last_year = np.full_like(values, np.nan)
+        last_year[:, found] = values[:, source[found].astype(np.int64)]
+    else:
+        last_year = shifted(season)
+    measures = {
+        value: values,
+        'Delta Prev': values - prev,
+        'Delta Prev %': pct_change(values - prev, prev),
+        'Delta YoY': values - last_year,
+        'Delta YoY %': pct_change(values - last_year, last_year),
+    }
+    cumulative = np.concatenate([np.zeros((n_rows, 1)), np.cumsum(values, axis=1)], axis=1)
+    for window in windows:
+        rolling = np.full_like(values, np.nan)
+        if window <= n_periods:
+            rolling[:, window - 1:] = (cumulative[:, window:] - cumulative[:, :n_periods - window + 1]) / window
+        measures[f'Rolling Mean {window}'] = rolling
+
+    # Trải phẳng ma trận về dạng dài (đối tượng lặp theo số kỳ, kỳ lặp theo số đối tượng)
+    index_frame = wide.index.to_frame(index=False)
+    trends = index_frame.loc[index_frame.index.repeat(n_periods)].reset_index(drop=True)
+    if period == 'week':
+        labels = iso['year'].astype(str) + '-W' + iso['week'].astype(str).str.zfill(2)
+    else:
+        labels = full_range.astype(str)
+    trends['Period'] = np.tile(np.asarray(labels, dtype=object), n_rows)
+    trends['Period Start'] = np.tile(starts.to_numpy(), n_rows)
+    for name, matrix in measures.items():
+        trends[name] = matrix.ravel()
+    return trends
+
+def apply_comparison_trends(df_raw, comparison_config, rows=('project',), period='year_month'):
+    """Bảng xu hướng cho báo cáo so sánh: tính trên toàn bộ lịch sử của các dự án đã chọn
+    (để có cùng kỳ năm trước), rồi chỉ giữ các kỳ thuộc năm/tháng đã chọn."""
+    years = comparison_config.get('years', [])
+    months = comparison_config.get('months', [])
+    df_projects = filter_time_entries(df_raw, projects=comparison_config.get('selected_projects', []))
+    trends = build_period_trends(df_projects, rows=rows, period=period)
+    if trends.empty:
+        return trends
+
+    period_start = trends['Period Start']
+    mask = pd.Series(True, index=trends.index)
+    if years:
+        mask &= period_start.dt.year.isin(years)
+    if months and period != 'year':
+        mask &= period_start.dt.month_name().isin(months)
+    return trends[mask].reset_index(drop=True)
+
 def apply_comparison_filters(df_raw, comparison_config, comparison_mode):
-    print("DEBUG: apply_comparison_filters called with:")
+    """Áp dụng bộ lọc và tạo DataFrame tóm tắt cho báo cáo so sánh (các chế độ là preset của build_comparison_matrix)."""
     if not isinstance(df_raw, pd.DataFrame):
-        return pd.DataFrame(), "Dữ liệu đầu vào không hợp lệ."    
-    print(f"  df_raw type: {type(df_raw)}")
-    print(f"  comparison_config type: {type(comparison_config)}")
-    print(f"  comparison_mode type: {type(comparison_mode)} value: {comparison_mode}")
-    """Áp dụng bộ lọc và tạo DataFrame tóm tắt cho báo cáo so sánh."""
+        return pd.DataFrame(), "Dữ liệu đầu vào không hợp lệ."
     years = comparison_config.get('years', [])
     months = comparison_config.get('months', [])
     selected_projects = comparison_config.get('selected_projects', [])
+    mode_key = resolve_comparison_mode(comparison_mode)
 
-    df_filtered = df_raw.copy()
-    df_filtered['Hours'] = pd.to_numeric(df_filtered['Hours'], errors='coerce').fillna(0)
-
-    if years:
-        df_filtered = df_filtered[df_filtered['Year'].isin(years)]
-    
-    if months:
-        df_filtered = df_filtered[df_filtered['MonthName'].isin(months)]
-    
-    if selected_projects:
-        df_filtered = df_filtered[df_filtered['Project name'].isin(selected_projects)]
-    else: 
+    if mode_key is None:
+        return pd.DataFrame(), "Chế độ so sánh không hợp lệ."
+    if not selected_projects:
         return pd.DataFrame(), "Vui lòng chọn ít nhất một dự án để so sánh."
 
+    df_filtered = filter_time_entries(df_raw, years, months, selected_projects)
     if df_filtered.empty:
         return pd.DataFrame(), f"Không tìm thấy dữ liệu cho chế độ so sánh: {comparison_mode} với các lựa chọn hiện tại."
 
-    title = ""
-
-    if comparison_mode in ["So Sánh Dự Án Trong Một Tháng", "Compare Projects in a Month"]:
+    if mode_key == 'projects_in_month':
         if len(years) != 1 or len(months) != 1 or len(selected_projects) < 2:
             return pd.DataFrame(), "Vui lòng chọn MỘT năm, MỘT tháng và ít nhất HAI dự án cho chế độ này."
-        
-        df_comparison = df_filtered.groupby('Project name')['Hours'].sum().reset_index()
-        df_comparison.rename(columns={'Hours': 'Total Hours'}, inplace=True)
-        title = f"So sánh giờ giữa các dự án trong {months[0]}, năm {years[0]}"
-        return df_comparison, title
+        df_comparison = build_comparison_matrix(df_filtered, ['project'], totals=False)
+        return df_comparison, f"So sánh giờ giữa các dự án trong {months[0]}, năm {years[0]}"
 
-    elif comparison_mode in ["So Sánh Dự Án Trong Một Năm", "Compare Projects in a Year"]:
+    if mode_key == 'projects_in_year':
         if len(years) != 1 or len(selected_projects) < 2:
             return pd.DataFrame(), "Vui lòng chọn MỘT năm và ít nhất HAI dự án cho chế độ này."
-        
-        df_comparison = df_filtered.groupby(['Project name', 'MonthName'])['Hours'].sum().unstack(fill_value=0)
-        
-        month_order = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October', 'November', 'December']
-        existing_months = [m for m in month_order if m in df_comparison.columns]
-        df_comparison = df_comparison[existing_months]
-
-        df_comparison = df_comparison.reset_index().rename(columns={'index': 'Project Name'})
-        
-        df_comparison['Total Hours'] = df_comparison[existing_months].sum(axis=1)
-
-        df_comparison.loc['Total'] = df_comparison[existing_months + ['Total Hours']].sum()
-        df_comparison.loc['Total', 'Project Name'] = 'Total'
-
-        title = f"So sánh giờ giữa các dự án trong năm {years[0]} (theo tháng)"
-        return df_comparison, title
-
-    elif comparison_mode in ["So Sánh Một Dự Án Qua Các Tháng/Năm", "Compare One Project Over Time (Months/Years)"]:
-        # Đã xác thực rằng selected_projects chỉ có 1 trong main_optimized.py
-        # Kiểm tra điều kiện số lượng năm và tháng để xác định loại biểu đồ
-        
-        if len(selected_projects) != 1:
-            return pd.DataFrame(), "Lỗi: Internal - Vui lòng chọn CHỈ MỘT dự án cho chế độ này."
-
-        selected_project_name = selected_projects[0]
-
-        if len(years) == 1 and len(months) > 0:
-            # So sánh một dự án qua CÁC THÁNG trong MỘT năm
-            df_comparison = df_filtered.groupby('MonthName')['Hours'].sum().reset_index()
-            df_comparison.rename(columns={'Hours': f'Total Hours for {selected_project_name}'}, inplace=True)
-            
-            # Đảm bảo thứ tự tháng đúng cho biểu đồ
-            month_order = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October', 'November', 'December']
-            df_comparison['MonthName'] = pd.Categorical(df_comparison['MonthName'], categories=month_order, ordered=True)
-            df_comparison = df_comparison.sort_values('MonthName').reset_index(drop=True)
-            
-            # Thêm cột Project Name để các hàm export sau này có thể dùng nếu cần
-            df_comparison['Project Name'] = selected_project_name
-            title = f"Tổng giờ dự án {selected_project_name} qua các tháng trong năm {years[0]}"
-            return df_comparison, title
-
-        elif len(years) > 1 and not months:
-            # So sánh một dự án qua CÁC NĂM
-            df_comparison = df_filtered.groupby('Year')['Hours'].sum().reset_index()
-            df_comparison.rename(columns={'Hours': f'Total Hours for {selected_project_name}'}, inplace=True)
-            df_comparison['Year'] = df_comparison['Year'].astype(str) # Chuyển năm thành chuỗi cho trục X nếu cần
-            
-            # Thêm cột Project Name để các hàm export sau này có thể dùng nếu cần
-            df_comparison['Project Name'] = selected_project_name
-            title = f"Tổng giờ dự án {selected_project_name} qua các năm"
-            return df_comparison, title
-
-        else:
-            return pd.DataFrame(), "Cấu hình so sánh dự án qua thời gian không hợp lệ. Vui lòng chọn một năm với nhiều tháng, HOẶC nhiều năm."
-        
-    return pd.DataFrame(), "Chế độ so sánh không hợp lệ."
-
-def export_comparison_report(df_comparison, comparison_config, output_file_path, comparison_mode):
-    """Xuất báo cáo so sánh ra file Excel."""
+        df_comparison = build_comparison_matrix(df_filtered, ['project'], columns='month')
+        return df_comparison, f"So sánh giờ giữa các dự án trong năm {years[0]} (theo tháng)"
+
+    # project_over_time
+    if len(selected_projects) != 1:
+        return pd.DataFrame(), "Lỗi: Internal - Vui lòng chọn CHỈ MỘT dự án cho chế độ này."
+    selected_project_name = selected_projects[0]
+
+    if len(years) == 1 and len(months) > 0:
+        # So sánh một dự án qua CÁC THÁNG trong MỘT năm
+        df_comparison = build_comparison_matrix(df_filtered, ['month'], totals=False)
+        title = f"Tổng giờ dự án {selected_project_name} qua các tháng trong năm {years[0]}"
+    elif len(years) > 1 and not months:
+        # So sánh một dự án qua CÁC NĂM
+        df_comparison = build_comparison_matrix(df_filtered, ['year'], totals=False)
+        df_comparison['Year'] = df_comparison['Year'].astype(str) # Chuyển năm thành chuỗi cho trục X
+        title = f"Tổng giờ dự án {selected_project_name} qua các năm"
+    else:
+        return pd.DataFrame(), "Cấu hình so sánh dự án qua thời gian không hợp lệ. Vui lòng chọn một năm với nhiều tháng, HOẶC nhiều năm."
+
+    df_comparison = df_comparison.rename(columns={'Total Hours': f'Total Hours for {selected_project_name}',
+                                                  'Total Cost': f'Total Cost for {selected_project_name}'})
+    # Thêm cột Project Name để các hàm export sau này có thể dùng nếu cần
+    df_comparison['Project Name'] = selected_project_name
+    return df_comparison, title
+
+@tracing.traced('excel')
+def export_comparison_report(df_comparison, comparison_config, output_file_path, comparison_mode, df_trends=None):
+    """Xuất báo cáo so sánh ra file Excel (kèm sheet 'Period Trends' nếu có `df_trends`)."""
+    mode_key = resolve_comparison_mode(comparison_mode)
     try:
         with pd.ExcelWriter(output_file_path, engine='openpyxl') as writer:
             if df_comparison.empty:
@@ -489,6 +2046,8 @@ def export_comparison_report(df_comparison, comparison_config, output_file_path,
                 empty_df_for_excel.to_excel(writer, sheet_name='Comparison Report', index=False)
             else:
                 df_comparison.to_excel(writer, sheet_name='Comparison Report', index=False)  
+            if df_trends is not None and not df_trends.empty:
+                df_trends.drop(columns='Period Start').round(2).to_excel(writer, sheet_name='Period Trends', index=False)
 
             wb = writer.book
             ws = wb['Comparison Report']
@@ -514,8 +2073,8 @@ def export_comparison_report(df_comparison, comparison_config, output_file_path,
                 data_start_row = 2 
                 
                 df_chart_data = df_comparison.copy()
-                if 'Project Name' in df_chart_data.columns and 'Total' in df_chart_data['Project Name'].values:
-                    df_chart_data = df_chart_data[df_chart_data['Project Name'] != 'Total']
+                if 'Project name' in df_chart_data.columns and 'Total' in df_chart_data['Project name'].values:
+                    df_chart_data = df_chart_data[df_chart_data['Project name'] != 'Total']
                 elif 'Year' in df_chart_data.columns and 'Total' in df_chart_data['Year'].values:
                     df_chart_data = df_chart_data[df_chart_data['Year'] != 'Total']
                 
@@ -526,7 +2085,7 @@ def export_comparison_report(df_comparison, comparison_config, output_file_path,
 
                 max_row_chart = data_start_row + len(df_chart_data) - 1
 
-                if comparison_mode in ["So Sánh Dự Án Trong Một Tháng", "Compare Projects in a Month"]:
+                if mode_key == 'projects_in_month':
                     chart = BarChart()
                     chart.title = "So sánh giờ theo dự án"
                     chart.x_axis.title = "Dự án"
@@ -538,17 +2097,14 @@ def export_comparison_report(df_comparison, comparison_config, output_file_path,
                     chart.add_data(data_ref, titles_from_data=False) 
                     chart.set_categories(cats_ref)
                 
-                elif comparison_mode in ["So Sánh Dự Án Trong Một Năm", "Compare Projects in a Year"]:
+                elif mode_key == 'projects_in_year':
                     chart = LineChart()
                     chart.title = "So sánh giờ theo dự án và tháng"
                     chart.x_axis.title = "Tháng"
                     chart.y_axis.title = "Giờ"
 
-                    month_cols = [col for col in df_comparison.columns if col not in ['Project Name', 'Total Hours']]
-                    
                     # Cần lấy các tháng theo thứ tự đúng cho biểu đồ LineChart
-                    month_order = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October', 'November', 'December']
-                    ordered_month_cols = [m for m in month_order if m in month_cols]
+                    ordered_month_cols = [m for m in MONTH_ORDER if m in df_comparison.columns]
 
                     # Lấy phạm vi cho danh mục (các tháng)
                     # Giả định các tháng nằm cạnh nhau trong bảng và bắt đầu từ một cột cụ thể
@@ -564,20 +2120,17 @@ def export_comparison_report(df_comparison, comparison_config, output_file_path,
                         wb.save(output_file_path)
                         return True
                     
-                    # Thêm từng series dữ liệu cho mỗi dự án
+                    # Thêm từng series dữ liệu cho mỗi dự án (mỗi hàng là một đường)
                     for r_idx, project_name in enumerate(df_chart_data['Project name']):
                         series_ref = Reference(ws, min_col=min_col_month, 
                                                min_row=data_start_row + r_idx, 
                                                max_col=max_col_month, 
                                                max_row=data_start_row + r_idx)
-                        title_ref = Reference(ws, min_col=df_comparison.columns.get_loc('Project name') + 1, 
-                                              min_row=data_start_row + r_idx, 
-                                              max_row=data_start_row + r_idx)
-                        chart.series[r_idx].title = project_name  # chuỗi str
+                        chart.series.append(Series(series_ref, title=str(project_name)))
                     
                     chart.set_categories(cats_ref)
 
-                elif comparison_mode in ["So Sánh Một Dự Án Qua Các Tháng/Năm", "Compare One Project Over Time (Months/Years)"]:
+                elif mode_key == 'project_over_time':
                     # Lấy tên cột chứa tổng giờ cho biểu đồ
                     total_hours_col_name = [col for col in df_comparison.columns if 'Total Hours' in col][0] if [col for col in df_comparison.columns if 'Total Hours' in col] else 'Total Hours'
                     
@@ -618,123 +2171,81 @@ def export_comparison_report(df_comparison, comparison_config, output_file_path,
         print(f"Lỗi khi xuất báo cáo so sánh ra Excel: {e}")
         return False
 
-def export_comparison_pdf_report(df_comparison, comparison_config, pdf_file_path, comparison_mode, logo_path):
-    """Xuất báo cáo PDF so sánh với biểu đồ."""
+@tracing.traced('pdf')
+def export_comparison_pdf_report(df_comparison, comparison_config, pdf_file_path, comparison_mode, logo_path, pdf_options=None):
+    """Xuất báo cáo PDF so sánh với biểu đồ (bố cục và nén ảnh theo `pdf_options`)."""
+    from fpdf import FPDF
+    from chart_renderer import ChartRenderer
+
     if df_comparison.empty:
         print("WARNING: df_comparison is empty. Skipping PDF report export.")
         return False
     tmp_dir = tempfile.mkdtemp()
     charts_for_pdf = []
+    options = get_pdf_options(pdf_options)
+    mode_key = resolve_comparison_mode(comparison_mode)
 
     def create_pdf_from_charts_comp(charts_data, output_path, title, config_info, logo_path_inner):
         pdf = FPDF()
         pdf.set_auto_page_break(auto=True, margin=15)
-        pdf.set_font('helvetica', 'B', 16) 
-
-        pdf.add_page()
-        if os.path.exists(logo_path_inner):
-            pdf.image(logo_path_inner, x=10, y=10, w=30)
-        pdf.ln(40)
-        pdf.cell(0, 10, title, ln=True, align='C')
-        pdf.set_font("helvetica", '', 12) 
-        pdf.ln(5)
-        pdf.cell(0, 10, f"Generated on: {datetime.datetime.today().strftime('%Y-%m-%d')}", ln=True, align='C')
-        pdf.ln(10)
-        pdf.set_font("helvetica", '', 11) 
-        for key, value in config_info.items():
-            pdf.cell(0, 7, f"{key}: {value}", ln=True, align='C')
-
-        for img_path, chart_title, page_project_name in charts_data:
-            if img_path and os.path.exists(img_path):
-                pdf.add_page()
-                if os.path.exists(logo_path_inner):
-                    pdf.image(logo_path_inner, x=10, y=8, w=25)
-                pdf.set_font("helvetica", 'B', 11) 
-                pdf.set_y(35)
-                if page_project_name:
-                    pdf.cell(0, 10, f"Project: {page_project_name}", ln=True, align='C')
-                pdf.cell(0, 10, chart_title, ln=True, align='C')
-                pdf.image(img_path, x=10, y=45, w=190)
+        add_cover_page(pdf, title, config_info, logo_path_inner)
+        add_chart_pages(pdf, charts_data, logo_path_inner, options)
 
         pdf.output(output_path, "F")
-        print(f"DEBUG: PDF report generated at {output_path}")
+        tracing.log_event("PDF report generated", path=output_path, pages=pdf.page)
+
+    renderer = ChartRenderer(dpi=pdf_chart_dpi(options, fig_width_in=12))
 
     def create_comparison_chart(df, mode, title, x_label, y_label, img_path, comparison_config_inner):
-        fig, ax = plt.subplots(figsize=(12, 7))  
-        
+        chart_mode_key = resolve_comparison_mode(mode)
         df_plot = df.copy()  
         
         # Loại bỏ hàng 'Total' nếu có để không ảnh hưởng đến biểu đồ
-        if 'Project Name' in df_plot.columns and 'Total' in df_plot['Project name'].values:
-            df_plot = df_plot[df_plot['Project name'] != 'Total']
-        elif 'Year' in df_plot.columns and 'Total' in df_plot['Year'].values:
-            df_plot = df_plot[df_plot['Year'] != 'Total']
+        for total_col in ['Project name', 'Project Name', 'Year']:
+            if total_col in df_plot.columns:
+                df_plot = df_plot[df_plot[total_col].astype(str) != 'Total']
         
         if df_plot.empty:
-            print(f"DEBUG: df_plot is empty for mode '{mode}' after dropping 'Total'. Skipping chart creation.")
-            plt.close(fig)  
+            tracing.log_event("Skipping comparison chart: no rows after dropping 'Total'", mode=mode)
             return None  
 
-        ax.set_ylim(bottom=0)
-        
-        plt.rcParams['font.family'] = 'sans-serif'
-        plt.rcParams['font.sans-serif'] = ['Arial', 'Helvetica', 'Liberation Sans']
-        plt.rcParams['axes.unicode_minus'] = False 
-
-        if mode in ["So Sánh Dự Án Trong Một Tháng", "Compare Projects in a Month"]:
-            df_plot.plot(kind='bar', x='Project name', y='Total Hours', ax=ax, color='teal')
-        elif mode in ["So Sánh Dự Án Trong Một Năm", "Compare Projects in a Year"]:
-            month_order = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October', 'November', 'December']
+        if chart_mode_key == 'projects_in_month':
+            series = df_plot.set_index('Project name')['Total Hours']
+            return renderer.bar(series, img_path, title=title, xlabel=x_label, ylabel=y_label, color='teal')
+        elif chart_mode_key == 'projects_in_year':
             # Đảm bảo thứ tự tháng cho các cột
-            existing_months = [m for m in month_order if m in df_plot.columns]
+            existing_months = [m for m in MONTH_ORDER if m in df_plot.columns]
             
             # Nếu df_plot không có cột nào để vẽ (ngoại trừ Project Name và Total Hours)
             if not existing_months:
-                print(f"DEBUG: No month columns found for line chart in mode '{mode}'. Skipping chart creation.")
-                plt.close(fig)
+                tracing.log_event("Skipping comparison chart: no month columns for line chart", mode=mode)
                 return None
 
-            # Chuyển đổi từ wide sang long format để vẽ line chart dễ hơn với seaborn/matplotlib
-            df_plot_long = df_plot.melt(id_vars=['Project name'], value_vars=existing_months, var_name='Month', value_name='Hours')
-            
-            # Sắp xếp tháng để đường biểu đồ đúng thứ tự
-            df_plot_long['Month'] = pd.Categorical(df_plot_long['Month'], categories=month_order, ordered=True)
-            df_plot_long = df_plot_long.sort_values('Month')
-
-            for project_name, data in df_plot_long.groupby('Project name'):
-                ax.plot(data['Month'], data['Hours'], marker='o', label=project_name)
-            ax.legend(title='Dự án')
-            ax.tick_params(axis='x', rotation=45) # Xoay nhãn tháng nếu cần
+            # Chuyển vị để mỗi dự án là một đường, trục X là các tháng theo thứ tự
+            df_lines = df_plot.dropna(subset=['Project name']).set_index('Project name')[existing_months].T
+            return renderer.line(df_lines, img_path, title=title, xlabel=x_label, ylabel=y_label,
+                                 rotation=45, legend_title='Dự án')
 
-        elif mode in ["So Sánh Một Dự Án Qua Các Tháng/Năm", "Compare One Project Over Time (Months/Years)"]:
+        elif chart_mode_key == 'project_over_time':
             selected_project_name = comparison_config_inner.get('selected_projects', ['Dự án không xác định'])[0]
+            y_col = f'Total Hours for {selected_project_name}'
+            if y_col not in df_plot.columns:
+                raise ValueError(f"Không tìm thấy cột '{y_col}' trong bảng dữ liệu để vẽ biểu đồ.")    
             
             if 'MonthName' in df_plot.columns: # So sánh theo tháng trong một năm
-                y_col = f'Total Hours for {selected_project_name}'
-                if y_col not in df_plot.columns:
-                    raise ValueError(f"Không tìm thấy cột '{y_col}' trong bảng dữ liệu để vẽ biểu đồ.")    
-                df_plot.plot(kind='bar', x='MonthName', y=y_col, ax=ax, color='purple')
-                ax.tick_params(axis='x', rotation=45) # Xoay nhãn tháng nếu cần
+                series = df_plot.set_index('MonthName')[y_col]
+                return renderer.bar(series, img_path, title=title, xlabel=x_label, ylabel=y_label,
+                                    color='purple', rotation=45)
             elif 'Year' in df_plot.columns: # So sánh theo năm
-                df_plot.plot(kind='line', x='Year', y=f'Total Hours for {selected_project_name}', ax=ax, marker='o', color='red')
+                series = df_plot.set_index('Year')[y_col]
+                return renderer.line(series, img_path, title=title, xlabel=x_label, ylabel=y_label, color='red')
             else:
-                print(f"DEBUG: Invalid columns for chart in mode '{mode}'. Skipping chart creation.")
-                plt.close(fig)
+                tracing.log_event("Skipping comparison chart: invalid columns", mode=mode)
                 return None
         else:
-            print(f"DEBUG: Unknown comparison mode '{mode}'. Skipping chart creation.")
-            plt.close(fig)
+            tracing.log_event("Skipping comparison chart: unknown comparison mode", mode=mode)
             return None
 
-        ax.set_title(title, fontsize=12)
-        ax.set_xlabel(x_label, fontsize=10)
-        ax.set_ylabel(y_label, fontsize=10)
-        
-        plt.tight_layout()
-        fig.savefig(img_path, dpi=200)
-        plt.close(fig)
-        return img_path
-
     try:
         pdf_config_info = {
             "Chế độ so sánh": comparison_mode,
@@ -749,21 +2260,21 @@ def export_comparison_pdf_report(df_comparison, comparison_config, pdf_file_path
         y_label = "Giờ"
         page_project_name_for_chart = None
 
-        if comparison_mode in ["So Sánh Dự Án Trong Một Tháng", "Compare Projects in a Month"]:
+        if mode_key == 'projects_in_month':
             chart_title = f"So sánh giờ giữa các dự án trong {comparison_config['months'][0]}, năm {comparison_config['years'][0]}"
             x_label = "Dự án"
             main_chart_path = create_comparison_chart(df_comparison, comparison_mode, chart_title, x_label, y_label, 
                                                      os.path.join(tmp_dir, "comparison_chart_month.png"), comparison_config)
             charts_for_pdf.append((main_chart_path, chart_title, None))
 
-        elif comparison_mode in ["So Sánh Dự Án Trong Một Năm", "Compare Projects in a Year"]:
+        elif mode_key == 'projects_in_year':
             chart_title = f"So sánh giờ giữa các dự án trong năm {comparison_config['years'][0]} (theo tháng)"
             x_label = "Tháng"
             main_chart_path = create_comparison_chart(df_comparison, comparison_mode, chart_title, x_label, y_label, 
                                                      os.path.join(tmp_dir, "comparison_chart_year.png"), comparison_config)
             charts_for_pdf.append((main_chart_path, chart_title, None))
             
-        elif comparison_mode in ["So Sánh Một Dự Án Qua Các Tháng/Năm", "Compare One Project Over Time (Months/Years)"]:
+        elif mode_key == 'project_over_time':
             selected_proj = comparison_config.get('selected_projects', [''])[0]
             page_project_name_for_chart = selected_proj
 
@@ -784,6 +2295,18 @@ def export_comparison_pdf_report(df_comparison, comparison_config, pdf_file_path
             if main_chart_path:
                 charts_for_pdf.append((main_chart_path, chart_title, page_project_name_for_chart))
 
+        # Biểu đồ chi phí đi kèm khi dữ liệu đã được quy đổi theo bảng đơn giá (cột 'Total Cost...')
+        cost_col = next((c for c in df_comparison.columns if str(c).startswith('Total Cost')), None)
+        if cost_col and charts_for_pdf:
+            label_col = df_comparison.columns[0]
+            df_cost = df_comparison[df_comparison[label_col].astype(str) != 'Total']
+            cost_title = f"Chi phí - {chart_title}"
+            charts_for_pdf.append((renderer.bar(
+                df_cost.set_index(label_col)[cost_col], os.path.join(tmp_dir, "comparison_cost_chart.png"),
+                title=cost_title, xlabel=x_label, ylabel="Chi phí", color='darkorange',
+                rotation=0 if mode_key == 'projects_in_month' else 45, label_fmt='%.0f'
+            ), cost_title, page_project_name_for_chart))
+
         if not charts_for_pdf:
             print("Cảnh báo: Không có biểu đồ nào được tạo để đưa vào PDF báo cáo so sánh. PDF có thể trống.")
             pdf = FPDF()
@@ -795,12 +2318,15 @@ def export_comparison_pdf_report(df_comparison, comparison_config, pdf_file_path
             pdf.ln(10)
             pdf.set_font("helvetica", '', 11)
             for key, value in pdf_config_info.items():
-                pdf.cell(0, 7, f"{key}: {value}", ln=True, align='C')
+                pdf.cell(0, 7, pdf_text(f"{key}: {value}"), ln=True, align='C')
             pdf.cell(0, 10, "No charts generated for this comparison report.", ln=True, align='C')
             pdf.output(pdf_file_path, "F")
             return True
 
-        create_pdf_from_charts_comp(charts_for_pdf, pdf_file_path, "TRIAC TIME REPORT - COMPARISON", pdf_config_info, logo_path)
+        tracing.log_event(renderer.timing_summary())
+        charts_for_pdf = [(compress_chart_image(path), chart_title, name) for path, chart_title, name in charts_for_pdf if path]
+        create_pdf_from_charts_comp(charts_for_pdf, pdf_file_path, "TRIAC TIME REPORT - COMPARISON", pdf_config_info,
+                                    prepare_pdf_logo(logo_path, tmp_dir, options))
         return True
 
     except Exception as e:
@@ -813,149 +2339,7 @@ def export_comparison_pdf_report(df_comparison, comparison_config, pdf_file_path
 # Phần main của chương trình (có thể lấy từ main_optimized.py của bạn)
 # Ví dụ cấu trúc main, bạn sẽ cần thay thế bằng nội dung thực tế của main_optimized.py
 if __name__ == '__main__':
-    paths = setup_paths()
-    template_file = paths['template_file']
-    logo_path = paths['logo_path']
-
-    # Đảm bảo file template tồn tại
-    if not os.path.exists(template_file):
-        print(f"Lỗi: Không tìm thấy file template Excel '{template_file}'. Vui lòng đảm bảo file này có trong cùng thư mục với script.")
-        exit()
-
-    # Đảm bảo file logo tồn tại (nếu có)
-    if not os.path.exists(logo_path):
-        print(f"Cảnh báo: Không tìm thấy file logo '{logo_path}'. Báo cáo PDF sẽ được tạo mà không có logo.")
-        # Nếu logo không tồn tại, bạn có thể muốn đặt logo_path thành None hoặc một đường dẫn ảnh trống
-        # để tránh lỗi khi cố gắng nhúng ảnh không tồn tại.
-        # Hoặc đơn giản là để hàm export_pdf_report xử lý (như hiện tại nó đã kiểm tra os.path.exists)
-
-    raw_df = load_raw_data(template_file)
-    if raw_df.empty:
-        print("Không có dữ liệu thô để xử lý. Thoát chương trình.")
-        exit()
-
-    # --- Phần xử lý cho Báo cáo TIÊU CHUẨN ---
-    print("\n--- Đang tạo Báo cáo TIÊU CHUẨN ---")
-    standard_config = read_configs(template_file)
-    standard_config['years'] = [standard_config['year']] # Chuyển year thành list cho apply_filters nếu cần
-    df_standard_filtered = apply_filters(raw_df, standard_config)
-    
-    if not df_standard_filtered.empty:
-        export_success_excel = export_report(df_standard_filtered, standard_config, paths['output_file'])
-        if export_success_excel:
-            print(f"Báo cáo tiêu chuẩn Excel đã được tạo thành công tại: {paths['output_file']}")
-            # Tạo PDF cho báo cáo tiêu chuẩn
-            export_success_pdf_standard = export_pdf_report(df_standard_filtered, standard_config, paths['pdf_report'], logo_path)
-            if export_success_pdf_standard:
-                print(f"Báo cáo tiêu chuẩn PDF đã được tạo thành công tại: {paths['pdf_report']}")
-            else:
-                print("Có lỗi khi tạo báo cáo tiêu chuẩn PDF.")
-        else:
-            print("Có lỗi khi tạo báo cáo tiêu chuẩn Excel.")
-    else:
-        print("Không có dữ liệu để tạo báo cáo tiêu chuẩn với các bộ lọc đã chọn.")
-
-    # --- Phần xử lý cho Báo cáo SO SÁNH ---
-    # Để kiểm tra chức năng so sánh, bạn cần cấu hình `Config_Year_Mode` và `Config_Project_Filter`
-    # trong file `Time_report.xlsm` theo các chế độ so sánh.
-    # Ví dụ minh họa cách gọi, bạn sẽ cần tùy chỉnh `comparison_config` và `comparison_mode`
-    # dựa trên logic đọc cấu hình thực tế của bạn cho chế độ so sánh trong `main_optimized.py`.
-
-    print("\n--- Đang tạo Báo cáo SO SÁNH (Ví dụ) ---")
-    
-    # Ví dụ cấu hình cho "So Sánh Dự Án Trong Một Tháng"
-    # Bạn sẽ cần đọc cấu hình này từ file Excel của bạn theo cách tương tự `read_configs`
-    # hoặc thiết lập thủ công cho mục đích thử nghiệm.
-    
-    # Giả định project_filter_df từ config_project_filter đã được xử lý để lấy ra các dự án được chọn
-    # Trong main_optimized.py, bạn sẽ cần một logic để đọc config cho chế độ so sánh.
-    # Để đơn giản trong ví dụ này, tôi sẽ giả định một cấu hình so sánh:
-    
-    # Lấy danh sách tất cả các Project name có trong raw_df để dùng cho việc so sánh
-    all_projects_in_raw_data = raw_df['Project name'].unique().tolist()
-    
-    # Lấy các dự án từ config ban đầu mà có flag 'yes'
-    projects_for_comparison_from_config = standard_config['project_filter_df'][
-        standard_config['project_filter_df']['Include'] == 'yes'
-    ]['Project Name'].tolist()
-    
-    if len(projects_for_comparison_from_config) >= 2 and standard_config['months']:
-        # Ví dụ 1: So sánh nhiều dự án trong một tháng (nếu có đủ data và config phù hợp)
-        # Sẽ cần tinh chỉnh lại để match với cấu hình đọc từ Excel
-        comparison_config_month_example = {
-            'years': [standard_config['year']],
-            'months': [standard_config['months'][0]] if standard_config['months'] else ['January'], # Lấy tháng đầu tiên hoặc mặc định
-            'selected_projects': projects_for_comparison_from_config[:2] if len(projects_for_comparison_from_config) >= 2 else all_projects_in_raw_data[:2]
-        }
-        if comparison_config_month_example['selected_projects']:
-            print(f"\nChế độ: So Sánh Dự Án Trong Một Tháng (năm {comparison_config_month_example['years'][0]}, tháng {comparison_config_month_example['months'][0]})")
-            df_comp_month, msg_month = apply_comparison_filters(raw_df, comparison_config_month_example, "So Sánh Dự Án Trong Một Tháng")
-            if not df_comp_month.empty:
-                export_success_excel_comp_month = export_comparison_report(df_comp_month, comparison_config_month_example, paths['comparison_output_file'].replace(".xlsx", "_Month.xlsx"), "So Sánh Dự Án Trong Một Tháng")
-                if export_success_excel_comp_month:
-                    print(f"Báo cáo so sánh Excel (theo tháng) đã được tạo thành công tại: {paths['comparison_output_file'].replace('.xlsx', '_Month.xlsx')}")
-                    export_success_pdf_comp_month = export_comparison_pdf_report(df_comp_month, comparison_config_month_example, paths['comparison_pdf_report'].replace(".pdf", "_Month.pdf"), "So Sánh Dự Án Trong Một Tháng", logo_path)
-                    if export_success_pdf_comp_month:
-                        print(f"Báo cáo so sánh PDF (theo tháng) đã được tạo thành công tại: {paths['comparison_pdf_report'].replace('.pdf', '_Month.pdf')}")
-                    else:
-                        print("Có lỗi khi tạo báo cáo so sánh PDF (theo tháng).")
-                else:
-                    print("Có lỗi khi tạo báo cáo so sánh Excel (theo tháng).")
-            else:
-                print(f"Không có dữ liệu cho chế độ so sánh 'So Sánh Dự Án Trong Một Tháng': {msg_month}")
-        else:
-            print("Không đủ dự án để thực hiện so sánh dự án trong một tháng.")
-
-    # Ví dụ 2: So sánh một dự án qua các tháng/năm (nếu có đủ data và config phù hợp)
-    if all_projects_in_raw_data:
-        # Cấu hình để so sánh một dự án qua các tháng trong một năm
-        if len(standard_config['months']) >= 2: # Cần ít nhất 2 tháng để so sánh
-            comparison_config_single_proj_months_example = {
-                'years': [standard_config['year']],
-                'months': standard_config['months'],
-                'selected_projects': [all_projects_in_raw_data[0]] # Chọn dự án đầu tiên
-            }
-            print(f"\nChế độ: So Sánh Một Dự Án Qua Các Tháng (dự án: {comparison_config_single_proj_months_example['selected_projects'][0]}, năm {comparison_config_single_proj_months_example['years'][0]})")
-            df_comp_single_proj_months, msg_single_proj_months = apply_comparison_filters(raw_df, comparison_config_single_proj_months_example, "So Sánh Một Dự Án Qua Các Tháng/Năm")
-            if not df_comp_single_proj_months.empty:
-                export_success_excel_comp_single_proj_months = export_comparison_report(df_comp_single_proj_months, comparison_config_single_proj_months_example, paths['comparison_output_file'].replace(".xlsx", "_SingleProjMonths.xlsx"), "So Sánh Một Dự Án Qua Các Tháng/Năm")
-                if export_success_excel_comp_single_proj_months:
-                    print(f"Báo cáo so sánh Excel (một dự án qua các tháng) đã được tạo thành công tại: {paths['comparison_output_file'].replace('.xlsx', '_SingleProjMonths.xlsx')}")
-                    export_success_pdf_comp_single_proj_months = export_comparison_pdf_report(df_comp_single_proj_months, comparison_config_single_proj_months_example, paths['comparison_pdf_report'].replace(".pdf", "_SingleProjMonths.pdf"), "So Sánh Một Dự Án Qua Các Tháng/Năm", logo_path)
-                    if export_success_pdf_comp_single_proj_months:
-                        print(f"Báo cáo so sánh PDF (một dự án qua các tháng) đã được tạo thành công tại: {paths['comparison_pdf_report'].replace('.pdf', '_SingleProjMonths.pdf')}")
-                    else:
-                        print("Có lỗi khi tạo báo cáo so sánh PDF (một dự án qua các tháng).")
-                else:
-                    print("Có lỗi khi tạo báo cáo so sánh Excel (một dự án qua các tháng).")
-            else:
-                print(f"Không có dữ liệu cho chế độ so sánh 'So Sánh Một Dự Án Qua Các Tháng/Năm' (theo tháng): {msg_single_proj_months}")
-        else:
-             print("Không đủ tháng để thực hiện so sánh một dự án qua các tháng.")
-
-        # Cấu hình để so sánh một dự án qua các năm (cần ít nhất 2 năm trong dữ liệu thô)
-        # Để test phần này, raw_df cần chứa dữ liệu của nhiều năm.
-        available_years = raw_df['Year'].unique().tolist()
-        if len(available_years) >= 2:
-            comparison_config_single_proj_years_example = {
-                'years': available_years, # Sử dụng tất cả các năm có sẵn
-                'months': [], # Không lọc theo tháng
-                'selected_projects': [all_projects_in_raw_data[0]] # Chọn dự án đầu tiên
-            }
-            print(f"\nChế độ: So Sánh Một Dự Án Qua Các Năm (dự án: {comparison_config_single_proj_years_example['selected_projects'][0]})")
-            df_comp_single_proj_years, msg_single_proj_years = apply_comparison_filters(raw_df, comparison_config_single_proj_years_example, "So Sánh Một Dự Án Qua Các Tháng/Năm")
-            if not df_comp_single_proj_years.empty:
-                export_success_excel_comp_single_proj_years = export_comparison_report(df_comp_single_proj_years, comparison_config_single_proj_years_example, paths['comparison_output_file'].replace(".xlsx", "_SingleProjYears.xlsx"), "So Sánh Một Dự Án Qua Các Tháng/Năm")
-                if export_success_excel_comp_single_proj_years:
-                    print(f"Báo cáo so sánh Excel (một dự án qua các năm) đã được tạo thành công tại: {paths['comparison_output_file'].replace('.xlsx', '_SingleProjYears.xlsx')}")
-                    export_success_pdf_comp_single_proj_years = export_comparison_pdf_report(df_comp_single_proj_years, comparison_config_single_proj_years_example, paths['comparison_pdf_report'].replace(".pdf", "_SingleProjYears.pdf"), "So Sánh Một Dự Án Qua Các Tháng/Năm", logo_path)
-                    if export_success_pdf_comp_single_proj_years:
-                        print(f"Báo cáo so sánh PDF (một dự án qua các năm) đã được tạo thành công tại: {paths['comparison_pdf_report'].replace('.pdf', '_SingleProjYears.pdf')}")
-                    else:
-                        print("Có lỗi khi tạo báo cáo so sánh PDF (một dự án qua các năm).")
-                else:
-                    print("Có lỗi khi tạo báo cáo so sánh Excel (một dự án qua các năm).")
-            else:
-                print(f"Không có dữ liệu cho chế độ so sánh 'So Sánh Một Dự Án Qua Các Tháng/Năm' (theo năm): {msg_single_proj_years}")
-        else:
-            print("Không đủ năm trong dữ liệu để thực hiện so sánh một dự án qua các năm.")
+    # Chạy các job báo cáo (mặc định hoặc theo --spec) qua batch_runner: đọc dữ liệu một lần, xuất song song
+    import sys
+    from batch_runner import main
+    sys.exit(main())
@@ -0,0 +1,133 @@
+import atexit
+import csv
+import queue
+import sqlite3
+import threading
+from contextlib import closing
+from datetime import datetime
+
+import pandas as pd
+
+from dataset_watcher import WatchedDataset
+
+ACCESS_LOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS access_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    time TEXT NOT NULL,
+    email TEXT NOT NULL,
+    event TEXT NOT NULL,
+    detail TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_access_log_time ON access_log (time);
+CREATE INDEX IF NOT EXISTS idx_access_log_email_time ON access_log (email, time);
+"""
+
+class AccessLog:
+    """Nhật ký truy cập lưu trong SQLite (chế độ WAL), ghi theo lô bởi một luồng nền.
+
+    log() chỉ đưa bản ghi vào hàng đợi nên không làm chậm lần chạy lại trang; luồng ghi gom tối đa
+    `batch_size` bản ghi (hoặc những gì có sau `flush_interval` giây) vào một giao dịch.
+    """
+
+    def __init__(self, db_path, batch_size=200, flush_interval=1.0):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(ACCESS_LOG_SCHEMA)
+        self._writer = threading.Thread(target=self._write_loop, name='access-log-writer', daemon=True)
+        self._writer.start()
+        atexit.register(self.flush)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10, check_same_thread=False)
+        conn.execute("PRAGMA synchronous=NORMAL")  # Đủ an toàn với WAL, mỗi giao dịch không phải fsync
+        return conn
+
+    def log(self, email, event='login', detail=None):
+        """Ghi một sự kiện (không chờ ghi xuống đĩa)."""
+        self._queue.put((datetime.now().strftime("%Y-%m-%d %H:%M:%S"), email, event, detail))
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < self.batch_size and batch[-1] is not None:
+                    batch.append(self._queue.get(timeout=self.flush_interval))
+            except queue.Empty:
+                pass
+            rows = [item for item in batch if item is not None]
+            if rows:
+                try:
+                    with conn:
+                        conn.executemany("INSERT INTO access_log (time, email, event, detail) VALUES (?, ?, ?, ?)", rows)
+                except sqlite3.Error as e:
+                    print(f"Lỗi khi ghi access log ({len(rows)} bản ghi): {e}")
+            for _ in batch:
+                self._queue.task_done()
+
+    def flush(self):
+        """Chờ mọi bản ghi đã đưa vào hàng đợi được ghi xong."""
+        self._queue.put(None)  # Đánh thức luồng ghi để lô hiện tại được ghi ngay
+        self._queue.join()
+
+    def query(self, email=None, event=None, since=None, until=None, limit=500):
+        """Các bản ghi mới nhất trước, lọc theo email/sự kiện/khoảng thời gian (chuỗi 'YYYY-MM-DD[ HH:MM:SS]')."""
+        clauses, params = [], []
+        if email:
+            clauses.append("email = ?")
+            params.append(email)
+        if event:
+            clauses.append("event = ?")
+            params.append(event)
+        if since:
+            clauses.append("time >= ?")
+            params.append(str(since))
+        if until:
+            # Ngày không có giờ được hiểu là hết ngày đó
+            clauses.append("time <= ?")
+            params.append(str(until) + (" 23:59:59" if len(str(until)) == 10 else ""))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with closing(self._connect()) as conn:
+            return pd.read_sql_query(
+                f"SELECT time AS Time, email AS Email, event AS Event, detail AS Detail FROM access_log {where} "
+                f"ORDER BY time DESC, id DESC LIMIT ?", conn, params=params + [int(limit)])
+
+    def summary(self, since=None):
+        """Số lần truy cập và lần cuối theo từng email (dùng chỉ mục (email, time))."""
+        where, params = ("WHERE time >= ?", [str(since)]) if since else ("", [])
+        with closing(self._connect()) as conn:
+            return pd.read_sql_query(
+                f"SELECT email AS Email, COUNT(*) AS Events, SUM(event = 'login') AS Logins, MAX(time) AS \"Last Seen\" "
+                f"FROM access_log {where} GROUP BY email ORDER BY MAX(time) DESC", conn, params=params)
+
+def read_invite_list(csv_path):
+    """Đọc danh sách email được mời: cột 1 là email, cột 2 (tùy chọn) là vai trò ('admin').
+
+    Trả về (tập email được mời, tập email admin), đều ở dạng chữ thường để tra cứu O(1).
+    """
+    invited, admins = set(), set()
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        for row in csv.reader(f):
+            if not row or not row[0].strip():
+                continue
+            email = row[0].strip().lower()
+            invited.add(email)
+            if len(row) > 1 and row[1].strip().lower() == 'admin':
+                admins.add(email)
+    return frozenset(invited), frozenset(admins)
+
+class InviteList:
+    """Danh sách email được mời, chỉ đọc lại file CSV khi file thay đổi (xem WatchedDataset)."""
+
+    def __init__(self, csv_path, poll_interval=5.0):
+        self._source = WatchedDataset([csv_path], lambda: read_invite_list(csv_path), poll_interval=poll_interval)
+
+    def is_invited(self, email):
+        return email in self._source.get()[0]
+
+    def is_admin(self, email):
+        return email in self._source.get()[1]
@@ -0,0 +1,320 @@
+"""Chạy nhiều job báo cáo (tiêu chuẩn / so sánh) từ một file spec JSON hoặc YAML.
+
+Chạy: python batch_runner.py [--spec jobs.json] [--max-workers 4] [--memory-profile memory.json]
+(hoặc python a04ecaf1_1dae_4c90_8081_086cd7c7b725.py với cùng tham số)
+
+Dữ liệu thô và cấu hình template chỉ được đọc một lần; dữ liệu đã lọc, bảng so sánh và bảng xu hướng
+được dùng chung giữa các job có cùng bộ lọc; các file Excel/PDF được xuất song song.
+Không có --spec thì chạy bộ job mặc định dựng từ template (giống ví dụ cũ của CLI).
+
+Ví dụ spec:
+{
+  "template_file": "Time_report.xlsm",
+  "output_dir": "outputs/batch",
+  "max_workers": 4,
+  "pdf_options": {"charts_per_page": 2},
+  "jobs": [
+    {"name": "standard", "type": "standard", "excel": "standard.xlsx", "pdf": "standard.pdf",
+     "heatmap_excel": "heatmap.xlsx", "heatmap_pdf": "heatmap.pdf",
+     "timeline_excel": "timeline.xlsx", "timeline_pdf": "timeline.pdf"},
+    {"name": "march", "type": "comparison", "comparison_mode": "projects_in_month",
+     "years": [2024], "months": ["March"], "projects": ["A", "B"], "excel": "march.xlsx", "trends": true},
+    {"name": "capacity", "type": "utilisation", "years": [2024], "excel": "utilisation.xlsx"}
+  ]
+}
+Job tiêu chuẩn không khai báo mode/year/months/projects sẽ dùng cấu hình trong template;
+"projects": "all" chọn mọi dự án có trong dữ liệu. Timeline luôn tính trên toàn bộ lịch sử của các dự án đã chọn.
+"""
+import argparse
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import a04ecaf1_1dae_4c90_8081_086cd7c7b725 as core
+import tracing
+from memory_profile import profiling
+
+JOB_TYPES = ('standard', 'comparison', 'utilisation')
+
+def load_spec(spec_path):
+    """Đọc file spec JSON/YAML; trả về dict hoặc None nếu lỗi."""
+    try:
+        with open(spec_path, encoding='utf-8') as f:
+            if spec_path.lower().endswith(('.yaml', '.yml')):
+                try:
+                    import yaml
+                except ImportError:
+                    print("Lỗi: Cần cài PyYAML để đọc spec YAML (pip install pyyaml), hoặc dùng spec JSON.")
+                    return None
+                spec = yaml.safe_load(f)
+            else:
+                spec = json.load(f)
+    except Exception as e:
+        print(f"Lỗi khi đọc file spec '{spec_path}': {e}")
+        return None
+
+    jobs = spec.get('jobs') if isinstance(spec, dict) else None
+    if not jobs:
+        print(f"Lỗi: File spec '{spec_path}' không có danh sách 'jobs'.")
+        return None
+    for i, job in enumerate(jobs):
+        job.setdefault('name', f"job_{i + 1}")
+        if job.get('type') not in JOB_TYPES:
+            print(f"Lỗi: Job '{job['name']}' có type không hợp lệ: {job.get('type')} (hợp lệ: {', '.join(JOB_TYPES)}).")
+            return None
+        if job['type'] == 'comparison' and not core.resolve_comparison_mode(job.get('comparison_mode')):
+            print(f"Lỗi: Job '{job['name']}' có comparison_mode không hợp lệ: {job.get('comparison_mode')}.")
+            return None
+    return spec
+
+def default_spec(raw_df, standard_config, paths):
+    """Bộ job mặc định khi không có spec: báo cáo tiêu chuẩn theo template và các ví dụ so sánh trước đây."""
+    jobs = [{'name': 'standard', 'type': 'standard', 'excel': paths['output_file'], 'pdf': paths['pdf_report']}]
+
+    all_projects = raw_df['Project name'].unique().tolist()
+    filter_df = standard_config['project_filter_df']
+    config_projects = filter_df.loc[filter_df['Include'] == 'yes', 'Project Name'].tolist() if 'Include' in filter_df.columns else []
+    year, months = standard_config['year'], standard_config['months']
+
+    def comparison_job(name, mode, years, months_, projects, suffix):
+        return {'name': name, 'type': 'comparison', 'comparison_mode': mode,
+                'years': years, 'months': months_, 'projects': projects,
+                'excel': paths['comparison_output_file'].replace('.xlsx', f'_{suffix}.xlsx'),
+                'pdf': paths['comparison_pdf_report'].replace('.pdf', f'_{suffix}.pdf')}
+
+    if len(config_projects) >= 2 and months:
+        jobs.append(comparison_job('compare_month', 'projects_in_month', [year], [months[0]], config_projects[:2], 'Month'))
+    if all_projects and len(months) >= 2:
+        jobs.append(comparison_job('project_months', 'project_over_time', [year], months, [all_projects[0]], 'SingleProjMonths'))
+    available_years = sorted(raw_df['Year'].unique().tolist())
+    if all_projects and len(available_years) >= 2:
+        jobs.append(comparison_job('project_years', 'project_over_time', available_years, [], [all_projects[0]], 'SingleProjYears'))
+    return {'jobs': jobs}
+
+class SharedData:
+    """Dữ liệu dùng chung giữa các job: mỗi kết quả (lọc, so sánh, xu hướng) chỉ tính một lần theo khóa chuẩn hóa."""
+
+    def __init__(self, raw_df, template_file, logo_path, pdf_options=None, template_config=None):
+        self.raw_df = raw_df
+        self.template_file = template_file
+        self.logo_path = logo_path
+        self.pdf_options = pdf_options or {}
+        self._cache = {('template_config',): template_config} if template_config is not None else {}
+        self._lock = threading.Lock()
+        self.hits = 0
+
+    def _get(self, key, builder):
+        with self._lock:
+            if key in self._cache:
+                self.hits += 1
+                return self._cache[key]
+        value = builder()
+        with self._lock:
+            return self._cache.setdefault(key, value)
+
+    def template_config(self):
+        return self._get(('template_config',), lambda: core.read_configs(self.template_file))
+
+    def filtered(self, years, months, projects):
+        key = ('filtered', tuple(years or ()), tuple(months or ()), tuple(projects or ()))
+        return self._get(key, lambda: core.filter_time_entries(self.raw_df, years, months, projects))
+
+    def heatmaps(self, years, months, projects):
+        key = ('heatmaps', tuple(years or ()), tuple(months or ()), tuple(projects or ()))
+        return self._get(key, lambda: core.build_task_week_heatmaps(self.filtered(years, months, projects)))
+
+    def budget_burn(self, projects):
+        # Ngân sách tính trên toàn bộ lịch sử của các dự án, không theo năm/tháng của job
+        key = ('budget_burn', tuple(projects or ()))
+        return self._get(key, lambda: core.build_budget_burn(
+            self.filtered(None, None, projects), self.template_config().get('budget_df')))
+
+    def timeline(self, projects):
+        key = ('timeline', tuple(projects or ()))
+        return self._get(key, lambda: core.build_project_timeline(self.filtered(None, None, projects)))
+
+    def comparison(self, comparison_config, mode_key):
+        key = ('comparison', mode_key) + tuple(tuple(comparison_config[k]) for k in ('years', 'months', 'selected_projects'))
+        return self._get(key, lambda: core.apply_comparison_filters(self.raw_df, comparison_config, mode_key))
+
+    def trends(self, comparison_config):
+        key = ('trends',) + tuple(tuple(comparison_config[k]) for k in ('years', 'months', 'selected_projects'))
+        return self._get(key, lambda: core.apply_comparison_trends(self.raw_df, comparison_config))
+
+def _standard_config(job, shared):
+    """Cấu hình báo cáo tiêu chuẩn của job: giá trị trong spec ghi đè cấu hình template."""
+    template = shared.template_config()
+    config = {
+        'mode': job.get('mode', template['mode']),
+        'year': job.get('year', template['year']),
+        'months': job.get('months', template['months']),
+    }
+    projects = job.get('projects')
+    if projects == 'all':
+        projects = shared.raw_df['Project name'].unique().tolist()
+    if projects is None:
+        projects = template['project_filter_df']['Project Name'].tolist() if 'Project Name' in template['project_filter_df'].columns else []
+    config['project_filter_df'] = pd.DataFrame({'Project Name': projects, 'Include': 'yes'})
+    config['budget_df'] = template.get('budget_df')
+    return config, projects
+
+def prepare_job(job, shared):
+    """Chuẩn bị dữ liệu cho job; trả về danh sách (loại xuất, đường dẫn, hàm xuất) hoặc thông báo nếu không có dữ liệu."""
+    logo_path = shared.logo_path
+    pdf_options = {**shared.pdf_options, **job.get('pdf_options', {})}
+
+    if job['type'] == 'standard':
+        config, projects = _standard_config(job, shared)
+        # Báo cáo tiêu chuẩn trống khi không có dự án nào được chọn (giống apply_filters)
+        df = shared.filtered([config['year']], config['months'], projects) if projects else shared.raw_df.iloc[0:0]
+        if df.empty:
+            return [], "Không có dữ liệu với các bộ lọc đã chọn."
+        exports = []
+        budget_burn = shared.budget_burn(projects) if job.get('excel') or job.get('pdf') else None
+        if job.get('excel'):
+            exports.append(('excel', job['excel'], lambda path: core.export_report(df, config, path, budget_burn)))
+        if job.get('pdf'):
+            exports.append(('pdf', job['pdf'], lambda path: core.export_pdf_report(df, config, path, logo_path, pdf_options, budget_burn=budget_burn)))
+        if job.get('heatmap_excel') or job.get('heatmap_pdf'):
+            heatmaps = shared.heatmaps([config['year']], config['months'], projects)
+            if job.get('heatmap_excel'):
+                exports.append(('heatmap', job['heatmap_excel'], lambda path: core.export_heatmap_report(df, path, heatmaps)))
+            if job.get('heatmap_pdf'):
+                exports.append(('heatmap', job['heatmap_pdf'], lambda path: core.export_heatmap_pdf_report(df, path, logo_path, pdf_options, heatmaps)))
+        if job.get('timeline_excel') or job.get('timeline_pdf'):
+            df_history, timeline = shared.filtered(None, None, projects), shared.timeline(projects)
+            if job.get('timeline_excel'):
+                exports.append(('timeline', job['timeline_excel'], lambda path: core.export_timeline_report(df_history, path, timeline)))
+            if job.get('timeline_pdf'):
+                exports.append(('timeline', job['timeline_pdf'], lambda path: core.export_timeline_pdf_report(df_history, path, logo_path, pdf_options, timeline)))
+        return exports, None
+
+    if job['type'] == 'utilisation':
+        # Tỉ lệ sử dụng luôn tính trên mọi dự án của năm/tháng đã chọn
+        df = shared.filtered(job.get('years', []), job.get('months', []), None)
+        report = core.build_utilisation_report(df, shared.template_config().get('capacity_df'))
+        if not report:
+            return [], "Không có dữ liệu với các bộ lọc đã chọn."
+        return ([('excel', job['excel'], lambda path: core.export_utilisation_report(report, path))] if job.get('excel') else []), None
+
+    mode_key = core.resolve_comparison_mode(job['comparison_mode'])
+    # Tên chế độ tiếng Việt dùng cho tiêu đề báo cáo (như khi gọi từ ứng dụng)
+    mode_label = next(label for label, key in core.COMPARISON_MODE_ALIASES.items() if key == mode_key)
+    projects = job.get('projects', [])
+    if projects == 'all':
+        projects = shared.raw_df['Project name'].unique().tolist()
+    comparison_config = {'years': job.get('years', []), 'months': job.get('months', []), 'selected_projects': projects}
+    df_comparison, message = shared.comparison(comparison_config, mode_key)
+    if df_comparison.empty:
+        return [], message
+    df_trends = shared.trends(comparison_config) if job.get('trends') else None
+    exports = []
+    if job.get('excel'):
+        exports.append(('excel', job['excel'], lambda path: core.export_comparison_report(
+            df_comparison, comparison_config, path, mode_label, df_trends=df_trends)))
+    if job.get('pdf'):
+        exports.append(('pdf', job['pdf'], lambda path: core.export_comparison_pdf_report(
+            df_comparison, comparison_config, path, mode_label, logo_path, pdf_options)))
+    return exports, None
+
+def _timed(export_fn, path):
+    started = time.perf_counter()
+    try:
+        ok = bool(export_fn(path))
+    except Exception as e:
+        print(f"Lỗi khi xuất '{path}': {e}")
+        ok = False
+    return ok, time.perf_counter() - started
+
+def run_batch(spec, shared, max_workers=None):
+    """Chạy mọi job trong spec trên dữ liệu dùng chung; trả về danh sách kết quả (job, bước, trạng thái, giây, đường dẫn)."""
+    output_dir = spec.get('output_dir')
+    results = []
+    tasks = []
+    for job in spec['jobs']:
+        started = time.perf_counter()
+        exports, message = prepare_job(job, shared)
+        prepare_seconds = time.perf_counter() - started
+        if not exports:
+            results.append((job['name'], 'prepare', f"SKIPPED ({message or 'no outputs'})", prepare_seconds, '-'))
+            continue
+        results.append((job['name'], 'prepare', 'OK', prepare_seconds, '-'))
+        for kind, path, export_fn in exports:
+            if output_dir and not os.path.isabs(path):
+                path = os.path.join(output_dir, path)
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            tasks.append((job['name'], kind, path, export_fn))
+
+    max_workers = max_workers or spec.get('max_workers') or min(4, os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        # Chạy trong bản sao context để span của từng file xuất thuộc cùng trace với lần chạy batch
+        futures = [(name, kind, path, pool.submit(contextvars.copy_context().run, _timed, export_fn, path))
+                   for name, kind, path, export_fn in tasks]
+        for name, kind, path, future in futures:
+            ok, seconds = future.result()
+            results.append((name, kind, 'OK' if ok else 'FAILED', seconds, path))
+
+    tracing.log_event("Shared data cache hits", hits=shared.hits)
+    return results
+
+def print_summary(results, wall_seconds):
+    """In bảng tóm tắt thời gian và file đầu ra của từng job."""
+    name_w = max([len('Job')] + [len(r[0]) for r in results])
+    status_w = max([len('Status')] + [len(r[2]) for r in results])
+    print(f"\n{'Job':<{name_w}}  {'Step':<8}  {'Status':<{status_w}}  {'Time (s)':>9}  Output")
+    for name, kind, status, seconds, path in results:
+        print(f"{name:<{name_w}}  {kind:<8}  {status:<{status_w}}  {seconds:>9.2f}  {path}")
+    print(f"Total wall time: {wall_seconds:.2f}s")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run standard/comparison report jobs from a JSON or YAML batch spec.")
+    parser.add_argument('--spec', help="File spec JSON/YAML; bỏ trống để chạy bộ job mặc định từ template")
+    parser.add_argument('--max-workers', type=int, default=None, help="Số luồng xuất song song")
+    parser.add_argument('--memory-profile', metavar='FILE', default=None,
+                        help="Ghi đỉnh bộ nhớ và vị trí cấp phát lớn nhất theo từng bước ra file JSON (tracemalloc)")
+    args = parser.parse_args(argv)
+
+    paths = core.setup_paths()
+    spec = None
+    if args.spec:
+        spec = load_spec(args.spec)
+        if spec is None:
+            return 1
+    template_file = (spec or {}).get('template_file', paths['template_file'])
+    logo_path = (spec or {}).get('logo_path', paths['logo_path'])
+
+    if not os.path.exists(template_file):
+        print(f"Lỗi: Không tìm thấy file template Excel '{template_file}'. Vui lòng đảm bảo file này có trong cùng thư mục với script.")
+        return 1
+    if not os.path.exists(logo_path):
+        print(f"Cảnh báo: Không tìm thấy file logo '{logo_path}'. Báo cáo PDF sẽ được tạo mà không có logo.")
+
+    with profiling(args.memory_profile, label='batch_runner'), tracing.span('report', 'batch', spec=args.spec or '(default)'):
+        started = time.perf_counter()
+        raw_df = core.load_raw_data(template_file)
+        if raw_df.empty:
+            print("Không có dữ liệu thô để xử lý. Thoát chương trình.")
+            return 1
+        # Quy đổi chi phí một lần cho mọi job (khi template có sheet Config_Rates)
+        raw_df = core.apply_rates(raw_df, core.read_rate_config(template_file))
+        results = [('(load data)', '-', 'OK', time.perf_counter() - started, template_file)]
+
+        template_config = None
+        if spec is None:
+            template_config = core.read_configs(template_file)
+            spec = default_spec(raw_df, template_config, paths)
+        shared = SharedData(raw_df, template_file, logo_path, spec.get('pdf_options'), template_config)
+
+        results += run_batch(spec, shared, args.max_workers)
+    print_summary(results, time.perf_counter() - started)
+    return 1 if any(r[2] == 'FAILED' for r in results) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""Đo thời gian import (cold start) của từng entry point và so với ngân sách cho phép.
+
+Chạy: python bench_startup.py [--repeat 5] [--budget-scale 1.0]
+Mỗi lần đo chạy một tiến trình Python mới nên không bị ảnh hưởng bởi module đã cache.
+Thoát với mã 1 nếu entry point nào vượt ngân sách hoặc tải sớm thư viện vẽ/PDF.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Entry point -> (câu lệnh import, ngân sách giây)
+ENTRY_POINTS = {
+    'core': ("import a04ecaf1_1dae_4c90_8081_086cd7c7b725", 1.5),
+    'time_report_cli': ("import Time_report", 1.5),
+    # main_optimized.py chỉ chạy được trong runtime Streamlit, nên đo các import cấp module của nó
+    'streamlit_app': ("import streamlit; import a04ecaf1_1dae_4c90_8081_086cd7c7b725", 3.0),
+}
+
+# Các thư viện chỉ được phép tải khi thực sự vẽ biểu đồ / xuất PDF
+LAZY_MODULES = ['matplotlib', 'seaborn', 'fpdf']
+
+def measure_once(statement):
+    """Chạy câu lệnh import trong tiến trình mới; trả về (giây, danh sách import top, module nặng đã tải)."""
+    probe = (
+        "import sys, time\n"
+        "t0 = time.perf_counter()\n"
+        f"{statement}\n"
+        "elapsed = time.perf_counter() - t0\n"
+        f"loaded = [m for m in {LAZY_MODULES!r} if m in sys.modules]\n"
+        "print(f'__RESULT__ {elapsed} {\",\".join(loaded)}')\n"
+    )
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', probe],
+        cwd=SCRIPT_DIR, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr else "import failed")
+
+    result_line = [l for l in proc.stdout.splitlines() if l.startswith('__RESULT__')][0].split(' ')
+    elapsed = float(result_line[1])
+    loaded = [m for m in (result_line[2] if len(result_line) > 2 else '').split(',') if m]
+
+    # Dòng -X importtime: "import time: self [us] | cumulative | imported package"
+    top_level = []
+    for line in proc.stderr.splitlines():
+        parts = [p.strip() for p in line.replace('import time:', '').split('|')]
+        if len(parts) == 3 and parts[1].isdigit() and not parts[2].startswith(' ') and '.' not in parts[2]:
+            top_level.append((int(parts[1]) / 1e6, parts[2]))
+    top_level.sort(reverse=True)
+    return elapsed, top_level[:5], loaded
+
+def run(repeat, budget_scale):
+    print(f"{'Entry point':<18}{'median (s)':>12}{'min (s)':>10}{'budget (s)':>12}  status")
+    failures = 0
+    details = {}
+    for name, (statement, budget) in ENTRY_POINTS.items():
+        budget *= budget_scale
+        samples = []
+        for _ in range(repeat):
+            elapsed, top, loaded = measure_once(statement)
+            samples.append(elapsed)
+        median = statistics.median(samples)
+        status = "OK"
+        if median > budget:
+            status = "OVER BUDGET"
+        if loaded:
+            status = f"EAGER IMPORT ({', '.join(loaded)})"
+        if status != "OK":
+            failures += 1
+        details[name] = top
+        print(f"{name:<18}{median:>12.3f}{min(samples):>10.3f}{budget:>12.2f}  {status}")
+
+    print("\nSlowest top-level imports (last run):")
+    for name, top in details.items():
+        print(f"  {name}: " + ", ".join(f"{mod} {sec:.2f}s" for sec, mod in top))
+    return failures
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Startup (import time) benchmark for the time report entry points.")
+    parser.add_argument('--repeat', type=int, default=5, help="Số lần đo cho mỗi entry point")
+    parser.add_argument('--budget-scale', type=float, default=1.0, help="Nhân ngân sách (ví dụ 2.0 cho máy chậm)")
+    args = parser.parse_args()
+    sys.exit(1 if run(args.repeat, args.budget_scale) else 0)
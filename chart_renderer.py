@@ -0,0 +1,179 @@
+import os
+import threading
+import time
+
+import matplotlib
+import matplotlib.style
+from matplotlib.figure import Figure
+
+import tracing
+
+# Cấu hình font dùng chung cho mọi biểu đồ (trước đây được đặt lại trước mỗi biểu đồ)
+DEFAULT_RC = {
+    'font.family': 'sans-serif',
+    'font.sans-serif': ['Arial', 'Helvetica', 'Liberation Sans', 'DejaVu Sans'],
+    'axes.unicode_minus': False,
+}
+
+_style_lock = threading.Lock()
+_style_applied = False
+
+def setup_chart_style(style=None):
+    """Thiết lập font và style cho matplotlib, chỉ chạy một lần cho mỗi tiến trình."""
+    global _style_applied
+    with _style_lock:
+        if _style_applied:
+            return
+        if style:
+            matplotlib.style.use(style)
+        matplotlib.rcParams.update(DEFAULT_RC)
+        _style_applied = True
+
+class ChartRenderer:
+    """Vẽ biểu đồ bar/barh/line ra PNG, tái sử dụng một nhóm nhỏ Figure thay vì tạo mới."""
+
+    def __init__(self, pool_size=2, dpi=150, style=None):
+        setup_chart_style(style)
+        self.pool_size = pool_size
+        self.dpi = dpi
+        self.timings = []  # Danh sách (tên file, số giây) cho mỗi biểu đồ
+        self._pool = []
+        self._lock = threading.Lock()
+
+    # --- Quản lý pool Figure ---
+    def _acquire(self, figsize):
+        with self._lock:
+            fig = self._pool.pop() if self._pool else None
+        if fig is None:
+            # Figure không gắn với pyplot nên không cần plt.close và an toàn giữa các luồng
+            fig = Figure(figsize=figsize, layout='constrained')
+        else:
+            fig.set_size_inches(figsize, forward=False)
+        return fig, fig.add_subplot()
+
+    def _release(self, fig):
+        fig.clear()
+        with self._lock:
+            if len(self._pool) < self.pool_size:
+                self._pool.append(fig)
+
+    def _save(self, fig, path, dpi, started):
+        fig.savefig(path, dpi=dpi or self.dpi)
+        self._release(fig)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.timings.append((path, elapsed))
+        tracing.record_span('chart', elapsed, operation='render', file=os.path.basename(path))
+        return path
+
+    @staticmethod
+    def _decorate(ax, title, xlabel, ylabel, title_size):
+        ax.set_title(title, fontsize=title_size)
+        ax.set_xlabel(xlabel)
+        ax.set_ylabel(ylabel)
+
+    # --- Các loại biểu đồ ---
+    def barh(self, series, path, title="", xlabel="", ylabel="", color='skyblue',
+             figsize=(10, 5), title_size=9, label_fmt='%.1f', dpi=None):
+        """Biểu đồ cột ngang từ một Series (index là nhãn); phần tử đầu tiên nằm dưới cùng như pandas."""
+        started = time.perf_counter()
+        fig, ax = self._acquire(figsize)
+        bars = ax.barh(range(len(series)), series.values, color=color)
+        ax.set_yticks(range(len(series)), [str(i) for i in series.index])
+        ax.tick_params(axis='y', labelsize=8)
+        if label_fmt:
+            ax.bar_label(bars, fmt=label_fmt, label_type='edge', fontsize=8, padding=3)
+        self._decorate(ax, title, xlabel, ylabel, title_size)
+        return self._save(fig, path, dpi, started)
+
+    def bar(self, series, path, title="", xlabel="", ylabel="", color='teal',
+            figsize=(12, 7), title_size=12, rotation=0, label_fmt=None, dpi=None):
+        """Biểu đồ cột đứng từ một Series (index là nhãn trục X)."""
+        started = time.perf_counter()
+        fig, ax = self._acquire(figsize)
+        bars = ax.bar(range(len(series)), series.values, color=color)
+        ax.set_xticks(range(len(series)), [str(i) for i in series.index], rotation=rotation)
+        ax.set_ylim(bottom=0)
+        if label_fmt:
+            ax.bar_label(bars, fmt=label_fmt, label_type='edge', fontsize=8, padding=3)
+        self._decorate(ax, title, xlabel, ylabel, title_size)
+        return self._save(fig, path, dpi, started)
+
+    def line(self, data, path, title="", xlabel="", ylabel="", color=None,
+             figsize=(12, 7), title_size=12, rotation=0, legend_title=None, max_ticks=None, marker='o', dpi=None):
+        """Biểu đồ đường. `data` là Series (một đường) hoặc DataFrame (mỗi cột là một đường).
+
+        `max_ticks` giới hạn số nhãn trục X (giãn đều) cho chuỗi dài như chuỗi tuần.
+        """
+        started = time.perf_counter()
+        fig, ax = self._acquire(figsize)
+        labels = [str(i) for i in data.index]
+        positions = range(len(labels))
+        if hasattr(data, 'columns'):
+            for col in data.columns:
+                ax.plot(positions, data[col].values, marker=marker, label=str(col))
+            ax.legend(title=legend_title)
+        else:
+            ax.plot(positions, data.values, marker=marker, color=color)
+        step = max(1, -(-len(labels) // max_ticks)) if max_ticks else 1
+        ax.set_xticks(positions[::step], labels[::step], rotation=rotation)
+        ax.set_ylim(bottom=0)
+        self._decorate(ax, title, xlabel, ylabel, title_size)
+        return self._save(fig, path, dpi, started)
+
+    def heatmap(self, matrix, path, row_labels, col_labels, title="", xlabel="", ylabel="",
+                cmap='YlOrRd', figsize=(12, 7), title_size=12, max_col_ticks=26, dpi=None):
+        """Bản đồ nhiệt từ mảng 2 chiều (hàng x cột); ô bằng 0 để trắng, nhãn cột được giãn bớt nếu quá nhiều."""
+        import numpy as np
+
+        started = time.perf_counter()
+        fig, ax = self._acquire(figsize)
+        image = ax.imshow(np.ma.masked_equal(matrix, 0), aspect='auto', cmap=cmap, interpolation='nearest')
+        ax.set_facecolor('white')
+        ax.set_yticks(range(len(row_labels)), [str(r) for r in row_labels], fontsize=7)
+        step = max(1, -(-len(col_labels) // max_col_ticks))
+        ax.set_xticks(range(0, len(col_labels), step), [str(c) for c in col_labels[::step]], rotation=90, fontsize=7)
+        fig.colorbar(image, ax=ax, label="Hours")
+        self._decorate(ax, title, xlabel, ylabel, title_size)
+        return self._save(fig, path, dpi, started)
+
+    def gantt(self, labels, starts, ends, path, markers=None, title="", xlabel="", ylabel="", color='steelblue',
+              figsize=(12, 7), title_size=12, dpi=None):
+        """Biểu đồ Gantt: mỗi hàng một thanh từ `starts` đến `ends` (ngày); hàng đầu tiên nằm trên cùng.
+
+        `markers` (tùy chọn) đánh dấu một ngày trên mỗi thanh, ví dụ tuần cao điểm.
+        """
+        import matplotlib.dates as mdates
+
+        started = time.perf_counter()
+        fig, ax = self._acquire(figsize)
+        rows = range(len(labels))
+        start_num, end_num = mdates.date2num(starts), mdates.date2num(ends)
+        ax.barh(rows, end_num - start_num + 1, left=start_num, height=0.6, color=color)
+        if markers is not None:
+            ax.scatter(mdates.date2num(markers), rows, marker='D', s=14, color='darkred', zorder=3, label="Peak week")
+            ax.legend(loc='lower right', fontsize=8)
+        ax.set_yticks(rows, [str(l) for l in labels], fontsize=7)
+        ax.set_ylim(len(labels) - 0.5, -0.5)
+        locator = mdates.AutoDateLocator()
+        ax.xaxis.set_major_locator(locator)
+        ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+        ax.grid(axis='x', alpha=0.3)
+        self._decorate(ax, title, xlabel, ylabel, title_size)
+        return self._save(fig, path, dpi, started)
+
+    # --- Thống kê thời gian ---
+    def reset_timings(self):
+        with self._lock:
+            self.timings = []
+
+    def timing_summary(self):
+        """Trả về chuỗi tóm tắt thời gian vẽ: số biểu đồ, tổng, trung bình và chậm nhất."""
+        with self._lock:
+            timings = list(self.timings)
+        if not timings:
+            return "Chart timings: no charts rendered."
+        total = sum(t for _, t in timings)
+        slowest_path, slowest = max(timings, key=lambda x: x[1])
+        return (f"Chart timings: {len(timings)} charts, total {total:.2f}s, "
+                f"avg {total / len(timings) * 1000:.0f} ms, slowest {slowest * 1000:.0f} ms ({slowest_path})")
@@ -0,0 +1,108 @@
+import logging
+import os
+import threading
+import time
+
+import tracing
+
+class WatchedDataset:
+    """Dữ liệu dựng từ các file đầu vào, chỉ dựng lại khi file thực sự thay đổi (mtime/kích thước).
+
+    Việc kiểm tra file chạy khi gọi current()/get() (tối đa mỗi `poll_interval` giây một lần). Khi phát hiện thay đổi và
+    file đã ổn định qua hai lần kiểm tra liên tiếp (tránh đọc file đang được ghi), dữ liệu được dựng lại ở luồng
+    nền; trong lúc đó vẫn trả bản cũ. `is_valid(value)` (tùy chọn) loại bản dựng lỗi để giữ bản cũ.
+    """
+
+    def __init__(self, paths, loader, poll_interval=5.0, is_valid=None):
+        self.paths = list(paths)
+        self.loader = loader
+        self.poll_interval = poll_interval
+        self.is_valid = is_valid
+        self.version = 0
+        self._value = None
+        self._signature = None   # Chữ ký file của bản dữ liệu đang phục vụ
+        self._pending = None     # Chữ ký mới thấy ở lần kiểm tra trước, chờ ổn định
+        self._failed = None      # Chữ ký đã dựng lỗi: không thử lại cho tới khi file đổi tiếp
+        self._last_poll = 0.0
+        self._rebuilding = False
+        self._lock = threading.Lock()
+
+    def signature(self):
+        """(đường dẫn, mtime_ns, kích thước) của từng file đầu vào; file không tồn tại được ghi là None."""
+        result = []
+        for path in self.paths:
+            try:
+                stat = os.stat(path)
+                result.append((path, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                result.append((path, None, None))
+        return tuple(result)
+
+    def current(self):
+        """(phiên bản, dữ liệu) hiện tại; lần đầu dựng đồng bộ, các lần sau chỉ kiểm tra file và dựng lại ở nền khi cần.
+
+        Phiên bản tăng mỗi lần dữ liệu được thay, dùng làm khóa cho các bộ nhớ đệm phái sinh.
+        """
+        with self._lock:
+            if self._value is None:
+                signature = self.signature()
+                self._value = self.loader()
+                self._signature = signature
+                self._last_poll = time.monotonic()
+                self.version += 1
+                return self.version, self._value
+        self._poll()
+        with self._lock:
+            return self.version, self._value
+
+    def get(self):
+        """Dữ liệu hiện tại (xem current)."""
+        return self.current()[1]
+
+    def _poll(self, force=False):
+        with self._lock:
+            now = time.monotonic()
+            if self._rebuilding or (not force and now - self._last_poll < self.poll_interval):
+                return
+            self._last_poll = now
+            signature = self.signature()
+            if signature == self._signature or signature == self._failed:
+                self._pending = None
+                return
+            if signature != self._pending and not force:
+                # Mới thấy thay đổi: chờ lần kiểm tra sau để chắc file đã ghi xong
+                self._pending = signature
+                return
+            self._pending = None
+            self._rebuilding = True
+        threading.Thread(target=self._rebuild, args=(signature,), name='dataset-rebuild', daemon=True).start()
+
+    def _rebuild(self, signature):
+        started = time.perf_counter()
+        try:
+            value = self.loader()
+            if self.is_valid is not None and not self.is_valid(value):
+                raise ValueError("dữ liệu dựng lại không hợp lệ")
+        except Exception as e:
+            print(f"Lỗi khi dựng lại dữ liệu từ {', '.join(self.paths)}: {e}. Tiếp tục dùng bản cũ.")
+            with self._lock:
+                self._failed = signature
+                self._rebuilding = False
+            return
+        # Chỉ dựng xong mới hoán đổi, nên người đọc luôn thấy trọn một bản (cũ hoặc mới)
+        with self._lock:
+            self._value = value
+            self._signature = signature
+            self._failed = None
+            self._rebuilding = False
+            self.version += 1
+        tracing.log_event("Dataset rebuilt", logging.INFO, version=self.version,
+                          seconds=round(time.perf_counter() - started, 3), paths=self.paths)
+
+    def refresh(self):
+        """Kiểm tra file ngay (bỏ qua khoảng chờ và bước chờ ổn định); dựng lại ở nền nếu đã thay đổi."""
+        self._poll(force=True)
+
+    def is_rebuilding(self):
+        with self._lock:
+            return self._rebuilding
@@ -0,0 +1,268 @@
+"""Kiểm thử tải: mô phỏng N người dùng đồng thời trên main_optimized.py bằng streamlit.testing (AppTest).
+
+Chạy: python load_test.py [--sessions 8] [--iterations 3] [--rows 50000] [--think 0.5] [--p95-budget 10]
+Mỗi phiên là một AppTest riêng chạy trong một luồng của cùng tiến trình (giống server Streamlit: các phiên dùng
+chung st.cache_resource/st.cache_data). Dữ liệu tổng hợp được ghi vào thư mục tạm làm thư mục làm việc.
+Mỗi phiên lặp lại luồng: mở trang, đăng nhập, đổi bộ lọc, xuất báo cáo tiêu chuẩn, đổi bộ lọc so sánh, xuất
+báo cáo so sánh. Kết quả: p50/p95/p99 theo từng bước, thông lượng và đỉnh RSS.
+App dùng danh sách mời và nhật ký truy cập riêng trong thư mục làm việc (TIME_REPORT_INVITES_FILE /
+TIME_REPORT_ACCESS_LOG) với email tổng hợp, nên không ghi gì vào access_log.sqlite3 thật.
+Thoát với mã 1 nếu có bước lỗi hoặc p95 của bước xuất báo cáo vượt --p95-budget.
+"""
+import argparse
+import datetime
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pandas as pd
+
+from memory_budget import process_rss
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_FILE = os.path.join(SCRIPT_DIR, 'main_optimized.py')
+
+MONTH_NAMES = ['January', 'February', 'March', 'April', 'May', 'June',
+               'July', 'August', 'September', 'October', 'November', 'December']
+WORKCENTRES = ['Cutting', 'Layup', 'Finishing', 'QA', 'Design']
+REPORT_STEPS = ['standard_report', 'comparison_report']
+# shared_runtime() dùng API nội bộ của Streamlit: đã kiểm tra với phiên bản này (ghim trong requirements.txt)
+STREAMLIT_VERSION = '1.66.0'
+# Email tổng hợp (tên miền .invalid không bao giờ tồn tại), chỉ có trong danh sách mời tạm của lần chạy
+LOAD_TEST_EMAIL = 'load-test@example.invalid'
+
+def build_synthetic_template(path, rows, projects=12, employees=25, seed=0):
+    """Ghi file mẫu tổng hợp (Raw Data + các sheet cấu hình) cho hai năm gần nhất; trả về danh sách năm."""
+    rng = np.random.default_rng(seed)
+    this_year = datetime.date.today().year
+    years = [this_year - 1, this_year]
+    start = pd.Timestamp(years[0], 1, 1)
+    days = (pd.Timestamp.today().normalize() - start).days + 1
+    project_names = [f"Project {i:02d}" for i in range(projects)]
+    employee_names = [f"Employee {i:02d}" for i in range(employees)]
+    raw = pd.DataFrame({
+        'Date': start + pd.to_timedelta(rng.integers(0, days, rows), unit='D'),
+        'Team member': rng.choice(employee_names, rows),
+        'Project Name': rng.choice(project_names, rows),
+        'Workcentre': rng.choice(WORKCENTRES, rows),
+        'Task': rng.choice([f"Task {i}" for i in range(30)], rows),
+        'Hou': rng.uniform(0.5, 9, rows).round(1),
+    })
+    with pd.ExcelWriter(path, engine='openpyxl') as writer:
+        raw.to_excel(writer, sheet_name='Raw Data', index=False)
+        pd.DataFrame({'Key': ['mode', 'year', 'months'], 'Value': ['year', this_year, '']}).to_excel(
+            writer, sheet_name='Config_Year_Mode', index=False)
+        pd.DataFrame({'Project Name': project_names, 'Include': ['yes'] * projects}).to_excel(
+            writer, sheet_name='Config_Project_Filter', index=False)
+        pd.DataFrame({'Employee': employee_names, 'Weekly Capacity': 38.0}).to_excel(
+            writer, sheet_name='Config_Capacity', index=False)
+        pd.DataFrame({'Project Name': project_names, 'Budget Hours': rng.integers(500, 5000, projects),
+                      'Deadline': pd.Timestamp(this_year, 12, 31)}).to_excel(
+            writer, sheet_name='Config_Project_Budget', index=False)
+        pd.DataFrame({'Employee': employee_names, 'Workcentre': '', 'Effective From': start,
+                      'Hourly Rate': rng.uniform(40, 120, employees).round(0)}).to_excel(
+            writer, sheet_name='Config_Rates', index=False)
+    return years, project_names
+
+class SessionFlow:
+    """Một người dùng mô phỏng: mỗi bước là một lần chạy lại script, được đo thời gian và ghi vào `samples`."""
+
+    def __init__(self, number, email, years, projects, samples, lock, think=0.0, timeout=300):
+        self.number = number
+        self.email = email
+        self.years = years
+        self.projects = projects
+        self.samples = samples
+        self.lock = lock
+        self.think = think
+        self.timeout = timeout
+        self.rng = random.Random(number)
+
+    def step(self, name, action):
+        """Chạy `action()` (trả về AppTest sau lần chạy), ghi (bước, giây, lỗi/st.error) rồi nghỉ `think` giây."""
+        started = time.perf_counter()
+        error = None
+        try:
+            at = action()
+            if at.exception:
+                error = at.exception[0].message
+            elif at.error:
+                # Lỗi app tự bắt và hiện trên trang (ví dụ xuất báo cáo thất bại) cũng tính là bước lỗi
+                error = at.error[0].value
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.samples.append((name, elapsed, error))
+        if error:
+            print(f"Lỗi ở phiên {self.number}, bước {name}: {error}")
+        if self.think:
+            time.sleep(self.rng.uniform(0, 2 * self.think))
+        return error is None
+
+    def run(self, iterations):
+        from streamlit.testing.v1 import AppTest
+
+        at = AppTest.from_file(APP_FILE, default_timeout=self.timeout)
+        if not self.step('open', at.run):
+            return
+        if not self.step('login', lambda: at.text_input[0].input(self.email).run()):
+            return
+        for _ in range(iterations):
+            months = sorted(self.rng.sample(MONTH_NAMES, self.rng.randint(1, 12)), key=MONTH_NAMES.index)
+            projects = sorted(self.rng.sample(self.projects, self.rng.randint(1, len(self.projects))))
+            self.step('filter', lambda: at.selectbox(key='standard_year_tab').set_value(self.rng.choice(self.years)).run())
+            self.step('filter', lambda: at.multiselect(key='standard_months_tab').set_value(months).run())
+            self.step('filter', lambda: at.multiselect(key='standard_project_selection_tab').set_value(projects).run())
+            self.step('standard_report', lambda: at.button(key='generate_standard_report_btn_tab').click().run())
+
+            compared = sorted(self.rng.sample(self.projects, min(3, len(self.projects))))
+            self.step('filter', lambda: at.multiselect(key='comp_projects_select_tab_common').set_value(compared).run())
+            self.step('filter', lambda: at.multiselect(key='comp_years_select_tab_general').set_value([self.rng.choice(self.years)]).run())
+            self.step('filter', lambda: at.multiselect(key='comp_months_select_tab_general').set_value([self.rng.choice(MONTH_NAMES)]).run())
+            self.step('comparison_report', lambda: at.button(key='generate_comparison_report_btn_tab').click().run())
+
+@contextmanager
+def shared_runtime():
+    """Cho mọi AppTest dùng chung một runtime giả, như các phiên trên cùng một server Streamlit.
+
+    Mỗi lần AppTest.run() tự tạo runtime giả rồi gán Runtime._instance = None khi chạy xong, nên các phiên chạy
+    song song sẽ làm hỏng runtime của nhau; ở đây Runtime.instance() luôn trả về một runtime dùng chung
+    (bộ nhớ đệm st.cache_data/media cũng dùng chung giữa các phiên như khi chạy thật). Bytecode của script cũng
+    chỉ biên dịch một lần như server thật, thay vì mỗi lần chạy lại (ast.parse song song còn lỗi trên Python 3.11).
+    Các module này là nội bộ của Streamlit (xem STREAMLIT_VERSION); phiên bản khác có thể không còn chúng.
+    """
+    import streamlit
+
+    if streamlit.__version__ != STREAMLIT_VERSION:
+        print(f"Cảnh báo: load_test.py được viết cho Streamlit {STREAMLIT_VERSION}, đang cài {streamlit.__version__}.")
+    try:
+        from streamlit.components.v2.component_manager import BidiComponentManager
+        from streamlit.runtime import Runtime
+        from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+        from streamlit.runtime.dataframe_source_manager import DataframeSourceManager
+        from streamlit.runtime.media_file_manager import MediaFileManager
+        from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+        from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+        from streamlit.testing.v1 import app_test
+        from streamlit.testing.v1.util import patch_config_options
+
+        runtime = MagicMock(spec=Runtime)
+        runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+        runtime.dataframe_source_mgr = DataframeSourceManager()
+        runtime.cache_storage_manager = MemoryCacheStorageManager()
+        runtime.bidi_component_registry = BidiComponentManager()
+        runtime.bidi_component_registry.discover_and_register_components(start_file_watching=False)
+        script_cache = ScriptCache()
+        script_cache.get_bytecode(APP_FILE)
+        if not hasattr(app_test, 'ScriptCache') or not hasattr(Runtime, 'instance') or not hasattr(Runtime, 'exists'):
+            raise AttributeError("streamlit.testing.v1.app_test.ScriptCache / Runtime.instance / Runtime.exists")
+    except (ImportError, AttributeError, TypeError) as e:
+        raise SystemExit(f"load_test.py cần API nội bộ của Streamlit {STREAMLIT_VERSION} (đang cài {streamlit.__version__}), "
+                         f"hãy cài streamlit=={STREAMLIT_VERSION}: {e}")
+    # Cấu hình global.appTest được bật sẵn cho cả lần chạy, để các lần vá lồng nhau của từng phiên không tắt nó
+    with patch_config_options({"global.appTest": True}), \
+            patch.object(Runtime, 'instance', classmethod(lambda cls: runtime)), \
+            patch.object(Runtime, 'exists', classmethod(lambda cls: True)), \
+            patch('streamlit.testing.v1.app_test.ScriptCache', lambda: script_cache):
+        yield runtime
+
+class RssSampler:
+    """Lấy mẫu RSS của tiến trình ở luồng nền để biết đỉnh bộ nhớ trong lúc chạy tải."""
+
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.peak = process_rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name='rss-sampler', daemon=True)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, process_rss())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, process_rss())
+
+def summarize(samples, wall_seconds, peak_rss, p95_budget=None):
+    """In bảng độ trễ theo bước, thông lượng, đỉnh RSS; trả về số lỗi (tính cả bước báo cáo vượt ngân sách)."""
+    df = pd.DataFrame(samples, columns=['step', 'seconds', 'error'])
+    print(f"\n{'Step':<20}{'count':>7}{'errors':>8}{'p50 (s)':>10}{'p95 (s)':>10}{'p99 (s)':>10}{'max (s)':>10}")
+    failures = 0
+    for step, group in df.groupby('step', sort=False):
+        ok = group.loc[group['error'].isna(), 'seconds'].to_numpy()
+        errors = int(group['error'].notna().sum())
+        p50, p95, p99 = np.percentile(ok, [50, 95, 99]) if len(ok) else (float('nan'),) * 3
+        status = ""
+        if p95_budget is not None and step in REPORT_STEPS and p95 > p95_budget:
+            status = "  OVER BUDGET"
+            failures += 1
+        failures += errors
+        print(f"{step:<20}{len(group):>7}{errors:>8}{p50:>10.3f}{p95:>10.3f}{p99:>10.3f}"
+              f"{(ok.max() if len(ok) else float('nan')):>10.3f}{status}")
+    reports = int(df['step'].isin(REPORT_STEPS).sum())
+    print(f"\nWall time: {wall_seconds:.1f}s, {len(df)} reruns ({len(df) / wall_seconds:.2f}/s), "
+          f"{reports} reports ({reports / wall_seconds * 60:.1f}/min)")
+    print(f"Peak RSS: {peak_rss / 1024 / 1024:.0f} MB")
+    return failures
+
+def run(sessions, iterations, rows, think, p95_budget, email=LOAD_TEST_EMAIL, timeout=300, workdir=None, keep=False):
+    workdir = workdir or tempfile.mkdtemp(prefix='time-report-load-')
+    os.makedirs(workdir, exist_ok=True)
+    years, projects = build_synthetic_template(os.path.join(workdir, 'Time_report.xlsm'), rows)
+    shutil.copy(os.path.join(SCRIPT_DIR, 'triac_logo.png'), workdir)
+    # Danh sách mời và nhật ký truy cập riêng của lần chạy (không đụng tới file thật cạnh main_optimized.py)
+    invites_path = os.path.join(workdir, 'invited_emails.csv')
+    with open(invites_path, 'w', encoding='utf-8') as f:
+        f.write(f"email\n{email}\n")
+    app_env = {'TIME_REPORT_INVITES_FILE': invites_path,
+               'TIME_REPORT_ACCESS_LOG': os.path.join(workdir, 'access_log.sqlite3')}
+    # App đọc file mẫu/logo và ghi báo cáo theo đường dẫn tương đối với thư mục hiện tại
+    previous_dir = os.getcwd()
+    os.chdir(workdir)
+    print(f"Synthetic data: {rows} rows, {len(projects)} projects, years {years} in {workdir}")
+    print(f"Running {sessions} sessions x {iterations} iterations as {email}...")
+
+    samples, lock = [], threading.Lock()
+    flows = [SessionFlow(i, email, years, projects, samples, lock, think, timeout) for i in range(sessions)]
+    threads = [threading.Thread(target=flow.run, args=(iterations,), name=f'session-{flow.number}') for flow in flows]
+    try:
+        with patch.dict(os.environ, app_env), shared_runtime(), RssSampler() as rss:
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            wall_seconds = time.perf_counter() - started
+    finally:
+        os.chdir(previous_dir)
+        if not keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return summarize(samples, wall_seconds, rss.peak, p95_budget)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=8, help="số phiên (người dùng) đồng thời")
+    parser.add_argument('--iterations', type=int, default=3, help="số lần lặp luồng báo cáo của mỗi phiên")
+    parser.add_argument('--rows', type=int, default=50000, help="số dòng Raw Data tổng hợp")
+    parser.add_argument('--think', type=float, default=0.0, help="thời gian nghỉ trung bình giữa các bước (giây)")
+    parser.add_argument('--p95-budget', type=float, default=None, help="ngân sách p95 (giây) cho bước xuất báo cáo")
+    parser.add_argument('--email', default=LOAD_TEST_EMAIL, help="email đăng nhập, được thêm vào danh sách mời tạm")
+    parser.add_argument('--timeout', type=float, default=300, help="thời gian tối đa cho một lần chạy lại (giây)")
+    parser.add_argument('--workdir', default=None, help="thư mục làm việc (mặc định: thư mục tạm, xóa sau khi chạy)")
+    parser.add_argument('--keep', action='store_true', help="giữ lại thư mục làm việc và báo cáo đã xuất")
+    args = parser.parse_args()
+    sys.exit(1 if run(args.sessions, args.iterations, args.rows, args.think, args.p95_budget,
+                      args.email.strip().lower(), args.timeout, args.workdir, args.keep) else 0)
@@ -1,25 +1,56 @@
 import streamlit as st
 import pandas as pd
 import os
+import json
+import tempfile
 from datetime import datetime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from dataset_watcher import WatchedDataset
+from access_store import AccessLog, InviteList
+from upload_worker import UploadParser
+from memory_budget import MemoryBudget, deep_nbytes
+from memory_profile import MEMORY_PROFILE, MemoryProfiler
+import tracing
 
 # ==============================================================================
 # ĐẢM BẢO FILE 'a04ecaf1_1dae_4c90_8081_086cd7c7b725.py' NẰNG CÙNG THƯ MỤC
 # HOẶC THAY THẾ TÊN FILE NẾU BẠN ĐÃ ĐỔI TÊN NÓ.
 # ==============================================================================
 from a04ecaf1_1dae_4c90_8081_086cd7c7b725 import (
-    setup_paths, load_raw_data, read_configs,
-    apply_filters, export_report, export_pdf_report,
-    apply_comparison_filters, export_comparison_report, export_comparison_pdf_report
+    setup_paths, load_raw_data, read_configs, apply_rates, read_only_view, UPLOAD_LIMITS,
+    export_report, export_pdf_report, build_chart_aggregates,
+    apply_comparison_filters, apply_comparison_trends, export_comparison_report, export_comparison_pdf_report,
+    TimeQuery, time_query_engines, filtered_view, memoized, preview, preview_options, build_preview_index, build_utilisation_report, export_utilisation_report, build_budget_burn,
+    build_task_week_heatmaps, export_heatmap_report, export_heatmap_pdf_report,
+    build_project_timeline, export_timeline_report, export_timeline_pdf_report,
+    detect_anomalies,
+    DEFAULT_WEEKLY_CAPACITY, UTILISATION_THRESHOLDS, ANOMALY_THRESHOLDS
 )
 # ==============================================================================
 
 script_dir = os.path.dirname(__file__)
-csv_file_path = os.path.join(script_dir, "invited_emails.csv")
+# Danh sách mời và nhật ký truy cập cạnh script; đặt TIME_REPORT_INVITES_FILE / TIME_REPORT_ACCESS_LOG để dùng file
+# khác (load_test.py dùng file trong thư mục tạm để không ghi vào nhật ký thật)
+csv_file_path = os.environ.get('TIME_REPORT_INVITES_FILE') or os.path.join(script_dir, "invited_emails.csv")
+access_log_path = os.environ.get('TIME_REPORT_ACCESS_LOG') or os.path.join(script_dir, "access_log.sqlite3")
 
 # Gọi hàm setup_paths ngay từ đầu để path_dict có sẵn
 path_dict = setup_paths()
 
+# Báo cáo được xuất vào thư mục tạm riêng của từng phiên: mọi phiên chạy chung một tiến trình và thư mục làm việc,
+# nên tên file cố định theo ngày của setup_paths() sẽ bị phiên khác ghi đè giữa lúc xuất và lúc tải về (hoặc tải
+# nhầm báo cáo của người khác). TemporaryDirectory tự xóa thư mục khi session_state của phiên được giải phóng.
+def session_output_dir():
+    if 'report_output_dir' not in st.session_state:
+        st.session_state.report_output_dir = tempfile.TemporaryDirectory(prefix='time-report-')
+    return st.session_state.report_output_dir.name
+
+def session_output_paths():
+    """path_dict với các file báo cáo nằm trong thư mục tạm của phiên (file mẫu và logo giữ nguyên)."""
+    output_dir = session_output_dir()
+    return {key: value if key in ('template_file', 'logo_path') else os.path.join(output_dir, value)
+            for key, value in path_dict.items()}
+
 # ==============================================================================
 # KHỞI TẠO CÁC BIẾN TRẠNG THÁI PHIÊN (SESSION STATE VARIABLES)
 # ==============================================================================
@@ -52,30 +83,40 @@ if 'selected_language' not in st.session_state:
 # PHẦN XÁC THỰC TRUY CẬP
 # ---------------------------
 
-@st.cache_data
-def load_invited_emails():
+# Danh sách mời (tập hợp, tra cứu O(1)) dùng chung cho mọi phiên; file CSV chỉ được đọc lại khi thay đổi
+@st.cache_resource
+def get_invite_list():
+    return InviteList(csv_file_path)
+
+# Nhật ký truy cập lưu bền trong SQLite, ghi theo lô ở luồng nền
+@st.cache_resource
+def get_access_log():
+    return AccessLog(access_log_path)
+
+def check_invited(email, role='user'):
+    """Email có trong danh sách mời (role='admin': có vai trò admin) hay không; lỗi đọc file được báo trên trang."""
     try:
-        df = pd.read_csv(csv_file_path, header=None, encoding='utf-8')
-        # Sửa lỗi: Thêm .str trước .strip()
-        emails = df.iloc[:, 0].astype(str).str.strip().str.lower().tolist()
-        return emails
+        invite_list = get_invite_list()
+        return invite_list.is_admin(email) if role == 'admin' else invite_list.is_invited(email)
     except FileNotFoundError:
         st.error(f"Lỗi: Không tìm thấy file invited_emails.csv tại {csv_file_path}. Vui lòng kiểm tra đường dẫn.")
-        return []
     except Exception as e:
         st.error(f"Lỗi khi tải file invited_emails.csv: {e}")
-        return []
+    return False
 
-# Tải danh sách email được mời một lần
-INVITED_EMAILS = load_invited_emails()
+# Hàm ghi log truy cập (chỉ đưa vào hàng đợi, không chờ ghi đĩa)
+def log_user_access(email, event='login', detail=None):
+    try:
+        get_access_log().log(email, event, detail)
+    except Exception as e:
+        print(f"Lỗi khi ghi access log: {e}")
 
-# Hàm ghi log truy cập
-def log_user_access(email):
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    log_entry = {"Time": timestamp, "Email": email}
-    if "access_log" not in st.session_state:
-        st.session_state.access_log = []
-    st.session_state.access_log.append(log_entry)
+# Số liệu Prometheus qua HTTP (/metrics) khi đặt TIME_REPORT_METRICS_PORT; một server cho cả tiến trình
+@st.cache_resource
+def get_metrics_server():
+    return tracing.start_metrics_server()
+
+get_metrics_server()
 
 # Logic xác thực người dùng
 if "user_email" not in st.session_state:
@@ -85,7 +126,7 @@ if "user_email" not in st.session_state:
 
     if email_input:
         email = email_input.strip().lower()
-        if email in INVITED_EMAILS:
+        if check_invited(email):
             st.session_state.user_email = email
             log_user_access(email)
             st.success("✅ Valid email! Entering application...")
@@ -94,6 +135,11 @@ if "user_email" not in st.session_state:
             st.error("❌ Email is not on the invitation list.")
     st.stop() # Dừng thực thi nếu chưa xác thực
 
+# Email bị xóa khỏi danh sách mời thì phiên đang mở cũng mất quyền truy cập (tra cứu tập hợp, không đọc file)
+if not check_invited(st.session_state.user_email):
+    del st.session_state.user_email
+    st.rerun()
+
 # ---------------------------
 # PHẦN GIAO DIỆN CHÍNH CỦA ỨNG DỤNG
 # ---------------------------
@@ -167,7 +213,7 @@ TEXTS = {
         'download_comparison_pdf': "📥 Download Comparison PDF",
         'failed_to_generate_comparison_excel': "❌ Failed to generate Comparison Excel report.",
         'failed_to_generate_comparison_pdf': "❌ Failed to generate Comparison PDF report.",
-        'raw_data_preview_header': "Raw Input Data (First 100 rows)",
+        'raw_data_preview_header': "Raw Input Data",
         'no_raw_data': "No raw data loaded.",
         'no_year_in_data': "No years in data to select.",
         'user_guide': "User Guide",
@@ -188,7 +234,74 @@ TEXTS = {
         'comparison_over_years_note': "Note: You have selected multiple years. The report will compare the project's data across the selected years. Month selection will be ignored.",
         'comparison_over_months_note': "Note: The report will compare the project's data across the selected months in year {}.",
         'no_comparison_criteria_selected': "Please select at least one year or month for comparison.",
-        'no_month_selected_for_single_year': "Please select at least one month when comparing a single project within a specific year."
+        'no_month_selected_for_single_year': "Please select at least one month when comparing a single project within a specific year.",
+        'interactive_charts': "📈 Interactive charts",
+        'chart_hours_by_project': "Hours by Project",
+        'chart_hours_by_workcentre': "Hours by Workcentre",
+        'chart_hours_by_task': "Hours by Task",
+        'chart_hours_by_month': "Hours by Month",
+        'chart_project_month': "Hours by Project and Month",
+        'no_chart_data': "No data for the current selection.",
+        'period_trends': "📈 Period trends (vs previous period / same period last year, rolling means)",
+        'employee_utilisation': "👥 Employee utilisation (weekly hours vs capacity)",
+        'utilisation_caption': "All projects in the selected year/months. Capacity comes from the Config_Capacity sheet (default {}h/week); below {}% is under-allocated, above {}% is over-allocated.",
+        'utilisation_weekly': "Weekly detail",
+        'utilisation_project_split': "Project split per employee",
+        'download_utilisation_excel': "Download Utilisation Excel",
+        'generate_utilisation_btn': "Calculate Utilisation",
+        'export_heatmap_option': "Export Task × ISO week heatmap (Excel + PDF)",
+        'generating_heatmap_report': "Generating Task × week heatmap...",
+        'heatmap_report_generated': "Heatmap reports generated: {} and {}",
+        'failed_to_generate_heatmap': "Failed to generate heatmap report.",
+        'download_heatmap_excel': "Download Heatmap Excel",
+        'download_heatmap_pdf': "Download Heatmap PDF",
+        'export_timeline_option': "Export project timeline / Gantt (Excel + PDF, full history of the selected projects)",
+        'generating_timeline_report': "Generating project timeline...",
+        'timeline_report_generated': "Timeline reports generated: {} and {}",
+        'failed_to_generate_timeline': "Failed to generate project timeline.",
+        'download_timeline_excel': "Download Timeline Excel",
+        'download_timeline_pdf': "Download Timeline PDF",
+        'pdf_charts_per_page': "PDF charts per page:",
+        'pdf_image_dpi': "PDF image resolution (DPI):",
+        'pdf_include_totals_table': "Add project totals table to PDF",
+        'pdf_progress': "{} / {} projects · {} pages written",
+        'anomalies_header': "🚩 Anomalies in logged hours",
+        'anomalies_caption': "Daily totals over {}h (impossible over {}h), duplicate entries and copied weeks, hours after a project's Closed Date, and day/week totals far above the employee's or project's usual level (z-score > {} or MAD score > {}).",
+        'anomalies_none': "No anomalies found.",
+        'anomalies_by_rule': "Findings by rule",
+        'anomalies_rule_filter': "Rules to show:",
+        'preview_search': "Search project, task or employee:",
+        'preview_filter_year': "Year",
+        'preview_filter_month': "Month",
+        'preview_filter_project': "Project",
+        'preview_filter_workcentre': "Workcentre",
+        'preview_filter_employee': "Employee",
+        'preview_page_size': "Rows per page",
+        'preview_page': "Page",
+        'preview_rows_caption': "Rows {}–{} of {:,} · page {} / {}",
+        'preview_no_match': "No entries match the current filters.",
+        'data_reloaded': "🔄 The template file changed: data has been reloaded.",
+        'access_log_header': "📜 Access log",
+        'access_log_own': "Your 20 most recent logins and reports.",
+        'access_log_email': "Email",
+        'access_log_event': "Event",
+        'access_log_since': "From",
+        'access_log_until': "To",
+        'access_log_summary': "Activity by user",
+        'upload_header': "📤 Use your own timesheet file",
+        'upload_caption': "Excel (sheet 'Raw Data' or the first sheet) or CSV with Date, Employee, Project name, Workcentre, Task and Hours columns. Up to {} MB, {:,} rows and {} seconds of processing. Project, budget and rate settings still come from the template.",
+        'upload_label': "Timesheet file",
+        'upload_parsing': "Processing {}... {:.0f}s",
+        'upload_failed': "❌ Could not use the uploaded file: {}",
+        'upload_expired': "The uploaded file {} is no longer cached. Please upload it again.",
+        'upload_in_use': "Reports use the uploaded file {} ({:,} rows). Remove the file to go back to the server data.",
+        'memory_header': "🧠 Memory usage",
+        'memory_rss': "Process memory (RSS)",
+        'memory_tracked': "Caches and sessions / budget",
+        'memory_evictions': "Evicted entries",
+        'memory_profile_toggle': "Profile memory per report stage (slows down every session while on)",
+        'memory_profile_active': "Profiling: results are written to {path} after each report.",
+        'memory_profile_download': "Download memory profile (JSON)"
     },
     'vi': {
         'app_title': "📊 Công cụ tạo báo cáo thời gian",
@@ -240,7 +353,7 @@ TEXTS = {
         'download_comparison_pdf': "📥 Tải báo cáo PDF so sánh",
         'failed_to_generate_comparison_excel': "❌ Đã xảy ra lỗi khi tạo báo cáo Excel so sánh.",
         'failed_to_generate_comparison_pdf': "❌ Đã xảy ra lỗi khi tạo báo cáo PDF so sánh.",
-        'raw_data_preview_header': "Dữ liệu đầu vào thô (100 hàng đầu)",
+        'raw_data_preview_header': "Dữ liệu đầu vào thô",
         'no_raw_data': "Không có dữ liệu thô được tải.",
         'no_year_in_data': "Không có năm nào trong dữ liệu để chọn.",
         'user_guide': "Hướng dẫn sử dụng",
@@ -261,7 +374,74 @@ TEXTS = {
         'comparison_over_years_note': "Lưu ý: Bạn đã chọn nhiều năm. Báo cáo sẽ so sánh dữ liệu của dự án qua các năm đã chọn. Lựa chọn tháng sẽ bị bỏ qua.",
         'comparison_over_months_note': "Lưu ý: Báo cáo sẽ so sánh dữ liệu của dự án qua các tháng đã chọn trong năm {}.",
         'no_comparison_criteria_selected': "Vui lòng chọn ít nhất một năm hoặc một tháng để so sánh.",
-        'no_month_selected_for_single_year': "Vui lòng chọn ít nhất một tháng khi so sánh một dự án trong một năm cụ thể."
+        'no_month_selected_for_single_year': "Vui lòng chọn ít nhất một tháng khi so sánh một dự án trong một năm cụ thể.",
+        'interactive_charts': "📈 Biểu đồ tương tác",
+        'chart_hours_by_project': "Số giờ theo dự án",
+        'chart_hours_by_workcentre': "Số giờ theo workcentre",
+        'chart_hours_by_task': "Số giờ theo task",
+        'chart_hours_by_month': "Số giờ theo tháng",
+        'chart_project_month': "Số giờ theo dự án và tháng",
+        'no_chart_data': "Không có dữ liệu cho lựa chọn hiện tại.",
+        'period_trends': "📈 Xu hướng theo kỳ (so với kỳ trước / cùng kỳ năm trước, trung bình trượt)",
+        'employee_utilisation': "👥 Tỉ lệ sử dụng nhân viên (giờ theo tuần so với công suất)",
+        'utilisation_caption': "Tất cả dự án trong năm/tháng đã chọn. Công suất lấy từ sheet Config_Capacity (mặc định {}h/tuần); dưới {}% là thiếu việc, trên {}% là quá tải.",
+        'utilisation_weekly': "Chi tiết theo tuần",
+        'utilisation_project_split': "Phân bổ dự án theo nhân viên",
+        'download_utilisation_excel': "Tải Excel tỉ lệ sử dụng",
+        'generate_utilisation_btn': "Tính tỉ lệ sử dụng",
+        'export_heatmap_option': "Xuất heatmap Task × tuần ISO (Excel + PDF)",
+        'generating_heatmap_report': "Đang tạo heatmap Task × tuần...",
+        'heatmap_report_generated': "Đã tạo báo cáo heatmap: {} và {}",
+        'failed_to_generate_heatmap': "Không thể tạo báo cáo heatmap.",
+        'download_heatmap_excel': "Tải Excel heatmap",
+        'download_heatmap_pdf': "Tải PDF heatmap",
+        'export_timeline_option': "Xuất timeline / Gantt dự án (Excel + PDF, toàn bộ lịch sử của các dự án đã chọn)",
+        'generating_timeline_report': "Đang tạo timeline dự án...",
+        'timeline_report_generated': "Đã tạo báo cáo timeline: {} và {}",
+        'failed_to_generate_timeline': "Không thể tạo timeline dự án.",
+        'download_timeline_excel': "Tải Excel timeline",
+        'download_timeline_pdf': "Tải PDF timeline",
+        'pdf_charts_per_page': "Số biểu đồ mỗi trang PDF:",
+        'pdf_image_dpi': "Độ phân giải ảnh trong PDF (DPI):",
+        'pdf_include_totals_table': "Thêm bảng tổng giờ theo dự án vào PDF",
+        'pdf_progress': "{} / {} dự án · đã ghi {} trang",
+        'anomalies_header': "🚩 Giờ công bất thường",
+        'anomalies_caption': "Tổng giờ một ngày vượt {}h (không thể xảy ra nếu vượt {}h), dòng nhập trùng và tuần bị sao chép, giờ ghi sau Closed Date của dự án, và tổng ngày/tuần cao hơn hẳn mức thường lệ của nhân viên hoặc dự án (z-score > {} hoặc điểm MAD > {}).",
+        'anomalies_none': "Không phát hiện bất thường.",
+        'anomalies_by_rule': "Số phát hiện theo quy tắc",
+        'anomalies_rule_filter': "Quy tắc hiển thị:",
+        'preview_search': "Tìm dự án, công việc hoặc nhân viên:",
+        'preview_filter_year': "Năm",
+        'preview_filter_month': "Tháng",
+        'preview_filter_project': "Dự án",
+        'preview_filter_workcentre': "Workcentre",
+        'preview_filter_employee': "Nhân viên",
+        'preview_page_size': "Số dòng mỗi trang",
+        'preview_page': "Trang",
+        'preview_rows_caption': "Dòng {}–{} trên {:,} · trang {} / {}",
+        'preview_no_match': "Không có dòng nào khớp bộ lọc hiện tại.",
+        'data_reloaded': "🔄 File template đã thay đổi: dữ liệu đã được tải lại.",
+        'access_log_header': "📜 Nhật ký truy cập",
+        'access_log_own': "20 lần đăng nhập và tạo báo cáo gần nhất của bạn.",
+        'access_log_email': "Email",
+        'access_log_event': "Sự kiện",
+        'access_log_since': "Từ ngày",
+        'access_log_until': "Đến ngày",
+        'access_log_summary': "Hoạt động theo người dùng",
+        'upload_header': "📤 Dùng file chấm công của bạn",
+        'upload_caption': "File Excel (sheet 'Raw Data' hoặc sheet đầu tiên) hoặc CSV có các cột Date, Employee, Project name, Workcentre, Task và Hours. Tối đa {} MB, {:,} dòng và {} giây xử lý. Cấu hình dự án, ngân sách và đơn giá vẫn lấy từ template.",
+        'upload_label': "File chấm công",
+        'upload_parsing': "Đang xử lý {}... {:.0f}s",
+        'upload_failed': "❌ Không dùng được file đã tải lên: {}",
+        'upload_expired': "File {} đã tải lên không còn trong bộ nhớ đệm. Vui lòng tải lại.",
+        'upload_in_use': "Báo cáo đang dùng file {} ({:,} dòng). Bỏ file để quay về dữ liệu của server.",
+        'memory_header': "🧠 Bộ nhớ",
+        'memory_rss': "Bộ nhớ tiến trình (RSS)",
+        'memory_tracked': "Bộ nhớ đệm và phiên / ngân sách",
+        'memory_evictions': "Số mục đã giải phóng",
+        'memory_profile_toggle': "Đo bộ nhớ theo từng bước báo cáo (làm chậm mọi phiên khi bật)",
+        'memory_profile_active': "Đang đo: kết quả được ghi vào {path} sau mỗi báo cáo.",
+        'memory_profile_download': "Tải kết quả đo bộ nhớ (JSON)"
     }
 }
 
@@ -269,6 +449,36 @@ TEXTS = {
 def get_text(key):
     return TEXTS[st.session_state.lang].get(key, f"Missing text for {key}")
 
+# Vẽ biểu đồ plotly phía trình duyệt từ các bảng tổng hợp nhỏ (không gửi dữ liệu thô)
+def render_interactive_charts(aggregates, key_prefix, charts=('project', 'workcentre', 'task', 'month')):
+    if not aggregates:
+        st.info(get_text('no_chart_data'))
+        return
+    import plotly.express as px
+
+    bar_charts = {
+        'project': ('Project name', 'chart_hours_by_project'),
+        'workcentre': ('Workcentre', 'chart_hours_by_workcentre'),
+        'task': ('Task', 'chart_hours_by_task'),
+    }
+    figures = []
+    for key in charts:
+        if key in bar_charts and key in aggregates:
+            col, title_key = bar_charts[key]
+            data = aggregates[key].iloc[::-1] # Mục lớn nhất nằm trên cùng
+            fig = px.bar(data, x='Hours', y=col, orientation='h', title=get_text(title_key))
+            fig.update_layout(height=max(300, 22 * len(data) + 120))
+            figures.append((key, fig))
+        elif key == 'month':
+            figures.append((key, px.line(aggregates['month'], x='Month', y='Hours', markers=True, title=get_text('chart_hours_by_month'))))
+        elif key == 'project_month':
+            figures.append((key, px.line(aggregates['project_month'], x='Month', y='Hours', color='Project name', markers=True, title=get_text('chart_project_month'))))
+
+    chart_cols = st.columns(2)
+    for i, (key, fig) in enumerate(figures):
+        with chart_cols[i % 2]:
+            st.plotly_chart(fig, use_container_width=True, key=f"{key_prefix}_{key}_chart")
+
 # Header của ứng dụng
 col_logo_title, col_lang = st.columns([0.8, 0.2])
 with col_logo_title:
@@ -290,25 +500,162 @@ if not os.path.exists(path_dict['template_file']):
     st.error(get_text('template_not_found').format(path_dict['template_file']))
     st.stop()
 
-# Load raw data and configurations once
-@st.cache_data(ttl=1800)
-def cached_load():
+# Load raw data and configurations once per server process
+@tracing.traced('load', 'shared_dataset')
+def build_shared_dataset():
     df_raw = load_raw_data(path_dict['template_file'])
     config_data = read_configs(path_dict['template_file'])
+    # Thêm cột Rate/Cost khi template có sheet Config_Rates
+    df_raw = apply_rates(df_raw, config_data.get('rates_df'))
+    # Chỉ mục cho tab xem trước được dựng một lần cùng dữ liệu, mỗi trang/tìm kiếm sau đó chỉ tra chỉ mục
+    if not df_raw.empty:
+        build_preview_index(df_raw)
     return df_raw, config_data
 
+# Số giây tối thiểu giữa hai lần kiểm tra file template có thay đổi hay không
+DATASET_POLL_INTERVAL = 5
+
+# cache_resource giữ MỘT bản dữ liệu dùng chung cho mọi phiên (cache_data sẽ pickle và trả mỗi phiên một bản sao).
+# Dữ liệu chỉ được dựng lại khi file template đổi (mtime/kích thước), ở luồng nền trong khi vẫn phục vụ bản cũ;
+# bản dựng lại rỗng (ví dụ file đang được lưu dở) bị bỏ qua.
+@st.cache_resource
+def get_dataset_watcher():
+    return WatchedDataset([path_dict['template_file']], build_shared_dataset,
+                          poll_interval=DATASET_POLL_INTERVAL, is_valid=lambda dataset: not dataset[0].empty)
+
+# Mỗi lần chạy script dùng cố định một phiên bản dữ liệu (các fragment chạy lại cũng dùng phiên bản đó)
 with st.spinner(get_text('loading_data')):
+    dataset_version, shared_dataset = get_dataset_watcher().current()
+if st.session_state.get('dataset_version') not in (None, dataset_version):
+    st.toast(get_text('data_reloaded'))
+st.session_state.dataset_version = dataset_version
+
+# Cột Rate/Cost (đơn giá của template lúc tải lên) và chỉ mục xem trước, dựng một lần ở luồng nền cho mỗi file
+def prepare_uploaded_dataset(df_upload):
+    df_upload = apply_rates(df_upload, get_dataset_watcher().get()[1].get('rates_df'))
+    build_preview_index(df_upload)
+    return df_upload
+
+# File chấm công người dùng tự tải lên: xử lý ở tiến trình nền, nhớ theo nội dung file (dùng chung mọi phiên)
+@st.cache_resource
+def get_upload_parser():
+    return UploadParser(postprocess=prepare_uploaded_dataset)
+
+with st.expander(get_text('upload_header'), expanded='uploaded_dataset' in st.session_state):
+    st.caption(get_text('upload_caption').format(
+        UPLOAD_LIMITS['max_bytes'] // (1024 * 1024), UPLOAD_LIMITS['max_rows'], UPLOAD_LIMITS['timeout']))
+    uploaded_file = st.file_uploader(get_text('upload_label'), type=['xlsx', 'xlsm', 'csv'], key='upload_file')
+    if uploaded_file is None:
+        # Bỏ file khỏi ô tải lên thì quay về dữ liệu của server
+        for key in ('uploaded_dataset', 'upload_file_id', 'upload_error'):
+            st.session_state.pop(key, None)
+    elif st.session_state.get('upload_file_id') != uploaded_file.file_id:
+        upload_job = get_upload_parser().submit(uploaded_file.getvalue(), uploaded_file.name)
+        upload_progress = st.progress(upload_job.progress, text=get_text('upload_parsing').format(uploaded_file.name, 0))
+        # Chỉ phiên này chờ (kiểm tra 5 lần/giây); việc đọc file chạy ở tiến trình khác
+        while not upload_job.wait(0.2):
+            upload_progress.progress(upload_job.progress, text=get_text('upload_parsing').format(uploaded_file.name, upload_job.elapsed))
+        upload_progress.empty()
+        st.session_state.upload_file_id = uploaded_file.file_id
+        if upload_job.error:
+            st.session_state.pop('uploaded_dataset', None)
+            st.session_state.upload_error = upload_job.error
+        else:
+            st.session_state.uploaded_dataset = (upload_job.key, uploaded_file.name)
+            st.session_state.pop('upload_error', None)
+            log_user_access(st.session_state.user_email, 'upload', f"{uploaded_file.name}; rows={len(upload_job.result)}")
+    if st.session_state.get('upload_error'):
+        st.error(get_text('upload_failed').format(st.session_state.upload_error))
+
+# Nguồn dữ liệu của phiên: file đã tải lên (nếu còn trong bộ nhớ đệm), ngược lại là dữ liệu dùng chung của server.
+# Cấu hình (dự án, ngân sách, đơn giá...) vẫn lấy từ template.
+data_key = str(dataset_version)
+if 'uploaded_dataset' in st.session_state:
+    upload_key, upload_name = st.session_state.uploaded_dataset
+    if get_upload_parser().cached(upload_key) is None:
+        st.warning(get_text('upload_expired').format(upload_name))
+        del st.session_state.uploaded_dataset
+    else:
+        shared_dataset = (get_upload_parser().cached(upload_key), shared_dataset[1])
+        data_key = f"{dataset_version}:{upload_key}"
+        st.info(get_text('upload_in_use').format(upload_name, len(shared_dataset[0])))
+
+# Ngân sách bộ nhớ cho các bộ nhớ đệm dùng chung (truy vấn/dữ liệu đã lọc/chỉ mục và file tải lên) và các phiên
+MEMORY_BUDGET = {
+    'max_bytes': 1024 * 1024 * 1024,
+    'session_idle_seconds': 1800,   # Phiên không hoạt động lâu hơn thì file tải lên của nó được giải phóng
+    'max_entry_fraction': 0.25,     # Mục đệm lớn hơn phần này của ngân sách bị bỏ ngay
+    'check_interval': 5,
+}
+
+@st.cache_resource
+def get_memory_budget():
+    budget = MemoryBudget(**MEMORY_BUDGET)
+    budget.register_cache('query', time_query_engines)
+    budget.register_cache('uploads', lambda: [get_upload_parser()])
+    return budget
+
+# Đo bộ nhớ theo từng bước báo cáo (tắt mặc định): bật khi khởi động bằng TIME_REPORT_MEMORY_PROFILE=<file JSON>
+# hoặc bởi admin trong mục Bộ nhớ; tracemalloc làm chậm mọi phiên trong lúc bật
+memory_profile_path = MEMORY_PROFILE['output_path'] or os.path.join(script_dir, "memory_profile.json")
+
+@st.cache_resource
+def get_memory_profiler():
+    profiler = MemoryProfiler(memory_profile_path, label='main_optimized')
+    if MEMORY_PROFILE['output_path']:
+        profiler.start()
+    return profiler
+
+get_memory_profiler()
+
+# Mỗi lần chạy: ghi nhận phiên (bộ nhớ session_state và file tải lên đang dùng), rồi giải phóng nếu vượt ngân sách
+script_ctx = get_script_run_ctx()
+if script_ctx is not None:
+    get_memory_budget().touch_session(
+        script_ctx.session_id, st.session_state.user_email,
+        deep_nbytes({k: v for k, v in st.session_state.items()}),
+        pins=[('uploads', st.session_state.uploaded_dataset[0])] if 'uploaded_dataset' in st.session_state else ())
+get_memory_budget().enforce()
+
+def load_shared_dataset():
+    return shared_dataset
+
+def cached_load():
+    """Khung nhìn chỉ đọc của bộ dữ liệu dùng chung: không sao chép dữ liệu, thay đổi trong phiên không ảnh hưởng phiên khác."""
+    df_raw, config_data = load_shared_dataset()
+    return read_only_view(df_raw), {k: read_only_view(v) if isinstance(v, pd.DataFrame) else v for k, v in config_data.items()}
+
+# query() nhớ kết quả theo từng đối tượng DataFrame nên biểu đồ dùng thẳng bản dùng chung (giữ nguyên giữa các phiên)
+def get_query_data():
+    return load_shared_dataset()[0]
+
+@st.cache_data(max_entries=2)
+def cached_anomalies(version):
     df_raw, config_data = cached_load()
+    return detect_anomalies(df_raw, config_data.get('project_filter_df'))
+
+df_raw, config_data = cached_load()
 
 if df_raw.empty:
     st.error(get_text('failed_to_load_raw_data'))
     st.stop()
 
 # Get unique years, months, and projects from raw data for selectbox options
-all_years = sorted(df_raw['Year'].dropna().unique().astype(int).tolist())
-month_order = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October', 'November', 'December']
-all_months = [m for m in month_order if m in df_raw['MonthName'].dropna().unique()]
-all_projects = sorted(df_raw['Project name'].dropna().unique().tolist())
+# Tính một lần cho bộ dữ liệu dùng chung (trước đây mỗi lần chạy lại script đều quét toàn bộ dữ liệu)
+@st.cache_resource(max_entries=2)
+def load_filter_options(version):
+    df = get_query_data()
+    month_order = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October', 'November', 'December']
+    present_months = set(df['MonthName'].dropna().unique())
+    return (sorted(df['Year'].dropna().unique().astype(int).tolist()),
+            [m for m in month_order if m in present_months],
+            sorted(df['Project name'].dropna().unique().tolist()))
+
+all_years, all_months, all_projects = load_filter_options(data_key)
+
+def filtered_data(years=None, months=None, projects=None):
+    """Dữ liệu đã lọc từ bộ dữ liệu dùng chung; cùng lựa chọn (bất kể thứ tự) dùng lại kết quả giữa các phiên."""
+    return filtered_view(get_query_data(), years, months, projects)
 
 
 # Main interface tabs
@@ -322,7 +669,8 @@ tab_standard_report_main, tab_comparison_report_main, tab_data_preview_main, tab
 # =========================================================================
 # STANDARD REPORT TAB
 # =========================================================================
-with tab_standard_report_main:
+@st.fragment
+def standard_report_tab():
     st.header(get_text('standard_report_header'))
 
     col1_std, col2_std, col3_std = st.columns(3)
@@ -418,71 +766,166 @@ with tab_standard_report_main:
     )
     st.session_state.standard_selected_projects = standard_project_selection # Update state
 
+    if selected_year is not None and standard_project_selection:
+        with st.expander(get_text('interactive_charts'), expanded=False):
+            render_interactive_charts(build_chart_aggregates(get_query_data(), filters={
+                'year': [selected_year], 'month': selected_months, 'project': standard_project_selection
+            }), 'std')
+
+    if selected_year is not None:
+        with st.expander(get_text('employee_utilisation'), expanded=False):
+            capacity_df = config_data.get('capacity_df')
+            default_capacity = DEFAULT_WEEKLY_CAPACITY
+            if capacity_df is not None and 'Default' in capacity_df['Employee'].values:
+                default_capacity = capacity_df.loc[capacity_df['Employee'] == 'Default', 'Weekly Capacity'].iloc[0]
+            st.caption(get_text('utilisation_caption').format(
+                default_capacity, UTILISATION_THRESHOLDS['under'], UTILISATION_THRESHOLDS['over']))
+            if st.button(get_text('generate_utilisation_btn'), key='generate_utilisation_btn'):
+                # Tỉ lệ sử dụng tính trên mọi dự án: nhân viên có thể làm cả dự án không nằm trong lựa chọn
+                utilisation = build_utilisation_report(filtered_data([selected_year], selected_months), capacity_df)
+                if not utilisation:
+                    st.info(get_text('no_chart_data'))
+                else:
+                    st.dataframe(utilisation['summary'].round(1), use_container_width=True, hide_index=True)
+                    st.caption(get_text('utilisation_weekly'))
+                    st.dataframe(utilisation['weekly'].round({'Utilisation %': 1}), use_container_width=True, hide_index=True)
+                    st.caption(get_text('utilisation_project_split'))
+                    st.dataframe(utilisation['project_split'].round(1), use_container_width=True, hide_index=True)
+                    report_paths = session_output_paths()
+                    if export_utilisation_report(utilisation, report_paths['utilisation_report']):
+                        with open(report_paths['utilisation_report'], "rb") as f:
+                            st.download_button(get_text('download_utilisation_excel'), data=f, file_name=os.path.basename(report_paths['utilisation_report']), use_container_width=True, key='download_utilisation_btn')
 
     st.markdown("---")
     st.subheader(get_text("export_options"))
     export_excel = st.checkbox(get_text("export_excel_option"), value=True, key='export_excel_std')
     export_pdf = st.checkbox(get_text("export_pdf_option"), value=False, key='export_pdf_std')
+    export_heatmap = st.checkbox(get_text("export_heatmap_option"), value=False, key='export_heatmap_std')
+    export_timeline = st.checkbox(get_text("export_timeline_option"), value=False, key='export_timeline_std')
+    pdf_options_std = {}
+    if export_pdf:
+        col_pdf1, col_pdf2, col_pdf3 = st.columns(3)
+        with col_pdf1:
+            pdf_options_std['charts_per_page'] = st.selectbox(get_text('pdf_charts_per_page'), options=[1, 2, 4], key='pdf_charts_per_page_std')
+        with col_pdf2:
+            pdf_options_std['image_dpi'] = st.selectbox(get_text('pdf_image_dpi'), options=[100, 150, 200], index=1, key='pdf_image_dpi_std')
+        with col_pdf3:
+            pdf_options_std['include_totals_table'] = st.checkbox(get_text('pdf_include_totals_table'), value=True, key='pdf_totals_table_std')
 
     if st.button(get_text('generate_standard_report_btn'), key='generate_standard_report_btn_tab'):
-        if not export_excel and not export_pdf:
+        if not export_excel and not export_pdf and not export_heatmap and not export_timeline:
             st.warning(get_text("warning_select_export_format"))
         elif selected_year is None:
             st.error(get_text('no_year_selected_error'))
         elif not standard_project_selection:
             st.warning(get_text('no_project_selected_warning_standard'))
         else:
-            temp_project_filter_df_standard = pd.DataFrame({
-                'Project Name': standard_project_selection,
-                'Include': ['yes'] * len(standard_project_selection)
-            })
-
-            standard_report_config = {
-                'mode': mode,
-                'year': selected_year,
-                'months': selected_months,
-                'project_filter_df': temp_project_filter_df_standard
-            }
-
-            df_filtered_standard = apply_filters(df_raw, standard_report_config)
-
-            if df_filtered_standard.empty:
-                st.warning(get_text('no_data_after_filter_standard'))
-            else:
-                report_generated = False
-                if export_excel:
-                    with st.spinner(get_text('generating_excel_report')):
-                        excel_success = export_report(df_filtered_standard, standard_report_config, path_dict['output_file'])
-                    if excel_success:
-                        st.success(get_text('excel_report_generated').format(os.path.basename(path_dict['output_file'])))
-                        report_generated = True
-                    else:
-                        st.error(get_text('failed_to_generate_excel'))
-
-                if export_pdf:
-                    with st.spinner(get_text('generating_pdf_report')):
-                        pdf_success = export_pdf_report(df_filtered_standard, standard_report_config, path_dict['pdf_report'], path_dict['logo_path'])
-                    if pdf_success:
-                        st.success(get_text('pdf_report_generated').format(os.path.basename(path_dict['pdf_report'])))
-                        report_generated = True
-                    else:
-                        st.error(get_text('failed_to_generate_pdf'))
-
-                if report_generated:
-                    if export_excel and os.path.exists(path_dict['output_file']):
-                        with open(path_dict['output_file'], "rb") as f:
-                            st.download_button(get_text("download_excel"), data=f, file_name=os.path.basename(path_dict['output_file']), use_container_width=True, key='download_excel_std_btn')
-                    if export_pdf and os.path.exists(path_dict['pdf_report']):
-                        with open(path_dict['pdf_report'], "rb") as f:
-                            st.download_button(get_text("download_pdf"), data=f, file_name=os.path.basename(path_dict['pdf_report']), use_container_width=True, key='download_pdf_std_btn')
+            log_user_access(st.session_state.user_email, 'standard_report',
+                            f"year={selected_year}; months={len(selected_months)}; projects={len(standard_project_selection)}")
+            with tracing.span('report', 'standard', year=selected_year, months=len(selected_months), projects=len(standard_project_selection)):
+                report_paths = session_output_paths()
+                temp_project_filter_df_standard = pd.DataFrame({
+                    'Project Name': standard_project_selection,
+                    'Include': ['yes'] * len(standard_project_selection)
+                })
+
+                standard_report_config = {
+                    'mode': mode,
+                    'year': selected_year,
+                    'months': selected_months,
+                    'project_filter_df': temp_project_filter_df_standard,
+                    'budget_df': config_data.get('budget_df')
+                }
+
+                df_filtered_standard = filtered_data([selected_year], selected_months, standard_project_selection)
+
+                if df_filtered_standard.empty:
+                    st.warning(get_text('no_data_after_filter_standard'))
                 else:
-                    st.error(get_text('error_generating_report'))
+                    report_generated = False
+                    # Giờ đã dùng so với ngân sách tính trên toàn bộ lịch sử dự án (không theo năm/tháng), dùng chung cho Excel và PDF
+                    budget_burn = memoized(get_query_data(), ('budget_burn', TimeQuery.selection_key(standard_project_selection)),
+                                           lambda: build_budget_burn(filtered_data(projects=standard_project_selection), config_data.get('budget_df')))
+                    if export_excel:
+                        with st.spinner(get_text('generating_excel_report')):
+                            excel_success = export_report(df_filtered_standard, standard_report_config, report_paths['output_file'], budget_burn)
+                        if excel_success:
+                            st.success(get_text('excel_report_generated').format(os.path.basename(report_paths['output_file'])))
+                            report_generated = True
+                        else:
+                            st.error(get_text('failed_to_generate_excel'))
+
+                    if export_pdf:
+                        with st.spinner(get_text('generating_pdf_report')):
+                            pdf_progress = st.progress(0.0)
+                            pdf_success = export_pdf_report(
+                                df_filtered_standard, standard_report_config, report_paths['pdf_report'], report_paths['logo_path'], pdf_options_std,
+                                progress_callback=lambda pages, done, total: pdf_progress.progress(
+                                    done / total if total else 1.0, text=get_text('pdf_progress').format(done, total, pages)),
+                                budget_burn=budget_burn
+                            )
+                            pdf_progress.empty()
+                        if pdf_success:
+                            st.success(get_text('pdf_report_generated').format(os.path.basename(report_paths['pdf_report'])))
+                            report_generated = True
+                        else:
+                            st.error(get_text('failed_to_generate_pdf'))
+
+                    if export_heatmap:
+                        with st.spinner(get_text('generating_heatmap_report')):
+                            # Tổng hợp thưa một lần, dùng chung cho Excel và PDF
+                            heatmaps = build_task_week_heatmaps(df_filtered_standard)
+                            heatmap_success = (export_heatmap_report(df_filtered_standard, report_paths['heatmap_report'], heatmaps) and
+                                               export_heatmap_pdf_report(df_filtered_standard, report_paths['heatmap_pdf_report'], report_paths['logo_path'], pdf_options_std, heatmaps))
+                        if heatmap_success:
+                            st.success(get_text('heatmap_report_generated').format(os.path.basename(report_paths['heatmap_report']), os.path.basename(report_paths['heatmap_pdf_report'])))
+                            report_generated = True
+                        else:
+                            st.error(get_text('failed_to_generate_heatmap'))
+
+                    if export_timeline:
+                        with st.spinner(get_text('generating_timeline_report')):
+                            # Timeline dùng toàn bộ lịch sử của các dự án đã chọn, không theo năm/tháng
+                            df_history = filtered_data(projects=standard_project_selection)
+                            timeline = build_project_timeline(df_history)
+                            timeline_success = (export_timeline_report(df_history, report_paths['timeline_report'], timeline) and
+                                                export_timeline_pdf_report(df_history, report_paths['timeline_pdf_report'], report_paths['logo_path'], pdf_options_std, timeline))
+                        if timeline_success:
+                            st.success(get_text('timeline_report_generated').format(os.path.basename(report_paths['timeline_report']), os.path.basename(report_paths['timeline_pdf_report'])))
+                            report_generated = True
+                        else:
+                            st.error(get_text('failed_to_generate_timeline'))
+
+                    if report_generated:
+                        if export_heatmap and heatmap_success:
+                            with open(report_paths['heatmap_report'], "rb") as f:
+                                st.download_button(get_text("download_heatmap_excel"), data=f, file_name=os.path.basename(report_paths['heatmap_report']), use_container_width=True, key='download_heatmap_excel_btn')
+                            with open(report_paths['heatmap_pdf_report'], "rb") as f:
+                                st.download_button(get_text("download_heatmap_pdf"), data=f, file_name=os.path.basename(report_paths['heatmap_pdf_report']), use_container_width=True, key='download_heatmap_pdf_btn')
+                        if export_timeline and timeline_success:
+                            with open(report_paths['timeline_report'], "rb") as f:
+                                st.download_button(get_text("download_timeline_excel"), data=f, file_name=os.path.basename(report_paths['timeline_report']), use_container_width=True, key='download_timeline_excel_btn')
+                            with open(report_paths['timeline_pdf_report'], "rb") as f:
+                                st.download_button(get_text("download_timeline_pdf"), data=f, file_name=os.path.basename(report_paths['timeline_pdf_report']), use_container_width=True, key='download_timeline_pdf_btn')
+                        if export_excel and os.path.exists(report_paths['output_file']):
+                            with open(report_paths['output_file'], "rb") as f:
+                                st.download_button(get_text("download_excel"), data=f, file_name=os.path.basename(report_paths['output_file']), use_container_width=True, key='download_excel_std_btn')
+                        if export_pdf and os.path.exists(report_paths['pdf_report']):
+                            with open(report_paths['pdf_report'], "rb") as f:
+                                st.download_button(get_text("download_pdf"), data=f, file_name=os.path.basename(report_paths['pdf_report']), use_container_width=True, key='download_pdf_std_btn')
+                    else:
+                        st.error(get_text('error_generating_report'))
+
+
+with tab_standard_report_main:
+    standard_report_tab()
 
 
 # =========================================================================
 # COMPARISON REPORT TAB
 # =========================================================================
-with tab_comparison_report_main:
+@st.fragment
+def comparison_report_tab():
     st.header(get_text('comparison_report_header'))
 
     # Define the mapping from text key to (Vietnamese_internal_string, English_internal_string)
@@ -651,7 +1094,12 @@ with tab_comparison_report_main:
         if not comp_projects:
             st.warning(get_text('no_project_selected_warning_standard')) # Reusing standard report message
             validation_error = True
-            
+
+    if not validation_error and comp_projects:
+        with st.expander(get_text('interactive_charts'), expanded=False):
+            render_interactive_charts(build_chart_aggregates(get_query_data(), filters={
+                'year': comp_years, 'month': comp_months, 'project': comp_projects
+            }), 'comp', charts=('project', 'project_month'))
 
     st.markdown("---")
     st.subheader(get_text("export_options"))
@@ -665,114 +1113,157 @@ with tab_comparison_report_main:
             # Error messages already displayed by specific conditions
             pass
         else:
-            # DEBUG print statements (giữ lại để chẩn đoán vấn đề dự án)
-            print(f"DEBUG: Comparison Mode selected before filter: {comparison_mode}")
-            print(f"DEBUG: Selected Projects before filter: {comp_projects}")
-            print(f"DEBUG: Selected Years before filter: {comp_years}")
-            print(f"DEBUG: Selected Months before filter: {comp_months}")
-
-
-            comparison_config = {
-                'selected_years': comp_years,
-                'selected_months': comp_months,
-                'selected_projects': comp_projects,
-                # 'selected_months_over_time' không cần truyền riêng nếu đã gán vào comp_months
-                # nó đã được xử lý trong logic trên
-            }
+            log_user_access(st.session_state.user_email, 'comparison_report',
+                            f"mode={comparison_mode}; years={comp_years}; projects={len(comp_projects)}")
+            with tracing.span('report', 'comparison', mode=comparison_mode, projects=len(comp_projects)):
+
+                comparison_config = {
+                    'years': comp_years,
+                    'months': comp_months,
+                    'selected_projects': comp_projects,
+                    # 'selected_months_over_time' không cần truyền riêng nếu đã gán vào comp_months
+                    # nó đã được xử lý trong logic trên
+                }
             
-            # Print the final config before calling the function
-            comparison_output_folder = "outputs/comparison"
-            path_dict = {
-                "comparison_output_excel": os.path.join(comparison_output_folder, "comparison_result.xlsx"),
-                "comparison_output_file": os.path.join(comparison_output_folder, "comparison_export.xlsx"),
-                "comparison_pdf_output": os.path.join(comparison_output_folder, "comparison_chart.png"),
-                "comparison_pdf_report": os.path.join(comparison_output_folder, "comparison_report.pdf"),
-            }
-            print(f"DEBUG: Final comparison_config sent to filter: {comparison_config}")
-
-            df_filtered_comparison, comparison_filter_message = apply_comparison_filters(df_raw, comparison_config, comparison_mode)
-            print(f"DEBUG: path_dict = {path_dict}")
-            if df_filtered_comparison.empty:
+                comparison_output_folder = os.path.join(session_output_dir(), "comparison")
+                comparison_paths = {
+                    "comparison_output_excel": os.path.join(comparison_output_folder, "comparison_result.xlsx"),
+                    "comparison_output_file": os.path.join(comparison_output_folder, "comparison_export.xlsx"),
+                    "comparison_pdf_output": os.path.join(comparison_output_folder, "comparison_chart.png"),
+                    "comparison_pdf_report": os.path.join(comparison_output_folder, "comparison_report.pdf"),
+                }
+                tracing.log_event("Comparison report requested", mode=comparison_mode, config=comparison_config,
+                                  output_folder=comparison_output_folder)
+
+                # Bảng so sánh/xu hướng được nhớ theo lựa chọn đã chuẩn hóa, dùng chung giữa các phiên
+                comparison_key = TimeQuery.selection_key(comp_years, comp_months, comp_projects)
+                df_filtered_comparison, comparison_filter_message = memoized(
+                    get_query_data(), ('comparison', comparison_mode) + comparison_key,
+                    lambda: apply_comparison_filters(get_query_data(), comparison_config, comparison_mode))
                 # Đảm bảo thư mục chứa file output tồn tại
-                comparison_excel_dir = os.path.dirname(path_dict['comparison_output_excel'])
-                if comparison_excel_dir:
-                    os.makedirs(comparison_excel_dir, exist_ok=True)
-
-                comparison_pdf_dir = os.path.dirname(path_dict['comparison_pdf_output'])
-                if comparison_pdf_dir:
-                    os.makedirs(comparison_pdf_dir, exist_ok=True)
-
-                output_file_dir = os.path.dirname(path_dict['comparison_output_file'])
-                if output_file_dir:
-                    os.makedirs(output_file_dir, exist_ok=True)
-
-                pdf_report_dir = os.path.dirname(path_dict['comparison_pdf_report'])
-                if pdf_report_dir:
-                     os.makedirs(pdf_report_dir, exist_ok=True)
-
-                st.warning(get_text('no_data_after_filter_comparison').format(comparison_filter_message))
-            else:
-                st.success(get_text('data_filtered_success'))
-                st.subheader(get_text('comparison_data_preview'))
-                st.dataframe(df_filtered_comparison)
-
-                report_generated_comp = False
-                if export_excel_comp:
-                    with st.spinner(get_text('generating_comparison_excel')):
-                        try:
-                            excel_success_comp = export_comparison_report(
-                                df_filtered_comparison,
-                                comparison_config,
-                                comparison_mode,
-                                path_dict['comparison_output_file']
+                os.makedirs(comparison_output_folder, exist_ok=True)
+                if df_filtered_comparison.empty:
+                    st.warning(get_text('no_data_after_filter_comparison').format(comparison_filter_message))
+                else:
+                    st.success(get_text('data_filtered_success'))
+                    st.subheader(get_text('comparison_data_preview'))
+                    st.dataframe(df_filtered_comparison)
+
+                    df_trends_comparison = memoized(get_query_data(), ('comparison_trends',) + comparison_key,
+                                                    lambda: apply_comparison_trends(get_query_data(), comparison_config))
+                    with st.expander(get_text('period_trends')):
+                        if df_trends_comparison.empty:
+                            st.info(get_text('no_chart_data'))
+                        else:
+                            st.dataframe(df_trends_comparison.drop(columns='Period Start'), use_container_width=True)
+
+                    report_generated_comp = False
+                    if export_excel_comp:
+                        with st.spinner(get_text('generating_comparison_excel')):
+                            try:
+                                excel_success_comp = export_comparison_report(
+                                    df_filtered_comparison,
+                                    comparison_config,
+                                    comparison_paths['comparison_output_file'],
+                                    comparison_mode,
+                                    df_trends=df_trends_comparison
+                                    )
+                            except Exception as e:
+                                excel_success_comp = False
+                                st.error(f"❌ Lỗi khi xuất Excel: {e}")
+                        if excel_success_comp:
+                            st.success(get_text('comparison_excel_generated').format(os.path.basename(comparison_paths['comparison_output_file'])))
+                            report_generated_comp = True
+                        else:
+                            st.error(get_text('failed_to_generate_comparison_excel'))
+
+                    if export_pdf_comp:
+                        with st.spinner(get_text('generating_comparison_pdf')):
+                            try:
+                                pdf_success_comp = export_comparison_pdf_report(
+                                    df_filtered_comparison,
+                                    comparison_config,
+                                    comparison_paths['comparison_pdf_report'],
+                                    comparison_mode,
+                                    setup_paths()['logo_path']
                                 )
-                        except Exception as e:
-                            excel_success_comp = False
-                            st.error(f"❌ Lỗi khi xuất Excel: {e}")
-                    if excel_success_comp:
-                        st.success(get_text('comparison_excel_generated').format(os.path.basename(path_dict['comparison_output_file'])))
-                        report_generated_comp = True
-                    else:
-                        st.error(get_text('failed_to_generate_comparison_excel'))
-
-                if export_pdf_comp:
-                    with st.spinner(get_text('generating_comparison_pdf')):
-                        try:
-                            pdf_success_comp = export_comparison_pdf_report(
-                                df_filtered_comparison,
-                                comparison_config,
-                                comparison_mode,
-                                path_dict['comparison_pdf_report']
-                            )
-                        except Exception as e:
-                            pdf_success_comp = False
-                            st.error(f"❌ Lỗi khi xuất PDF: {e}")
-                    if pdf_success_comp:
-                        st.success(get_text('comparison_pdf_generated').format(os.path.basename(path_dict['comparison_pdf_report'])))
-                        report_generated_comp = True
-                    else:
-                        st.error(get_text('failed_to_generate_comparison_pdf'))
+                            except Exception as e:
+                                pdf_success_comp = False
+                                st.error(f"❌ Lỗi khi xuất PDF: {e}")
+                        if pdf_success_comp:
+                            st.success(get_text('comparison_pdf_generated').format(os.path.basename(comparison_paths['comparison_pdf_report'])))
+                            report_generated_comp = True
+                        else:
+                            st.error(get_text('failed_to_generate_comparison_pdf'))
                 
-                if report_generated_comp:
-                    if export_excel_comp and os.path.exists(path_dict['comparison_output_file']):
-                        with open(path_dict['comparison_output_file'], "rb") as f:
-                            st.download_button(get_text("download_comparison_excel"), data=f, file_name=os.path.basename(path_dict['comparison_output_file']), use_container_width=True, key='download_excel_comp_btn')
-                    if export_pdf_comp and os.path.exists(path_dict['comparison_pdf_report']):
-                        with open(path_dict['comparison_pdf_report'], "rb") as f:
-                            st.download_button(get_text("download_comparison_pdf"), data=f, file_name=os.path.basename(path_dict['comparison_pdf_report']), use_container_width=True, key='download_pdf_comp_btn')
-                else:
-                    st.error(get_text('error_generating_report'))
+                    if report_generated_comp:
+                        if export_excel_comp and os.path.exists(comparison_paths['comparison_output_file']):
+                            with open(comparison_paths['comparison_output_file'], "rb") as f:
+                                st.download_button(get_text("download_comparison_excel"), data=f, file_name=os.path.basename(comparison_paths['comparison_output_file']), use_container_width=True, key='download_excel_comp_btn')
+                        if export_pdf_comp and os.path.exists(comparison_paths['comparison_pdf_report']):
+                            with open(comparison_paths['comparison_pdf_report'], "rb") as f:
+                                st.download_button(get_text("download_comparison_pdf"), data=f, file_name=os.path.basename(comparison_paths['comparison_pdf_report']), use_container_width=True, key='download_pdf_comp_btn')
+                    else:
+                        st.error(get_text('error_generating_report'))
+
+
+with tab_comparison_report_main:
+    comparison_report_tab()
 
 
 # =========================================================================
 # DATA PREVIEW TAB
 # =========================================================================
-with tab_data_preview_main:
+@st.fragment
+def data_preview_tab():
     st.subheader(get_text('raw_data_preview_header'))
-    if not df_raw.empty:
-        st.dataframe(df_raw.head(100))
-    else:
+    if df_raw.empty:
         st.info(get_text('no_raw_data'))
+    else:
+        # Lọc/tìm kiếm chạy trên chỉ mục của bộ dữ liệu dùng chung; chỉ một trang được gửi tới trình duyệt
+        shared_df = get_query_data()
+        search_text = st.text_input(get_text('preview_search'), key='preview_search')
+        col_y, col_m, col_p, col_w, col_e = st.columns(5)
+        preview_filters = {
+            'Year': col_y.multiselect(get_text('preview_filter_year'), all_years, key='preview_filter_year'),
+            'MonthName': col_m.multiselect(get_text('preview_filter_month'), all_months, key='preview_filter_month'),
+            'Project name': col_p.multiselect(get_text('preview_filter_project'), all_projects, key='preview_filter_project'),
+            'Workcentre': col_w.multiselect(get_text('preview_filter_workcentre'), preview_options(shared_df, 'Workcentre'), key='preview_filter_workcentre'),
+            'Employee': col_e.multiselect(get_text('preview_filter_employee'), preview_options(shared_df, 'Employee'), key='preview_filter_employee'),
+        }
+        col_size, col_page = st.columns(2)
+        page_size = col_size.selectbox(get_text('preview_page_size'), [50, 100, 250, 500], index=1, key='preview_page_size')
+        result = preview(shared_df, preview_filters, search_text, st.session_state.get('preview_page', 1), page_size)
+        # Bộ lọc thay đổi có thể làm số trang ít đi: đưa trang hiện tại về trong giới hạn trước khi tạo widget
+        if st.session_state.get('preview_page', 1) > result['pages']:
+            st.session_state.preview_page = result['pages']
+        col_page.number_input(get_text('preview_page'), min_value=1, max_value=result['pages'], step=1, key='preview_page')
+        if result['total'] == 0:
+            st.info(get_text('preview_no_match'))
+        else:
+            first_row = (result['page'] - 1) * page_size + 1
+            st.caption(get_text('preview_rows_caption').format(
+                first_row, first_row + len(result['rows']) - 1, result['total'], result['page'], result['pages']))
+            st.dataframe(result['rows'], hide_index=True, use_container_width=True)
+
+    with st.expander(get_text('anomalies_header')):
+        st.caption(get_text('anomalies_caption').format(
+            ANOMALY_THRESHOLDS['max_daily_hours'], ANOMALY_THRESHOLDS['impossible_daily_hours'],
+            ANOMALY_THRESHOLDS['zscore'], ANOMALY_THRESHOLDS['mad']))
+        df_anomalies = cached_anomalies(data_key)
+        if df_anomalies.empty:
+            st.success(get_text('anomalies_none'))
+        else:
+            rule_counts = df_anomalies.groupby(['Rule', 'Severity'], sort=False).size().reset_index(name='Count')
+            st.markdown(f"**{get_text('anomalies_by_rule')}**")
+            st.dataframe(rule_counts, hide_index=True)
+            rules_to_show = st.multiselect(
+                get_text('anomalies_rule_filter'), rule_counts['Rule'].unique().tolist(),
+                default=rule_counts['Rule'].unique().tolist(), key='anomaly_rules_preview')
+            st.dataframe(df_anomalies[df_anomalies['Rule'].isin(rules_to_show)], hide_index=True)
+
+with tab_data_preview_main:
+    data_preview_tab()
 
 # =========================================================================
 # USER GUIDE TAB
@@ -786,7 +1277,51 @@ with tab_user_guide_main:
     - Download generated report
     """)
 
-    # 👇 Thêm đoạn này để xem access log (nếu có)
-    if "access_log" in st.session_state:
-        st.write("📜 Current session access log:")
-        st.dataframe(pd.DataFrame(st.session_state.access_log))
+    # Nhật ký truy cập: người dùng xem lịch sử của mình, admin (cột vai trò 'admin' trong invited_emails.csv) xem toàn bộ
+    with st.expander(get_text('access_log_header')):
+        access_log = get_access_log()
+        if check_invited(st.session_state.user_email, role='admin'):
+            col_email, col_event, col_since, col_until = st.columns(4)
+            log_email = col_email.text_input(get_text('access_log_email'), key='access_log_email').strip().lower()
+            log_event = col_event.selectbox(get_text('access_log_event'), ['', 'login', 'upload', 'standard_report', 'comparison_report'], key='access_log_event')
+            log_since = col_since.date_input(get_text('access_log_since'), value=None, key='access_log_since')
+            log_until = col_until.date_input(get_text('access_log_until'), value=None, key='access_log_until')
+            st.markdown(f"**{get_text('access_log_summary')}**")
+            st.dataframe(access_log.summary(since=log_since), hide_index=True, use_container_width=True)
+            st.dataframe(access_log.query(log_email, log_event, log_since, log_until), hide_index=True, use_container_width=True)
+        else:
+            st.caption(get_text('access_log_own'))
+            st.dataframe(access_log.query(st.session_state.user_email, limit=20), hide_index=True, use_container_width=True)
+
+    if check_invited(st.session_state.user_email, role='admin'):
+        with st.expander(get_text('memory_header')):
+            memory = get_memory_budget().usage()
+            col_rss, col_tracked, col_evicted = st.columns(3)
+            col_rss.metric(get_text('memory_rss'), f"{memory['rss'] / 1024 / 1024:,.0f} MB")
+            col_tracked.metric(get_text('memory_tracked'), f"{memory['total'] / 1024 / 1024:,.1f} / {memory['budget'] / 1024 / 1024:,.0f} MB")
+            col_evicted.metric(get_text('memory_evictions'), memory['evictions'])
+            st.dataframe(pd.DataFrame({'Cache': list(memory['caches']), 'MB': [v / 1024 / 1024 for v in memory['caches'].values()]}).round(2),
+                         hide_index=True, use_container_width=True)
+            sessions = pd.DataFrame(memory['sessions'], columns=['session', 'user', 'idle_seconds', 'state_bytes', 'pinned_bytes'])
+            st.dataframe(pd.DataFrame({
+                'Session': sessions['session'].str[:8], 'User': sessions['user'],
+                'Idle (s)': sessions['idle_seconds'].round(0), 'State (KB)': (sessions['state_bytes'] / 1024).round(1),
+                'Upload (MB)': (sessions['pinned_bytes'] / 1024 / 1024).round(2)}), hide_index=True, use_container_width=True)
+
+            profiler = get_memory_profiler()
+            if st.checkbox(get_text('memory_profile_toggle'), value=profiler.active, key='memory_profile_toggle'):
+                profiler.start()
+                st.caption(get_text('memory_profile_active').format(path=profiler.output_path))
+            elif profiler.active:
+                profiler.stop()
+            stages = pd.DataFrame(profiler.stage_summary(), columns=['stage', 'operation', 'count', 'seconds', 'traced_peak',
+                                                                     'traced_growth', 'rss_peak', 'rss_growth'])
+            if not stages.empty:
+                st.dataframe(pd.DataFrame({
+                    'Stage': stages['stage'], 'Operation': stages['operation'], 'Count': stages['count'],
+                    'Seconds': stages['seconds'].round(2), 'Python peak (MB)': (stages['traced_peak'] / 1024 / 1024).round(1),
+                    'Python growth (MB)': (stages['traced_growth'] / 1024 / 1024).round(1),
+                    'RSS peak (MB)': (stages['rss_peak'] / 1024 / 1024).round(0),
+                    'RSS growth (MB)': (stages['rss_growth'] / 1024 / 1024).round(1)}), hide_index=True, use_container_width=True)
+                st.download_button(get_text('memory_profile_download'), data=json.dumps(profiler.report(), ensure_ascii=False, indent=1, default=str),
+                                   file_name=os.path.basename(profiler.output_path), mime='application/json', key='download_memory_profile_btn')
@@ -0,0 +1,133 @@
+import logging
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import tracing
+
+def deep_nbytes(obj):
+    """Ước lượng số byte một đối tượng giữ (DataFrame/Series/mảng tính cả dữ liệu chuỗi; dict/list/tuple đệ quy)."""
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True, deep=True).sum())
+    if isinstance(obj, (pd.Series, pd.Index)):
+        return int(obj.memory_usage(deep=True))
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(deep_nbytes(k) + deep_nbytes(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sys.getsizeof(obj) + sum(deep_nbytes(v) for v in obj)
+    if isinstance(obj, pd.Categorical):
+        return int(obj.nbytes)
+    return sys.getsizeof(obj)
+
+def process_rss():
+    """Bộ nhớ thực (RSS) hiện tại của tiến trình, tính bằng byte (đỉnh RSS nếu không có /proc)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+class MemoryBudget:
+    """Theo dõi bộ nhớ của các bộ nhớ đệm dùng chung và của từng phiên, giải phóng khi vượt ngân sách.
+
+    Mỗi bộ nhớ đệm được đăng ký bằng `register_cache(tên, provider)`, với provider() trả về các đối tượng có
+    memory_entries() (danh sách (khóa, giá trị), cũ nhất trước) và evict(khóa). Phiên báo cáo qua touch_session()
+    kèm các mục nó đang dùng (`pins`, ví dụ file đã tải lên). enforce() giải phóng theo thứ tự: mục chỉ phiên rỗi
+    dùng, mục lớn hơn `max_entry_fraction` ngân sách, rồi mục ít dùng gần đây nhất của bộ nhớ đệm lớn nhất
+    (mục phiên đang dùng để sau cùng).
+    """
+
+    def __init__(self, max_bytes, session_idle_seconds=1800, max_entry_fraction=0.25, check_interval=5.0):
+        self.max_bytes = max_bytes
+        self.session_idle_seconds = session_idle_seconds
+        self.max_entry_fraction = max_entry_fraction
+        self.check_interval = check_interval
+        self.evictions = 0
+        self._caches = {}
+        self._sessions = {}  # session_id -> {'user', 'last_seen', 'state_bytes', 'pins'}
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def register_cache(self, name, provider):
+        self._caches[name] = provider
+
+    def touch_session(self, session_id, user=None, state_bytes=0, pins=()):
+        """Ghi nhận phiên vừa hoạt động; `pins` là các (tên bộ nhớ đệm, khóa) phiên đang dùng."""
+        with self._lock:
+            self._sessions[session_id] = {'user': user, 'last_seen': time.time(),
+                                          'state_bytes': state_bytes, 'pins': set(pins)}
+
+    def _entries(self):
+        """[(tên bộ nhớ đệm, đối tượng, khóa, số byte)] theo thứ tự cũ nhất trước trong từng bộ nhớ đệm."""
+        entries = []
+        for name, provider in self._caches.items():
+            for cache in provider():
+                entries.extend((name, cache, key, deep_nbytes(value)) for key, value in cache.memory_entries())
+        return entries
+
+    def usage(self):
+        """Tổng quan: byte theo bộ nhớ đệm, theo phiên, tổng đang theo dõi, ngân sách và RSS của tiến trình."""
+        entries = self._entries()
+        sizes = {(name, key): nbytes for name, _, key, nbytes in entries}
+        caches = {}
+        for name, _, _, nbytes in entries:
+            caches[name] = caches.get(name, 0) + nbytes
+        now = time.time()
+        with self._lock:
+            sessions = [{'session': session_id, 'user': info['user'], 'idle_seconds': now - info['last_seen'],
+                         'state_bytes': info['state_bytes'],
+                         'pinned_bytes': sum(sizes.get(pin, 0) for pin in info['pins'])}
+                        for session_id, info in self._sessions.items()]
+        return {'caches': caches, 'sessions': sessions, 'budget': self.max_bytes, 'rss': process_rss(),
+                'total': sum(caches.values()) + sum(s['state_bytes'] for s in sessions), 'evictions': self.evictions}
+
+    def enforce(self, force=False):
+        """Bỏ phiên rỗi và giải phóng mục đệm cho tới khi tổng nằm trong ngân sách; trả về số byte đã giải phóng."""
+        now = time.time()
+        with self._lock:
+            if not force and now - self._last_check < self.check_interval:
+                return 0
+            self._last_check = now
+            released = set()
+            for session_id in [s for s, info in self._sessions.items() if now - info['last_seen'] > self.session_idle_seconds]:
+                released |= self._sessions.pop(session_id)['pins']
+            pinned = set().union(*(info['pins'] for info in self._sessions.values())) if self._sessions else set()
+            released -= pinned
+            session_bytes = sum(info['state_bytes'] for info in self._sessions.values())
+
+        entries = self._entries()
+        total = session_bytes + sum(nbytes for *_, nbytes in entries)
+        max_entry = self.max_bytes * self.max_entry_fraction
+        # Mục chỉ phiên rỗi dùng và mục quá lớn luôn bị bỏ, kể cả khi chưa vượt ngân sách
+        forced = [e for e in entries if (e[0], e[2]) in released or e[3] > max_entry]
+        # Bộ nhớ đệm lớn nhất được giải phóng trước, trong mỗi bộ nhớ đệm thì mục cũ nhất trước
+        cache_totals = {}
+        for name, _, _, nbytes in entries:
+            cache_totals[name] = cache_totals.get(name, 0) + nbytes
+        by_cache = sorted(entries, key=lambda e: -cache_totals[e[0]])
+        candidates = (forced + [e for e in by_cache if (e[0], e[2]) not in pinned]
+                      + [e for e in by_cache if (e[0], e[2]) in pinned])
+
+        forced_count = len(forced)
+        freed, seen = 0, set()
+        for position, (name, cache, key, nbytes) in enumerate(candidates):
+            if position >= forced_count and total - freed <= self.max_bytes:
+                break
+            if (name, id(cache), key) in seen:
+                continue
+            seen.add((name, id(cache), key))
+            cache.evict(key)
+            freed += nbytes
+            self.evictions += 1
+        if freed:
+            tracing.log_event("Memory budget enforced", logging.INFO, freed_bytes=freed, tracked_bytes=total,
+                              budget_bytes=self.max_bytes)
+        return freed
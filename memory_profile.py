@@ -0,0 +1,244 @@
+import json
+import os
+import sys
+import threading
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+import tracing
+from memory_budget import process_rss
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Chế độ đo bộ nhớ (tắt mặc định): bật bằng TIME_REPORT_MEMORY_PROFILE=<file JSON> hoặc tham số --memory-profile
+MEMORY_PROFILE = {
+    'output_path': os.environ.get('TIME_REPORT_MEMORY_PROFILE') or None,
+    'top_n': 10,             # Số vị trí cấp phát lớn nhất ghi cho mỗi span
+    # Độ sâu traceback tracemalloc lưu: sâu hơn thì dễ đi từ pandas/openpyxl ra tới code của repo, nhưng mỗi
+    # frame làm chậm thêm mọi lần cấp phát (xuất PDF tiêu chuẩn: chậm ~4 lần với 1 frame, ~9 lần với 4 frame)
+    'frames': int(os.environ.get('TIME_REPORT_MEMORY_FRAMES') or 4),
+    'sample_interval': 0.25, # Giây giữa hai lần lấy mẫu để chụp vị trí cấp phát gần đỉnh bộ nhớ
+    'min_bytes': 1024 * 1024, # Chỉ chụp vị trí cấp phát khi bộ nhớ tăng ít nhất chừng này (và 10%) so với lần chụp trước
+    'max_spans': 2000,       # Số span gần nhất giữ trong file (bảng theo bước vẫn tính mọi span)
+}
+
+def peak_rss():
+    """Đỉnh RSS của tiến trình từ lúc khởi động (byte), hoặc None nếu hệ điều hành không hỗ trợ."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+class MemoryProfiler:
+    """Đo bộ nhớ theo từng bước của quy trình báo cáo (mỗi tracing.span) bằng tracemalloc và RSS.
+
+    Với mỗi span: bộ nhớ Python đang cấp phát lúc bắt đầu/kết thúc và đỉnh trong lúc chạy (tracemalloc),
+    RSS lúc bắt đầu/kết thúc, và các vị trí cấp phát lớn nhất gom theo dòng code của repo gần nhất trong
+    traceback. Vị trí cấp phát được chụp bởi luồng lấy mẫu mỗi khi bộ nhớ vượt mức đã chụp (gần đỉnh), hoặc
+    lúc span kết thúc nếu span quá ngắn (span cấp phát dưới `min_bytes` không được chụp). Đỉnh là của cả
+    tiến trình, nên khi nhiều span chạy song song (xuất batch nhiều luồng) đỉnh của chúng tính chồng lên
+    nhau; dùng --max-workers 1 để tách bạch.
+    Kết quả được ghi ra `output_path` (JSON) mỗi khi một span gốc kết thúc và khi dừng.
+    """
+
+    def __init__(self, output_path=None, label=None, top_n=None, frames=None, sample_interval=None, max_spans=None,
+                 min_bytes=None):
+        self.output_path = output_path or MEMORY_PROFILE['output_path']
+        self.label = label
+        self.top_n = top_n or MEMORY_PROFILE['top_n']
+        self.frames = frames or MEMORY_PROFILE['frames']
+        self.sample_interval = MEMORY_PROFILE['sample_interval'] if sample_interval is None else sample_interval
+        self.max_spans = max_spans or MEMORY_PROFILE['max_spans']
+        self.min_bytes = MEMORY_PROFILE['min_bytes'] if min_bytes is None else min_bytes
+        self.active = False
+        self.started_at = None
+        self._open = {}     # span_id -> số đo của span đang chạy
+        self._spans = deque(maxlen=self.max_spans)
+        self._stages = {}   # (stage, operation) -> số đo gộp
+        self._overall = None
+        self._started_tracemalloc = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def start(self):
+        if self.active:
+            return self
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._started_tracemalloc = True
+        tracemalloc.reset_peak()
+        with self._lock:
+            self.started_at = datetime.now()
+            self._open, self._stages, self._overall = {}, {}, None
+            self._spans.clear()
+        self.active = True
+        tracing.add_span_hook(self)
+        if self.sample_interval:
+            self._stop.clear()
+            self._sampler = threading.Thread(target=self._sample_loop, name='memory-profiler', daemon=True)
+            self._sampler.start()
+        return self
+
+    def stop(self):
+        """Dừng đo, ghi file kết quả lần cuối; trả về True nếu ghi được."""
+        if not self.active:
+            return False
+        tracing.remove_span_hook(self)
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+        written = self.write()
+        self.active = False
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        return written
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # --- Đo theo span (gọi từ tracing) ---
+    def _fold_peak(self):
+        """Cộng đỉnh tracemalloc từ lần đặt lại trước vào mọi span đang chạy rồi đặt lại (phải giữ _lock)."""
+        current, peak = tracemalloc.get_traced_memory()
+        for frame in self._open.values():
+            frame['traced_peak'] = max(frame['traced_peak'], peak)
+        tracemalloc.reset_peak()
+        return current
+
+    def span_started(self, span):
+        rss = process_rss()
+        with self._lock:
+            current = self._fold_peak()
+            self._open[span['span_id']] = {
+                **span, 'started': datetime.now().isoformat(timespec='milliseconds'),
+                'traced_start': current, 'traced_peak': current, 'rss_start': rss,
+                'top_allocations': None, 'top_captured': None, 'top_traced': 0}
+
+    def span_finished(self, span, seconds, status):
+        rss = process_rss()
+        with self._lock:
+            current = self._fold_peak()
+            frame = self._open.pop(span['span_id'], None)
+        if frame is None:
+            return
+        if frame['top_allocations'] is None and frame['traced_peak'] - frame['traced_start'] >= self.min_bytes:
+            frame['top_allocations'], frame['top_captured'] = self._top_allocations(), 'end'
+        frame.pop('top_traced')
+        frame.update(seconds=round(seconds, 4), status=status, traced_end=current, rss_end=rss)
+        with self._lock:
+            self._spans.append(frame)
+            stage = self._stages.setdefault((frame['stage'], frame['operation']), {
+                'stage': frame['stage'], 'operation': frame['operation'], 'count': 0, 'seconds': 0.0,
+                'traced_peak': 0, 'traced_growth': 0, 'rss_peak': 0, 'rss_growth': 0})
+            stage['count'] += 1
+            stage['seconds'] = round(stage['seconds'] + seconds, 4)
+            stage['traced_peak'] = max(stage['traced_peak'], frame['traced_peak'])
+            stage['traced_growth'] = max(stage['traced_growth'], frame['traced_peak'] - frame['traced_start'])
+            stage['rss_peak'] = max(stage['rss_peak'], rss, frame['rss_start'])
+            stage['rss_growth'] = max(stage['rss_growth'], rss - frame['rss_start'])
+        if frame['parent_id'] is None:
+            self.write()
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.sample_interval):
+            current, _ = tracemalloc.get_traced_memory()
+            with self._lock:
+                targets = [f for f in self._open.values() if self._grown(current, max(f['top_traced'], f['traced_start']))]
+                new_overall = self._overall is None or self._grown(current, self._overall['traced'])
+            if not targets and not new_overall:
+                continue
+            top = self._top_allocations()
+            with self._lock:
+                for frame in targets:
+                    if frame['span_id'] in self._open:
+                        frame.update(top_allocations=top, top_captured='peak', top_traced=current)
+                if new_overall:
+                    self._overall = {'traced': current, 'time': datetime.now().isoformat(timespec='milliseconds'),
+                                     'spans': [f"{f['stage']}:{f['operation']}" for f in self._open.values()],
+                                     'top_allocations': top}
+
+    def _grown(self, current, previous):
+        return current - previous >= max(self.min_bytes, previous * 0.1)
+
+    def _top_allocations(self):
+        """Các vị trí cấp phát lớn nhất hiện tại, gom theo dòng code của repo gần nhất trong traceback."""
+        if not tracemalloc.is_tracing():
+            return []
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+        sites = {}
+        for stat in snapshot.statistics('traceback'):
+            frames = stat.traceback  # tracemalloc: frame cũ nhất trước, frame cấp phát ở cuối
+            own = next((f for f in reversed(frames) if f.filename.startswith(SCRIPT_DIR)), frames[-1])
+            key = (own.filename, own.lineno)
+            site = sites.get(key)
+            if site is None:
+                site = sites[key] = {'file': os.path.relpath(own.filename, SCRIPT_DIR) if own.filename.startswith(SCRIPT_DIR) else own.filename,
+                                     'line': own.lineno, 'size': 0, 'count': 0,
+                                     'allocated_in': f"{frames[-1].filename}:{frames[-1].lineno}"}
+            site['size'] += stat.size
+            site['count'] += stat.count
+        return sorted(sites.values(), key=lambda s: -s['size'])[:self.top_n]
+
+    # --- Kết quả ---
+    def stage_summary(self):
+        """Số đo gộp theo bước (stage, operation), bước có đỉnh tracemalloc lớn nhất trước."""
+        with self._lock:
+            return sorted((dict(s) for s in self._stages.values()), key=lambda s: -s['traced_peak'])
+
+    def report(self):
+        with self._lock:
+            spans = list(self._spans)
+            overall = self._overall
+        current, _ = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        return {
+            'label': self.label, 'pid': os.getpid(),
+            'started': self.started_at.isoformat(timespec='seconds') if self.started_at else None,
+            'written': datetime.now().isoformat(timespec='seconds'),
+            'tracemalloc_frames': self.frames, 'traced_current': current,
+            'rss': process_rss(), 'peak_rss': peak_rss(),
+            'stages': self.stage_summary(), 'peak_allocations': overall, 'spans': spans,
+        }
+
+    def write(self, path=None):
+        """Ghi kết quả ra file JSON (ghi file tạm rồi đổi tên); trả về True/False."""
+        path = path or self.output_path
+        if not path:
+            return False
+        try:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.report(), f, ensure_ascii=False, indent=1, default=str)
+            os.replace(tmp_path, path)
+            return True
+        except Exception as e:
+            print(f"Lỗi khi ghi file đo bộ nhớ {path}: {e}")
+            return False
+
+@contextmanager
+def profiling(output_path=None, label=None):
+    """Đo bộ nhớ trong khối lệnh nếu có `output_path` (hoặc TIME_REPORT_MEMORY_PROFILE); không thì không làm gì."""
+    output_path = output_path or MEMORY_PROFILE['output_path']
+    if not output_path:
+        yield None
+        return
+    profiler = MemoryProfiler(output_path, label).start()
+    try:
+        yield profiler
+    finally:
+        if profiler.stop():
+            print(f"Memory profile: {output_path}")
@@ -0,0 +1,120 @@
+import logging
+import tempfile
+import zlib
+
+import fpdf
+from fpdf import FPDF
+
+import tracing
+
+# Ghi đè nội bộ của PyFPDF 1.7.x (gói `fpdf`, ghim fpdf==1.7.2 trong requirements.txt); với phiên bản khác
+# (ví dụ fpdf2) lớp này hoạt động như FPDF thường và cảnh báo mỗi khi tạo PDF.
+STREAMING_SUPPORTED = fpdf.__version__.startswith('1.') and hasattr(FPDF, '_putpages')
+
+class _Spool:
+    """File tạm chứa dữ liệu ảnh/trang đã hoàn tất, đọc lại theo offset khi ghi PDF."""
+
+    def __init__(self, spool_dir=None):
+        self.file = tempfile.TemporaryFile(dir=spool_dir)
+
+    def put(self, data):
+        self.file.seek(0, 2)
+        offset = self.file.tell()
+        self.file.write(data)
+        return offset, len(data)
+
+    def get(self, ref):
+        offset, length = ref
+        self.file.seek(offset)
+        return self.file.read(length)
+
+    def close(self):
+        self.file.close()
+
+class _SpooledPages(dict):
+    """dict số trang -> nội dung; trang đã đóng được nén và chuyển xuống file tạm."""
+
+    def __init__(self, spool):
+        super().__init__()
+        self.spool = spool
+        self.refs = {}
+
+    def spool_page(self, n):
+        self.refs[n] = self.spool.put(zlib.compress(super().__getitem__(n).encode('latin1')))
+        super().__setitem__(n, None)
+
+    def __getitem__(self, n):
+        if n in self.refs:
+            return zlib.decompress(self.spool.get(self.refs[n])).decode('latin1')
+        return super().__getitem__(n)
+
+class _FileBuffer:
+    """Thay thế chuỗi `buffer` của FPDF: ghi thẳng ra file, len() trả về số byte đã ghi (dùng cho xref)."""
+
+    def __init__(self, f):
+        self.f = f
+        self.size = 0
+
+    def __iadd__(self, s):
+        data = s.encode('latin1')
+        self.f.write(data)
+        self.size += len(data)
+        return self
+
+    def __len__(self):
+        return self.size
+
+class StreamingFPDF(FPDF):
+    """FPDF với bộ nhớ gần như không đổi theo số trang.
+
+    Mỗi trang khi đóng được nén xuống file tạm, dữ liệu ảnh được chuyển xuống file tạm ngay khi nhúng
+    (nên có thể xóa file PNG ngay sau đó), và khi output() PDF được ghi thẳng ra đĩa thay vì dựng
+    toàn bộ trong bộ nhớ. `on_page_end(page_number)` được gọi mỗi khi một trang hoàn tất.
+    """
+
+    def __init__(self, *args, spool_dir=None, on_page_end=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_page_end = on_page_end
+        self.streaming = STREAMING_SUPPORTED
+        if self.streaming:
+            self._spool = _Spool(spool_dir)
+            self.pages = _SpooledPages(self._spool)
+        else:
+            tracing.log_event("PDF streaming unavailable; the whole document is built in memory", logging.WARNING,
+                              fpdf_version=getattr(fpdf, '__version__', None), required='fpdf==1.7.2')
+
+    def image(self, name, *args, **kwargs):
+        is_new = name not in self.images
+        result = super().image(name, *args, **kwargs)
+        if self.streaming and is_new:
+            info = self.images[name]
+            for key in ('data', 'smask'):
+                if isinstance(info.get(key), (bytes, str)):
+                    data = info.pop(key)
+                    info[f'_spool_{key}'] = self._spool.put(data.encode('latin1') if isinstance(data, str) else data)
+        return result
+
+    def _endpage(self):
+        super()._endpage()
+        if self.streaming and self.pages.get(self.page) is not None:
+            self.pages.spool_page(self.page)
+        if self.on_page_end:
+            self.on_page_end(self.page)
+
+    def _putimage(self, info):
+        if self.streaming:
+            for key in ('data', 'smask'):
+                if f'_spool_{key}' in info:
+                    info[key] = self._spool.get(info.pop(f'_spool_{key}'))
+        super()._putimage(info)
+
+    def output(self, name='', dest=''):
+        if not self.streaming or dest.upper() != 'F' or not name:
+            return super().output(name, dest)
+        try:
+            with open(name, 'wb') as f:
+                self.buffer = _FileBuffer(f)
+                self.close()
+        finally:
+            self._spool.close()
+        return ''
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Các module của repo nằm phẳng ở thư mục gốc (không đóng gói), nên thêm thư mục gốc vào sys.path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
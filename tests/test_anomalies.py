@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import a04ecaf1_1dae_4c90_8081_086cd7c7b725 as core
+
+HOURS_CYCLE = [7.0, 7.5, 8.0, 8.5, 9.0, 7.25, 7.75, 8.25, 8.75]
+
+def timesheet(weeks=4, employee='Alice', project='P1'):
+    """Mỗi ngày làm việc một dòng, giờ thay đổi theo chu kỳ (không trùng tuần, không ngoại lệ)."""
+    days = pd.bdate_range('2024-01-01', periods=5 * weeks)
+    return pd.DataFrame({
+        'Date': days, 'Employee': employee, 'Project name': project, 'Workcentre': 'WC1', 'Task': 'Design',
+        'Hours': [HOURS_CYCLE[i % len(HOURS_CYCLE)] for i in range(len(days))],
+    })
+
+def add_rows(df, **row):
+    base = {'Employee': 'Alice', 'Project name': 'P1', 'Workcentre': 'WC1', 'Task': 'Design'}
+    return pd.concat([df, pd.DataFrame([{**base, **row, 'Date': pd.Timestamp(row['Date'])}])], ignore_index=True)
+
+def rules(anomalies):
+    return set(anomalies['Rule'])
+
+def test_clean_timesheet_has_no_anomalies():
+    anomalies = core.detect_anomalies(timesheet())
+    assert anomalies.empty
+    assert list(anomalies.columns) == core.ANOMALY_COLUMNS
+
+def test_empty_input():
+    anomalies = core.detect_anomalies(timesheet().iloc[:0])
+    assert anomalies.empty
+    assert list(anomalies.columns) == core.ANOMALY_COLUMNS
+
+@pytest.mark.parametrize('extra, rule', [(12.0, 'daily_over_limit'), (17.0, 'daily_impossible')])
+def test_daily_limits(extra, rule):
+    df = add_rows(timesheet(), Date='2024-01-03', Task='Review', Hours=extra)
+    found = core.detect_anomalies(df)
+    hit = found[found['Rule'] == rule]
+    assert len(hit) == 1
+    assert hit['Employee'].iloc[0] == 'Alice'
+    assert hit['Date'].iloc[0] == pd.Timestamp('2024-01-03')
+    assert hit['Hours'].iloc[0] == pytest.approx(8.0 + extra)
+
+def test_duplicate_entry():
+    df = timesheet()
+    df = pd.concat([df, df.iloc[[2]]], ignore_index=True)
+    found = core.detect_anomalies(df)
+    hit = found[found['Rule'] == 'duplicate_entry']
+    assert len(hit) == 2
+    assert set(hit['Date']) == {df['Date'].iloc[2]}
+
+def test_copied_week():
+    df = timesheet()
+    copy = df.iloc[5:10].assign(Date=df['Date'].iloc[5:10] + pd.Timedelta(days=28))
+    found = core.detect_anomalies(pd.concat([df, copy], ignore_index=True))
+    hit = found[found['Rule'] == 'duplicate_week']
+    assert set(hit['Date']) == {pd.Timestamp('2024-01-08'), pd.Timestamp('2024-02-05')}
+
+def test_hours_after_project_closed():
+    closed = pd.DataFrame({'Project Name': ['P1'], 'Include': ['yes'], 'Closed Date': [pd.Timestamp('2024-01-24')]})
+    found = core.detect_anomalies(timesheet(), closed)
+    hit = found[found['Rule'] == 'closed_project']
+    assert len(hit) == 2
+    assert (hit['Date'] > pd.Timestamp('2024-01-24')).all()
+    assert hit['Severity'].eq('high').all()
+
+def test_statistical_outlier():
+    df = timesheet()
+    df.loc[7, 'Hours'] = 15.5
+    found = core.detect_anomalies(df)
+    hit = found[found['Rule'] == 'outlier_employee_day']
+    assert list(hit['Date']) == [df['Date'].iloc[7]]
+    assert hit['Score'].iloc[0] > core.ANOMALY_THRESHOLDS['zscore']
+    assert 'outlier_project_day' in rules(found)
+
+def test_blank_employee_and_project_are_their_own_group():
+    df = timesheet()
+    df = add_rows(df, Date='2024-01-10', Employee=np.nan, Hours=13.0)
+    df = add_rows(df, Date='2024-01-10', Employee=np.nan, Task='Review', Hours=13.0)
+    df.loc[df.index[-1], 'Project name'] = np.nan
+    found = core.detect_anomalies(df)
+    hit = found[found['Rule'] == 'daily_impossible']
+    assert len(hit) == 1
+    assert hit['Employee'].isna().all()
+    assert hit['Hours'].iloc[0] == pytest.approx(26.0)
+    # Nhân viên có tên không bị gộp với dòng trống
+    assert 'Alice' not in set(found.loc[found['Rule'].str.startswith('daily'), 'Employee'])
+
+def test_thresholds_override():
+    found = core.detect_anomalies(timesheet(), thresholds={'max_daily_hours': 8.9})
+    hit = found[found['Rule'] == 'daily_over_limit']
+    assert len(hit) == 2
+    assert (hit['Hours'] == 9.0).all()
+
+def test_results_sorted_by_severity():
+    df = add_rows(timesheet(), Date='2024-01-03', Task='Review', Hours=17.0)
+    df.loc[12, 'Hours'] = 15.5
+    severity = core.detect_anomalies(df)['Severity'].map({'high': 0, 'medium': 1, 'low': 2})
+    assert severity.is_monotonic_increasing
+
+def test_mix64_is_deterministic_and_spreads_small_keys():
+    values = np.arange(10_000)
+    mixed = core._mix64(values)
+    assert mixed.dtype == np.uint64
+    assert len(np.unique(mixed)) == len(values)
+    np.testing.assert_array_equal(mixed, core._mix64(values.copy()))
+
+def test_project_listed_twice_uses_earliest_closed_date():
+    closed = pd.DataFrame({'Project Name': ['P1', 'P1', 'P2'], 'Include': ['yes', 'yes', 'yes'],
+                           'Closed Date': pd.to_datetime(['2024-01-26', '2024-01-24', None])})
+    found = core.detect_anomalies(timesheet(), closed)
+    hit = found[found['Rule'] == 'closed_project']
+    assert len(hit) == 2
+    assert hit['Detail'].str.endswith('2024-01-24').all()
@@ -0,0 +1,57 @@
+import pandas as pd
+import pytest
+
+import a04ecaf1_1dae_4c90_8081_086cd7c7b725 as core
+
+def entries(project, start, weeks, hours_per_day=8.0):
+    days = pd.bdate_range(start, periods=5 * weeks)
+    return pd.DataFrame({'Date': days, 'Project name': project, 'Hours': hours_per_day})
+
+@pytest.fixture
+def hours():
+    # P1: 2 tuần x 40h, P2: 2 tuần x 40h, P3 (không có ngân sách)
+    return pd.concat([entries('P1', '2024-01-01', 2), entries('P2', '2024-01-01', 2), entries('P3', '2024-01-01', 1)],
+                     ignore_index=True)
+
+def test_burn_and_forecast(hours):
+    budget = pd.DataFrame({'Project Name': ['P1', 'P2'], 'Budget Hours': [100.0, 50.0]})
+    result = core.build_budget_burn(hours, budget, alpha=0.5)
+    summary = result['summary'].set_index('Project name')
+    assert set(summary.index) == {'P1', 'P2'}
+
+    p1 = summary.loc['P1']
+    assert p1['Burned Hours'] == 80
+    assert p1['Remaining Hours'] == 20
+    assert p1['Weekly Rate'] == pytest.approx(40)
+    assert p1['Weeks Remaining'] == pytest.approx(0.5)
+    assert p1['Forecast Completion'] == pd.Timestamp('2024-01-11')
+    assert p1['Status'] == 'On track'
+
+    p2 = summary.loc['P2']
+    assert p2['Burn %'] == pytest.approx(160)
+    assert p2['Status'] == 'Over budget'
+    # Dự án đã vượt ngân sách: ngày dự báo là tuần lũy kế chạm ngân sách
+    assert p2['Forecast Completion'] == pd.Timestamp('2024-01-08')
+    # Sắp xếp theo % đã dùng giảm dần
+    assert list(result['summary']['Project name']) == ['P2', 'P1']
+
+def test_weekly_series_is_cumulative_and_fills_gaps():
+    df = pd.concat([entries('P1', '2024-01-01', 1), entries('P1', '2024-01-15', 1)], ignore_index=True)
+    budget = pd.DataFrame({'Project Name': ['P1'], 'Budget Hours': [200.0]})
+    weekly = core.build_budget_burn(df, budget)['weekly']
+    assert list(weekly['Week Start']) == list(pd.date_range('2024-01-01', periods=3, freq='7D'))
+    assert list(weekly['Hours']) == [40, 0, 40]
+    assert list(weekly['Cumulative Hours']) == [40, 40, 80]
+    assert list(weekly['Burn %']) == [20, 20, 40]
+
+def test_deadline_marks_late_projects(hours):
+    budget = pd.DataFrame({'Project Name': ['P1'], 'Budget Hours': [1000.0], 'Deadline': [pd.Timestamp('2024-02-01')]})
+    summary = core.build_budget_burn(hours, budget)['summary']
+    assert summary['Status'].iloc[0] == 'Late'
+    assert summary['Forecast Completion'].iloc[0] > pd.Timestamp('2024-02-01')
+
+def test_no_budget_or_no_matching_projects(hours):
+    assert core.build_budget_burn(hours, None) == {}
+    assert core.build_budget_burn(hours, pd.DataFrame(columns=core.BUDGET_COLUMNS)) == {}
+    assert core.build_budget_burn(hours, pd.DataFrame({'Project Name': ['X'], 'Budget Hours': [10.0]})) == {}
+    assert core.build_budget_burn(hours.iloc[:0], pd.DataFrame({'Project Name': ['P1'], 'Budget Hours': [10.0]})) == {}
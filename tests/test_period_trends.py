@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import a04ecaf1_1dae_4c90_8081_086cd7c7b725 as core
+
+def monthly(project, hours_by_month):
+    return pd.DataFrame({'Date': pd.to_datetime(list(hours_by_month)), 'Project name': project,
+                         'Hours': list(hours_by_month.values())})
+
+def test_monthly_deltas_and_rolling_means():
+    df = pd.concat([
+        monthly('P1', {'2023-01-10': 10, '2023-02-10': 20, '2023-04-10': 40, '2024-01-10': 15}),
+        monthly('P2', {'2023-02-15': 5}),
+    ], ignore_index=True)
+    trends = core.build_period_trends(df, windows=(3,))
+    p1 = trends[trends['Project name'] == 'P1'].set_index('Period')
+    # Kỳ liên tục từ kỳ đầu đến kỳ cuối, tháng trống = 0
+    assert list(p1.index) == [str(p) for p in pd.period_range('2023-01', '2024-01', freq='M')]
+    assert p1.loc['2023-03', 'Hours'] == 0
+    assert p1.loc['2023-02', 'Delta Prev'] == 10
+    assert p1.loc['2023-02', 'Delta Prev %'] == pytest.approx(100)
+    assert np.isnan(p1.loc['2023-04', 'Delta Prev %'])  # kỳ trước bằng 0
+    assert np.isnan(p1.loc['2023-01', 'Delta Prev'])
+    assert p1.loc['2024-01', 'Delta YoY'] == 5
+    assert p1.loc['2024-01', 'Delta YoY %'] == pytest.approx(50)
+    assert np.isnan(p1.loc['2023-02', 'Rolling Mean 3'])
+    assert p1.loc['2023-04', 'Rolling Mean 3'] == pytest.approx(20)
+    assert trends.loc[trends['Project name'] == 'P2', 'Hours'].sum() == 5
+
+def test_weekly_year_over_year_uses_iso_weeks():
+    # 2026 có 53 tuần ISO: lùi 52 tuần cố định sẽ so 2027-W01 với 2026-W02
+    days = pd.date_range('2025-12-29', '2028-01-02', freq='7D')  # thứ Hai của 2026-W01 .. 2027-W52
+    df = pd.DataFrame({'Date': days, 'Project name': 'P1', 'Hours': np.arange(len(days), dtype=float)})
+    trends = core.build_period_trends(df, period='week').set_index('Period')
+    assert trends.loc['2026-W53', 'Hours'] == 52
+    assert trends.loc['2027-W01', 'Delta YoY'] == trends.loc['2027-W01', 'Hours'] - trends.loc['2026-W01', 'Hours']
+    assert trends.loc['2027-W52', 'Delta YoY'] == trends.loc['2027-W52', 'Hours'] - trends.loc['2026-W52', 'Hours']
+    assert trends.loc['2026-W53', 'Delta YoY'] != trends.loc['2026-W53', 'Delta YoY']  # NaN: 2025 không có W53
+    assert trends.loc[trends.index.str.startswith('2026'), 'Delta YoY'].isna().all()
+
+def test_empty_and_invalid_period():
+    empty = core.build_period_trends(pd.DataFrame(columns=['Date', 'Project name', 'Hours']))
+    assert empty.empty
+    assert list(empty.columns) == ['Project name', 'Period', 'Period Start', 'Hours']
+    with pytest.raises(ValueError):
+        core.build_period_trends(monthly('P1', {'2024-01-01': 1}), period='quarter')
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import a04ecaf1_1dae_4c90_8081_086cd7c7b725 as core
+
+def rates(*rows):
+    df = pd.DataFrame(rows, columns=core.RATE_COLUMNS)
+    df['Effective From'] = pd.to_datetime(df['Effective From'])
+    return df
+
+@pytest.fixture
+def hours():
+    # Không sắp theo ngày: kết quả phải giữ nguyên thứ tự dòng
+    return pd.DataFrame({
+        'Date': pd.to_datetime(['2024-03-20', '2024-03-01', '2024-03-14', '2024-03-15', '2024-02-01', '2024-03-10']),
+        'Employee': ['Alice', 'Alice', 'Alice', 'Alice', 'Alice', 'Bob'],
+        'Workcentre': ['WC1', 'WC1', 'WC1', 'WC1', 'WC1', 'WC2'],
+        'Hours': [2.0, 1.0, 1.0, 1.0, 3.0, 4.0],
+    })
+
+def test_rate_change_applies_from_effective_date(hours):
+    rated = core.apply_rates(hours, rates(('Alice', None, '2024-03-01', 50.0), ('Alice', None, '2024-03-15', 60.0)))
+    np.testing.assert_array_equal(rated['Rate'].to_numpy(), [60, 50, 50, 60, np.nan, np.nan])
+    np.testing.assert_array_equal(rated['Cost'].to_numpy(), [120, 50, 50, 60, np.nan, np.nan])
+    assert list(rated.index) == list(hours.index)
+    assert 'Rate' not in hours.columns
+
+def test_employee_then_workcentre_then_default(hours):
+    table = rates(('Alice', None, '2024-03-01', 50.0), (None, 'WC2', '2024-01-01', 40.0), (None, None, '2024-01-01', 30.0))
+    rated = core.apply_rates(hours, table)
+    np.testing.assert_array_equal(rated['Rate'].to_numpy(), [50, 50, 50, 50, 30, 40])
+
+def test_unknown_employee_rates_are_ignored(hours):
+    rated = core.apply_rates(hours, rates(('Carol', None, '2024-01-01', 99.0), (None, 'WC1', '2024-01-01', 20.0)))
+    np.testing.assert_array_equal(rated['Rate'].to_numpy(), [20, 20, 20, 20, 20, np.nan])
+
+def test_no_rate_table_returns_input(hours):
+    assert core.apply_rates(hours, None) is hours
+    assert core.apply_rates(hours, pd.DataFrame(columns=core.RATE_COLUMNS)) is hours
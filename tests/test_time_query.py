@@ -0,0 +1,80 @@
+import pandas as pd
+import pytest
+
+import a04ecaf1_1dae_4c90_8081_086cd7c7b725 as core
+
+@pytest.fixture
+def df():
+    raw = pd.DataFrame({
+        'Date': ['2024-01-02', '2024-01-03', '2024-02-05', '2024-04-01', '2024-04-02', '2023-12-29'],
+        'Team member': ['Alice', 'Bob', 'Alice', 'Carol', 'Bob', 'Alice'],
+        'Project Name': ['X', 'X', 'Y', 'Y', 'Z', 'X'],
+        'Workcentre': ['WC1', 'WC2', 'WC1', 'WC2', 'WC1', 'WC1'],
+        'Task': ['Design', 'Build', 'Design', 'Test', 'Build', 'Design'],
+        'Hours': [8, 4, 6, 2, 5, 3],
+    })
+    return core.normalize_raw_data(raw)
+
+def test_query_matches_groupby(df):
+    engine = core.TimeQuery(df)
+    result = engine.query(['project', 'workcentre'], measures=['hours', 'entries', 'employees'])
+    expected = df.groupby(['Project name', 'Workcentre']).agg(
+        Hours=('Hours', 'sum'), Entries=('Hours', 'size'), Employees=('Employee', 'nunique')).reset_index()
+    pd.testing.assert_frame_equal(result, expected)
+
+def test_filters_and_periods(df):
+    engine = core.TimeQuery(df)
+    q1 = engine.query(['project'], filters={'workcentre': 'WC1'}, period='2024-Q1')
+    assert dict(zip(q1['Project name'], q1['Hours'])) == {'X': 8, 'Y': 6}
+    week = engine.query(period='2024-W01')
+    assert week['Hours'].iloc[0] == 12
+    days = engine.query(period=('2024-04-01', '2024-04-01'))
+    assert days['Hours'].iloc[0] == 2
+    months = engine.query(['month'], filters={'year': [2024]})
+    assert list(months['MonthName']) == ['January', 'February', 'April']
+
+def test_equivalent_queries_share_one_cache_entry(df):
+    engine = core.TimeQuery(df)
+    first = engine.query(['project'], filters={'employee': ['Bob', 'Alice'], 'task': []}, period='2024')
+    first.loc[0, 'Hours'] = -1  # Kết quả trả về là bản sao
+    second = engine.query(('project',), filters={'employee': ['Alice', 'Bob', 'Alice']}, period=' 2024 ')
+    assert engine.cache_info()['hits'] == 1
+    assert engine.cache_info()['misses'] == 1
+    assert second.loc[0, 'Hours'] != -1
+
+def test_lru_size_is_bounded(df):
+    engine = core.TimeQuery(df, maxsize=2)
+    for project in ('X', 'Y', 'Z'):
+        engine.query(filters={'project': project})
+    assert engine.cache_info()['size'] == 2
+    engine.query(filters={'project': 'X'})
+    assert engine.cache_info()['hits'] == 0
+
+def test_invalid_queries(df):
+    engine = core.TimeQuery(df)
+    with pytest.raises(ValueError):
+        engine.query(['colour'])
+    with pytest.raises(ValueError):
+        engine.query(measures=['overtime'])
+    with pytest.raises(ValueError):
+        engine.query(period='last tuesday')
+
+def test_preview_filters_search_and_pages(df):
+    engine = core.TimeQuery(df)
+    page = engine.preview(filters={'Workcentre': ['WC1']}, search='des', page_size=2)
+    assert page['total'] == 3 and page['pages'] == 2
+    # Ngày mới nhất trước
+    assert list(page['rows']['Date']) == [pd.Timestamp('2024-02-05'), pd.Timestamp('2024-01-02')]
+    last = engine.preview(filters={'Workcentre': ['WC1']}, search='des', page=5, page_size=2)
+    assert last['page'] == 2 and list(last['rows']['Date']) == [pd.Timestamp('2023-12-29')]
+    assert engine.preview_options('Project name') == ['X', 'Y', 'Z']
+
+def test_preview_positions_use_the_small_view_cache(df):
+    engine = core.TimeQuery(df, view_maxsize=2)
+    for search in ('a', 'b', 'c'):
+        engine.preview(search=search)
+    info = engine.cache_info()
+    assert info['size'] == 0
+    assert info['views'] == 2
+    engine.preview(search='c', page=2)
+    assert engine.cache_info()['hits'] == 1
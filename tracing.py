@@ -0,0 +1,278 @@
+"""Đo thời gian theo từng bước (span) của quy trình báo cáo: log JSON có cấu trúc và số liệu dạng Prometheus.
+
+    with tracing.span('report', kind='standard'):      # span gốc: mọi span con có cùng trace_id
+        with tracing.span('filter') as fields:
+            ...
+            fields['rows'] = len(df)                    # thêm trường vào bản ghi log của span
+
+    @tracing.traced('excel')                            # span quanh cả hàm (trả về False thì tính là lỗi)
+    def export_report(...): ...
+
+Mỗi span kết thúc ghi một dòng JSON (logger 'time_report') và cập nhật bộ đếm time_report_spans_total và
+histogram time_report_span_seconds theo nhãn stage/operation. Cấu hình qua biến môi trường:
+  TIME_REPORT_LOG_FILE      file JSON lines ('-' hoặc bỏ trống: stderr)
+  TIME_REPORT_LOG_LEVEL     INFO (mặc định, chỉ span) hoặc DEBUG (thêm các sự kiện chẩn đoán)
+  TIME_REPORT_METRICS_FILE  file Prometheus text, ghi lại sau mỗi span gốc (dùng với node_exporter textfile)
+  TIME_REPORT_METRICS_PORT  cổng HTTP cục bộ phục vụ /metrics (start_metrics_server)
+"""
+import atexit
+import contextvars
+import functools
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+TRACING = {
+    'log_file': os.environ.get('TIME_REPORT_LOG_FILE') or '-',
+    'log_level': os.environ.get('TIME_REPORT_LOG_LEVEL', 'INFO').upper(),
+    'metrics_file': os.environ.get('TIME_REPORT_METRICS_FILE') or None,
+    'metrics_port': int(os.environ.get('TIME_REPORT_METRICS_PORT') or 0) or None,
+    'metrics_host': os.environ.get('TIME_REPORT_METRICS_HOST', '127.0.0.1'),
+}
+
+# Mốc histogram (giây): từ thao tác lọc vài ms tới xuất PDF lớn vài phút
+HISTOGRAM_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+logger = logging.getLogger('time_report')
+
+_current_span = contextvars.ContextVar('time_report_span', default=None)
+_span_ids = itertools.count(1)
+_configure_lock = threading.Lock()
+_configured = False
+
+class JsonFormatter(logging.Formatter):
+    """Mỗi bản ghi là một dòng JSON: ts, level, message cùng các trường có cấu trúc (record.fields)."""
+
+    def format(self, record):
+        entry = {'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+                 'level': record.levelname, 'message': record.getMessage()}
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def configure_logging(log_file=None, level=None):
+    """Gắn handler JSON cho logger 'time_report' (một lần cho mỗi tiến trình, trừ khi đã có handler)."""
+    global _configured
+    with _configure_lock:
+        if _configured:
+            return
+        _configured = True
+        log_file = log_file or TRACING['log_file']
+        logger.setLevel(level or TRACING['log_level'])
+        if not logger.handlers:
+            handler = logging.StreamHandler() if log_file == '-' else logging.FileHandler(log_file, encoding='utf-8')
+            handler.setFormatter(JsonFormatter())
+            logger.addHandler(handler)
+        logger.propagate = False
+
+def log_event(message, level=logging.DEBUG, **fields):
+    """Ghi một sự kiện có cấu trúc (mặc định mức DEBUG), kèm trace_id/span_id của span đang chạy nếu có."""
+    configure_logging()
+    if not logger.isEnabledFor(level):
+        return
+    current = _current_span.get()
+    if current is not None:
+        fields = {'trace_id': current['trace_id'], 'span_id': current['span_id'], **fields}
+    logger.log(level, message, extra={'fields': fields})
+
+class Metrics:
+    """Bộ đếm và histogram trong bộ nhớ (an toàn giữa các luồng), xuất ra định dạng text của Prometheus."""
+
+    def __init__(self, buckets=HISTOGRAM_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counters = {}    # (tên, nhãn) -> giá trị
+        self._histograms = {}  # (tên, nhãn) -> [số đếm theo mốc, tổng, số lần]
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ''
+        escape = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in pairs) + '}'
+
+    def render(self):
+        """Toàn bộ số liệu theo định dạng text exposition 0.0.4 của Prometheus."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, ([*h[0]], h[1], h[2])) for key, h in self._histograms.items())
+        lines, seen = [], set()
+        for (name, labels), value in counters:
+            if name not in seen:
+                seen.add(name)
+                lines += [f"# HELP {name} {self._help.get(name, name)}", f"# TYPE {name} counter"]
+            lines.append(f"{name}{self._labels(labels)} {value}")
+        for (name, labels), (counts, total, count) in histograms:
+            if name not in seen:
+                seen.add(name)
+                lines += [f"# HELP {name} {self._help.get(name, name)}", f"# TYPE {name} histogram"]
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f"{name}_bucket{self._labels(labels, [('le', repr(float(bound)))])} {bucket_count}")
+            lines.append(f"{name}_bucket{self._labels(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{self._labels(labels)} {total!r}")
+            lines.append(f"{name}_count{self._labels(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """Ghi file Prometheus text (ghi file tạm rồi đổi tên, nên trình thu thập không đọc phải file dở)."""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+metrics = Metrics()
+metrics.describe('time_report_spans_total', "Number of finished pipeline spans by stage, operation and status.")
+metrics.describe('time_report_span_seconds', "Duration of pipeline spans in seconds by stage and operation.")
+
+def write_metrics(path=None):
+    """Ghi số liệu ra file cấu hình (TIME_REPORT_METRICS_FILE) nếu có; lỗi ghi chỉ được báo, không dừng báo cáo."""
+    path = path or TRACING['metrics_file']
+    if not path:
+        return False
+    try:
+        metrics.write(path)
+        return True
+    except OSError as e:
+        print(f"Lỗi khi ghi file số liệu {path}: {e}")
+        return False
+
+if TRACING['metrics_file']:
+    atexit.register(write_metrics)
+
+_span_hooks = []
+
+def add_span_hook(hook):
+    """Đăng ký đối tượng có span_started(span) và span_finished(span, giây, trạng thái), gọi quanh mỗi span().
+
+    `span` là dict với span_id, trace_id, parent_id, stage, operation (ví dụ memory_profile.MemoryProfiler).
+    """
+    if hook not in _span_hooks:
+        _span_hooks.append(hook)
+
+def remove_span_hook(hook):
+    if hook in _span_hooks:
+        _span_hooks.remove(hook)
+
+def _call_hooks(method, *args):
+    for hook in list(_span_hooks):
+        try:
+            getattr(hook, method)(*args)
+        except Exception as e:
+            # Lỗi của công cụ đo không được làm hỏng báo cáo
+            print(f"Lỗi trong span hook {type(hook).__name__}.{method}: {e}")
+
+def _finish(stage, operation, seconds, status, trace_id, span_id, parent_id, fields):
+    metrics.inc('time_report_spans_total', stage=stage, operation=operation, status=status)
+    metrics.observe('time_report_span_seconds', seconds, stage=stage, operation=operation)
+    configure_logging()
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(f"{stage}:{operation}", extra={'fields': {
+            'event': 'span', 'stage': stage, 'operation': operation, 'status': status,
+            'duration_ms': round(seconds * 1000, 3), 'trace_id': trace_id, 'span_id': span_id,
+            'parent_id': parent_id, **fields}})
+
+def record_span(stage, seconds, operation=None, status='ok', **fields):
+    """Ghi nhận một bước đã đo sẵn thời gian (ví dụ trong luồng vẽ biểu đồ) như span con của span hiện tại."""
+    parent = _current_span.get()
+    _finish(stage, operation or stage, seconds, status, parent['trace_id'] if parent else None,
+            f"{os.getpid():x}-{next(_span_ids):x}", parent['span_id'] if parent else None, fields)
+
+@contextmanager
+def span(stage, operation=None, **fields):
+    """Đo một bước; trả về dict các trường để bổ sung (ví dụ số dòng) vào bản ghi khi span kết thúc.
+
+    Span ngoài cùng mở một trace mới; khi nó kết thúc, file số liệu (nếu cấu hình) được ghi lại.
+    """
+    parent = _current_span.get()
+    span_id = f"{os.getpid():x}-{next(_span_ids):x}"
+    current = {'span_id': span_id, 'trace_id': parent['trace_id'] if parent else span_id,
+               'parent_id': parent['span_id'] if parent else None, 'stage': stage, 'operation': operation or stage}
+    token = _current_span.set(current)
+    _call_hooks('span_started', current)
+    status = 'ok'
+    started = time.perf_counter()
+    try:
+        yield fields
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        _current_span.reset(token)
+        status = fields.pop('status', status)
+        _call_hooks('span_finished', current, seconds, status)
+        _finish(stage, operation or stage, seconds, status, current['trace_id'], span_id,
+                parent['span_id'] if parent else None, fields)
+        if parent is None:
+            write_metrics()
+
+def traced(stage, operation=None):
+    """Decorator: chạy cả hàm trong span(stage, tên hàm); hàm trả về False (quy ước của các hàm xuất) tính là lỗi."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage, operation or func.__name__) as fields:
+                result = func(*args, **kwargs)
+                if result is False:
+                    fields['status'] = 'error'
+                return result
+        return wrapper
+    return decorator
+
+def start_metrics_server(port=None, host=None):
+    """Phục vụ /metrics qua HTTP ở luồng nền; trả về server hoặc None nếu không cấu hình cổng/không mở được cổng."""
+    port = port or TRACING['metrics_port']
+    if not port:
+        return None
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = metrics.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Không ghi mỗi lần Prometheus thu thập
+
+    try:
+        server = ThreadingHTTPServer((host or TRACING['metrics_host'], port), MetricsHandler)
+    except OSError as e:
+        print(f"Lỗi khi mở cổng số liệu {port}: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    return server
@@ -0,0 +1,181 @@
+import hashlib
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import a04ecaf1_1dae_4c90_8081_086cd7c7b725 as core
+import tracing
+
+# Tiến độ (0..1) khi bắt đầu mỗi bước của read_uploaded_data
+UPLOAD_STAGES = {'queued': 0.0, 'starting': 0.05, 'reading': 0.1, 'checking': 0.7, 'normalising': 0.8, 'done': 1.0}
+
+def main(argv=None):
+    """Tiến trình con: python upload_worker.py <file vào> <tên file gốc> <số dòng tối đa> <file pickle ra>.
+
+    Mỗi bước được in ra stdout dạng 'stage\t<bước>', lỗi dạng 'error\t<thông báo>' (mã thoát 2).
+    """
+    input_path, filename, max_rows, output_path = (argv or sys.argv[1:])
+    report = lambda kind, value: print(f"{kind}\t{value}", flush=True)
+    try:
+        with open(input_path, 'rb') as f:
+            data = f.read()
+        df = core.read_uploaded_data(data, filename, int(max_rows) or None, lambda stage: report('stage', stage))
+        df.to_pickle(output_path)
+    except Exception as e:
+        report('error', str(e).replace('\n', ' '))
+        return 2
+    return 0
+
+class UploadJob:
+    """Trạng thái một lần xử lý file tải lên: stage/progress để hiển thị, result hoặc error khi xong."""
+
+    def __init__(self, key, filename):
+        self.key = key
+        self.filename = filename
+        self.stage = 'queued'
+        self.started = None
+        self.result = None
+        self.error = None
+        self._done = threading.Event()
+
+    @property
+    def progress(self):
+        return UPLOAD_STAGES.get(self.stage, 0.0)
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started if self.started else 0.0
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def _finish(self, result=None, error=None):
+        self.result, self.error = result, error
+        self.stage = 'done' if error is None else 'failed'
+        self._done.set()
+
+class UploadParser:
+    """Xử lý file tải lên ở tiến trình riêng (không giữ GIL của server nên không làm chậm phiên khác).
+
+    Mỗi file chạy trong một tiến trình con bị dừng hẳn nếu quá `timeout` giây; tối đa `max_workers` file cùng lúc.
+    Kết quả được nhớ (LRU `cache_size` file) theo SHA-256 của nội dung: tải lại cùng file trả kết quả ngay,
+    và hai phiên tải cùng file trong lúc đang xử lý dùng chung một job. `postprocess(df)` (tùy chọn) chạy ở
+    luồng nền sau khi đọc, ví dụ để thêm cột Cost, và kết quả của nó là thứ được nhớ.
+    """
+
+    def __init__(self, limits=None, max_workers=2, cache_size=8, spool_dir=None, postprocess=None):
+        self.limits = {**core.UPLOAD_LIMITS, **(limits or {})}
+        self.cache_size = cache_size
+        self.spool_dir = spool_dir
+        self.postprocess = postprocess
+        self._cache = OrderedDict()  # khóa -> DataFrame đã chuẩn hóa
+        self._jobs = {}              # khóa -> UploadJob đang chạy
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='upload-parser')
+
+    @staticmethod
+    def content_key(data):
+        return hashlib.sha256(data).hexdigest()
+
+    def cached(self, key):
+        """DataFrame đã xử lý của file có khóa `key`, hoặc None nếu không còn trong bộ nhớ đệm."""
+        with self._lock:
+            df = self._cache.get(key)
+            if df is not None:
+                self._cache.move_to_end(key)
+            return df
+
+    def memory_entries(self):
+        """Các file đã xử lý dạng (khóa, DataFrame), dùng ít gần đây nhất trước."""
+        with self._lock:
+            return list(self._cache.items())
+
+    def evict(self, key):
+        with self._lock:
+            self._cache.pop(key, None)
+
+    def submit(self, data, filename):
+        """Bắt đầu xử lý file (hoặc trả job đã xong nếu nội dung đã có trong bộ nhớ đệm)."""
+        key = self.content_key(data)
+        job = UploadJob(key, filename)
+        if len(data) > self.limits['max_bytes']:
+            job._finish(error=f"File lớn hơn {self.limits['max_bytes'] / 1024 / 1024:.1f} MB (giới hạn tải lên).")
+            return job
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                job._finish(result=self._cache[key])
+                return job
+            if key in self._jobs:
+                return self._jobs[key]
+            self._jobs[key] = job
+        self._executor.submit(self._run, job, data)
+        return job
+
+    def _run(self, job, data):
+        job.stage, job.started = 'starting', time.monotonic()
+        result, error = None, None
+        # Tiến trình con riêng (không dùng multiprocessing: Streamlit chạy script app như __main__,
+        # nên tiến trình 'spawn' sẽ chạy lại cả app); dữ liệu vào/ra qua file tạm
+        with tempfile.TemporaryDirectory(prefix='upload-', dir=self.spool_dir) as tmp_dir:
+            input_path, output_path = os.path.join(tmp_dir, 'input'), os.path.join(tmp_dir, 'result.pkl')
+            with open(input_path, 'wb') as f:
+                f.write(data)
+            errors = []
+            try:
+                process = subprocess.Popen(
+                    [sys.executable, os.path.abspath(__file__), input_path, job.filename, str(self.limits['max_rows'] or 0), output_path],
+                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, encoding='utf-8')
+            except OSError as e:
+                error = f"Không khởi động được tiến trình xử lý file: {e}"
+            else:
+                reader = threading.Thread(target=self._read_messages, args=(process, job, errors), daemon=True)
+                reader.start()
+                try:
+                    process.wait(timeout=self.limits['timeout'])
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                    process.wait()
+                    error = f"Xử lý file quá {self.limits['timeout']} giây (giới hạn tải lên)."
+                reader.join()
+                if error is None and (process.returncode != 0 or not os.path.exists(output_path)):
+                    error = errors[-1] if errors else f"Tiến trình xử lý file dừng bất thường (mã {process.returncode})."
+            if error is None:
+                try:
+                    result = pd.read_pickle(output_path)
+                    if self.postprocess is not None:
+                        result = self.postprocess(result)
+                except Exception as e:
+                    error = f"Lỗi khi đọc kết quả xử lý file {job.filename}: {e}"
+
+        with self._lock:
+            self._jobs.pop(job.key, None)
+            if result is not None:
+                self._cache[job.key] = result
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        tracing.record_span('load', job.elapsed, operation='upload', status='ok' if error is None else 'error',
+                            file=job.filename, rows=len(result) if result is not None else None)
+        job._finish(result, error)
+
+    @staticmethod
+    def _read_messages(process, job, errors):
+        for line in process.stdout:
+            kind, _, value = line.rstrip('\n').partition('\t')
+            if kind == 'stage':
+                job.stage = value
+            elif kind == 'error':
+                errors.append(value)
+
+if __name__ == '__main__':
+    sys.exit(main())